@@ -1,24 +1,163 @@
 # agent_logic.py
 
 import os
+import asyncio
 import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Tuple
 from dotenv import load_dotenv
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_google_genai import ChatGoogleGenerativeAI
 from config import settings # <<< Gunakan config terpusat
+from testcase_chunking import has_sections, merge_section_results, should_chunk, split_prd
+from testcase_sections import (
+    SectionResult, get_section_schema, get_section_store, make_section_hash, record_section_usage,
+    render_section_results
+)
+from token_counter import count_tokens
+from model_router import get_model_router, track_served_models
+from observability import LLM_SLOT_WAIT, llm_metrics_handler
 
-# Setup logging dasar (bisa dikonfigurasi lebih lanjut di main.py)
-logging.basicConfig(level=logging.INFO)
+# langchain.agents & langchain_google_genai (juga langchain_openai) berat diimpor (> 1 detik):
+# diimpor saat client/agent pertama kali dibuat, bukan saat modul diimpor.
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain_core.language_models import BaseChatModel
+
+# Logging dikonfigurasi oleh entry point (main.py / job_worker.py)
 logger = logging.getLogger(__name__)
 
 load_dotenv() # Load .env jika belum
 
+# Naikkan setiap kali prompt test case berubah agar cache hasil lama tidak dipakai
+PROMPT_VERSION = "2"
+
+# --- Registry Model Client ---
+# Satu client per (model, temperature), dibuat sekali lalu dipakai ulang antar request
+# sehingga channel gRPC ke Gemini tidak dibangun ulang setiap pemanggilan.
+# Retry bawaan SDK dikecilkan: retry, failover & hedging diatur model_router.
+_chat_models: Dict[Tuple[str, float], "BaseChatModel"] = {}
+_chat_models_lock = threading.Lock()
+
+OPENAI_PREFIX = "openai:"
+
+def get_chat_model(model: str, temperature: float) -> "BaseChatModel":
+    """
+    Mengambil (atau membuat sekali) client chat model untuk model & temperature tertentu.
+    Nama berawalan 'openai:' (misal 'openai:gpt-4o-mini') memakai langchain-openai, sisanya Gemini.
+    """
+    key = (model, temperature)
+    llm = _chat_models.get(key)
+    if llm is None:
+        with _chat_models_lock:
+            llm = _chat_models.get(key)
+            if llm is None:
+                logger.info(f"Membuat client model {model} (temperature={temperature})")
+                if model.startswith(OPENAI_PREFIX):
+                    from langchain_openai import ChatOpenAI
+                    llm = ChatOpenAI(
+                        model=model[len(OPENAI_PREFIX):],
+                        temperature=temperature,
+                        openai_api_key=settings.openai_api_key,
+                        max_retries=settings.model_client_max_retries,
+                        request_timeout=settings.model_timeout,
+                        callbacks=[llm_metrics_handler]
+                    )
+                else:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    llm = ChatGoogleGenerativeAI(
+                        model=model,
+                        temperature=temperature,
+                        google_api_key=settings.google_api_key,
+                        max_retries=settings.model_client_max_retries,
+                        timeout=settings.model_timeout,
+                        callbacks=[llm_metrics_handler] # Durasi & token per panggilan
+                    )
+                _chat_models[key] = llm
+    return llm
+
+# --- Admission Panggilan LLM ---
+# Batas panggilan model test case bersamaan per proses (termasuk fan-out chunked)
+# agar lonjakan job tidak langsung berubah menjadi 429 dari Gemini.
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+
+@asynccontextmanager
+async def llm_slot():
+    """Menunggu slot konkurensi LLM; waktu tunggunya dicatat di metrik."""
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(settings.llm_max_concurrency)
+    with LLM_SLOT_WAIT.time():
+        await _llm_semaphore.acquire()
+    try:
+        yield
+    finally:
+        _llm_semaphore.release()
+
+# --- Prompt Test Case ---
+def get_testcase_prompt(format: str) -> ChatPromptTemplate:
+    """Prompt pembuatan test case untuk format 'steps' (default) atau 'bdd'."""
+    if format.lower() == "bdd":
+        system_prompt = "Anda adalah QA Engineer BDD. Buat test case dalam format Gherkin (Feature, Scenario, Given, When, Then) berdasarkan PRD."
+        human_prompt_template = "PRD_CONTEXT:\n{context}\n\nBuat skenario BDD:"
+    else: # Default ke 'steps'
+        system_prompt = "Anda adalah QA Engineer senior. Buat test case detail (nama, deskripsi, prekondisi, langkah & hasil) berdasarkan PRD."
+        human_prompt_template = "PRD_CONTEXT:\n{context}\n\nBuat test case format langkah:"
+
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        ("human", human_prompt_template)
+    ])
+
+def get_testcase_chain(format: str, model: Optional[str] = None):
+    """Chain prompt | llm memakai client dari registry (default: model utama)."""
+    chain = get_testcase_prompt(format) | get_chat_model(model or settings.model, 0.1)
+    return chain.with_config(metadata={"format": format.lower()}) # Label format untuk metrik LLM
+
+def get_section_prompt(format: str) -> ChatPromptTemplate:
+    """Prompt output terstruktur untuk satu bagian PRD (skema dari testcase_sections)."""
+    if format.lower() == "bdd":
+        system_prompt = "Anda adalah QA Engineer BDD. Buat skenario Gherkin (Given, When, Then) khusus untuk bagian PRD yang diberikan."
+    else:
+        system_prompt = "Anda adalah QA Engineer senior. Buat test case detail (nama, deskripsi, prekondisi, langkah & hasil) khusus untuk bagian PRD yang diberikan."
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt + " Judul test case harus unik dan menyebut fitur yang diuji."),
+        ("human", "{context}")
+    ])
+
+def get_structured_chain(format: str, model: Optional[str] = None):
+    """Chain prompt | llm.with_structured_output(skema) -> objek pydantic per bagian PRD."""
+    llm = get_chat_model(model or settings.model, 0.1).with_structured_output(get_section_schema(format))
+    return (get_section_prompt(format) | llm).with_config(metadata={"format": format.lower()})
+
+# --- Ringkasan Memori Percakapan ---
+def get_summary_prompt() -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
+        ("system",
+         "Anda merangkum percakapan antara pengguna dan QA Agent pembuat test case. "
+         "Pertahankan inti PRD (fitur, aturan bisnis, batasan), format test case yang dipakai, "
+         "serta permintaan dan keputusan pengguna. Tulis ringkas dalam bahasa Indonesia."),
+        ("human", "RINGKASAN SEBELUMNYA:\n{summary}\n\nPERCAKAPAN BERIKUTNYA:\n{transcript}\n\nRingkasan terbaru:")
+    ])
+
+async def summarize_conversation(previous_summary: str, transcript: str) -> str:
+    """Ringkasan bergulir (inkremental): ringkasan lama + giliran yang dilipat -> ringkasan baru."""
+    inputs = {"summary": previous_summary or "-", "transcript": transcript}
+
+    async def summarize(model: str):
+        chain = get_summary_prompt() | get_chat_model(model, 0)
+        return await chain.with_config(metadata={"format": "summary"}).ainvoke(inputs)
+
+    # Tugas ringan: biasanya cukup model cepat; tidak di-hedge karena tidak ditunggu pengguna
+    async with llm_slot():
+        response = await get_model_router().run(
+            summarize, count_tokens(previous_summary) + count_tokens(transcript), "summary", hedge=False
+        )
+    return response.content
+
 # --- Definisi Tools -
-@tool
-def create_testcase(prd_context: str, format: str = "steps") -> str:
+def _create_testcase(prd_context: str, format: str = "steps") -> str:
     """
     Membuat test case baru berdasarkan PRD dalam format yang ditentukan.
     Argumen:
@@ -27,36 +166,135 @@ def create_testcase(prd_context: str, format: str = "steps") -> str:
     """
     logger.info(f"Memanggil tool create_testcase dengan format: {format}")
     try:
-        llm = ChatGoogleGenerativeAI(
-            model=settings.model, # Gunakan nama model yang valid
-            temperature=0.1,
-            google_api_key=settings.google_api_key
+        # Jalur sync tanpa failover/hedging: cukup model pilihan tier
+        model = get_model_router().choose(count_tokens(prd_context), format)[0]
+        response = get_testcase_chain(format, model).invoke({"context": prd_context})
+        return response.content
+    except Exception as e:
+        logger.error(f"Error di tool create_testcase: {e}", exc_info=True)
+        return "Maaf, terjadi error saat membuat test case."
+
+async def generate_testcase(prd_context: str, format: str = "steps", mode: str = "auto", refresh: bool = False) -> str:
+    """
+    Mode langsung: memanggil chain test case tanpa agent.
+    mode: 'single' (satu panggilan), 'chunked' (map-reduce per bagian PRD),
+    'incremental' (terstruktur per bagian, hanya bagian yang berubah dibuat ulang),
+    atau 'auto' (incremental untuk PRD ber-bagian hanya jika TESTCASE_STRUCTURED=true,
+    selain itu chunked jika PRD melewati ambang token).
+    refresh=True (/regenerate) membuat ulang semua bagian pada mode incremental.
+    Error dibiarkan naik agar pemanggil (worker job) bisa retry.
+    """
+    if mode == "auto" and settings.testcase_structured and has_sections(prd_context):
+        mode = "incremental"
+    if mode == "incremental":
+        return await generate_testcase_incremental(prd_context, format, refresh)
+    if mode == "chunked" or (mode == "auto" and should_chunk(prd_context)):
+        return await generate_testcase_chunked(prd_context, format)
+    async with llm_slot():
+        response = await get_model_router().run(
+            lambda model: get_testcase_chain(format, model).ainvoke({"context": prd_context}),
+            count_tokens(prd_context),
+            format
         )
+    return response.content
 
-        if format.lower() == "bdd":
-            system_prompt = "Anda adalah QA Engineer BDD. Buat test case dalam format Gherkin (Feature, Scenario, Given, When, Then) berdasarkan PRD."
-            human_prompt_template = "PRD_CONTEXT:\n{context}\n\nBuat skenario BDD:"
-        else: # Default ke 'steps'
-            system_prompt = "Anda adalah QA Engineer senior. Buat test case detail (nama, deskripsi, prekondisi, langkah & hasil) berdasarkan PRD."
-            human_prompt_template = "PRD_CONTEXT:\n{context}\n\nBuat test case format langkah:"
+async def generate_testcase_chunked(prd_context: str, format: str = "steps") -> str:
+    """Map-reduce: test case per bagian PRD secara paralel (dibatasi semaphore), lalu digabung."""
+    sections = split_prd(prd_context)
+    router = get_model_router()
+    semaphore = asyncio.Semaphore(settings.chunk_concurrency)
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", human_prompt_template)
-        ])
+    async def generate_section(section):
+        async with semaphore, llm_slot():
+            context = f"BAGIAN PRD: {section.title}\n\n{section.text}"
+            # Tier dipilih per bagian: bagian kecil bisa ke model cepat
+            response = await router.run(
+                lambda model: get_testcase_chain(format, model).ainvoke({"context": context}),
+                count_tokens(context),
+                format
+            )
+            return section, response.content
 
-        chain = prompt | llm
-        response = chain.invoke({"context": prd_context})
-        return response.content
+    results = await asyncio.gather(*(generate_section(section) for section in sections))
+    return merge_section_results(list(results))
+
+async def generate_testcase_incremental(prd_context: str, format: str = "steps", refresh: bool = False) -> str:
+    """
+    Test case terstruktur per bagian PRD. Hasil disimpan per hash bagian, sehingga PRD
+    yang diperbarui hanya memanggil model untuk bagian yang berubah (biaya sebanding diff);
+    bagian yang tidak berubah diambil dari store lalu semuanya digabung sesuai urutan PRD.
+    """
+    sections = split_prd(prd_context)
+    router = get_model_router()
+    contexts = [f"BAGIAN PRD: {section.title}\n\n{section.text}" for section in sections]
+    # Hash memakai model pilihan tier per bagian (bagian kecil bisa ke model cepat)
+    hashes = [
+        make_section_hash(section, format, router.tier_model(count_tokens(context), format), PROMPT_VERSION)
+        for section, context in zip(sections, contexts)
+    ]
+    store = get_section_store()
+    stored = {} if refresh else await store.get_many(hashes)
+    semaphore = asyncio.Semaphore(settings.chunk_concurrency)
+
+    async def generate_section(context: str, section, section_hash: str) -> Tuple[SectionResult, bool]:
+        async with semaphore, llm_slot():
+            with track_served_models() as served:
+                output = await router.run(
+                    lambda model: get_structured_chain(format, model).ainvoke({"context": context}),
+                    count_tokens(context),
+                    format
+                )
+            return SectionResult.from_output(section, section_hash, output), served.degraded
+
+    # Hash sama di dua bagian (teks kembar) cukup dibuat sekali
+    pending = {h: (context, section) for section, context, h in zip(sections, contexts, hashes) if h not in stored}
+    outcomes = await asyncio.gather(*(generate_section(context, section, h) for h, (context, section) in pending.items()))
+    generated = [result for result, _ in outcomes]
+    # Hasil model cadangan / hedge dipakai untuk balasan ini saja, tidak disimpan
+    await store.set_many([result for result, degraded in outcomes if not degraded])
+    record_section_usage(len(sections) - len(pending), len(pending))
+
+    results = {**stored, **{result.section_hash: result for result in generated}}
+    # Judul diambil dari PRD saat ini: bagian tak berubah bisa berasal dari PRD lain
+    ordered = [
+        results[h].model_copy(update={"section": section.title}) for section, h in zip(sections, hashes)
+    ]
+    return render_section_results(ordered, format)
+
+async def stream_testcase(prd_context: str, format: str = "steps") -> AsyncIterator[str]:
+    """Mode langsung dengan streaming: menghasilkan potongan teks test case dari model."""
+    async with llm_slot():
+        async for chunk in get_model_router().stream(
+            lambda model: get_testcase_chain(format, model).astream({"context": prd_context}),
+            count_tokens(prd_context),
+            format
+        ):
+            if chunk.content:
+                yield chunk.content
+
+async def _acreate_testcase(prd_context: str, format: str = "steps") -> str:
+    """Versi async dari create_testcase (dipakai oleh AgentExecutor.ainvoke)."""
+    logger.info(f"Memanggil tool create_testcase (async) dengan format: {format}")
+    try:
+        return await generate_testcase(prd_context, format)
     except Exception as e:
         logger.error(f"Error di tool create_testcase: {e}", exc_info=True)
         return "Maaf, terjadi error saat membuat test case."
 
+# Tool dengan implementasi sync & async: ainvoke tidak lagi memakai thread pool
+create_testcase = StructuredTool.from_function(
+    func=_create_testcase,
+    coroutine=_acreate_testcase,
+    name="create_testcase"
+)
+
 
 # --- Setup Agen ---
-def get_qa_agent_executor():
-    """Menginisialisasi dan mengembalikan agent executor."""
-    logger.info("Menginisialisasi QA Agent Executor...")
+def get_qa_agent_executor(model: Optional[str] = None) -> "AgentExecutor":
+    """Menginisialisasi dan mengembalikan agent executor (default: model utama)."""
+    from langchain.agents import AgentExecutor, create_tool_calling_agent
+    model = model or settings.model
+    logger.info(f"Menginisialisasi QA Agent Executor ({model})...")
     if not settings.google_api_key or settings.google_api_key == "YOUR_FALLBACK_KEY":
          logger.error("GOOGLE_API_KEY tidak ditemukan atau belum diatur!")
          # Sebaiknya raise error di sini agar aplikasi tidak jalan tanpa key
@@ -64,12 +302,7 @@ def get_qa_agent_executor():
 
     tools = [create_testcase]
 
-    agent_llm = ChatGoogleGenerativeAI(
-        model=settings.model,
-        temperature=0,
-        google_api_key=settings.google_api_key # <<< Ambil dari config
-    )
-    agent_llm = agent_llm.bind_tools(tools)
+    agent_llm = get_chat_model(model, 0).bind_tools(tools)
 
     agent_prompt = ChatPromptTemplate.from_messages([
         ("system", "Anda adalah asisten QA. Selalu gunakan tools jika diperlukan. Jawab dengan ringkas."),
@@ -89,8 +322,36 @@ def get_qa_agent_executor():
     return agent_executor
 
 # --- Dependency untuk FastAPI ---
-# Buat instance agent sekali saja saat startup
-agent_executor_instance = get_qa_agent_executor()
+# Dibuat sekali saat pertama dibutuhkan (atau saat warm-up di lifespan), bukan saat import:
+# key yang hilang tidak lagi menggagalkan import, melainkan readiness check.
+agent_executor_instance: Optional["AgentExecutor"] = None
+_agent_executor_lock = threading.Lock()
+# Executor untuk model lain (tier cepat / cadangan), dibuat saat router pertama memilihnya
+_agent_executors: Dict[str, "AgentExecutor"] = {}
+
+def get_agent_executor() -> "AgentExecutor":
+    global agent_executor_instance
+    if agent_executor_instance is None:
+        with _agent_executor_lock:
+            if agent_executor_instance is None:
+                agent_executor_instance = get_qa_agent_executor()
+    return agent_executor_instance
+
+def get_agent_executor_for(model: str) -> "AgentExecutor":
+    """Agent executor untuk model pilihan router; model utama memakai instance bersama."""
+    if model == settings.model:
+        return get_agent_executor()
+    executor = _agent_executors.get(model)
+    if executor is None:
+        with _agent_executor_lock:
+            executor = _agent_executors.get(model)
+            if executor is None:
+                executor = _agent_executors[model] = get_qa_agent_executor(model)
+    return executor
 
-def get_agent_executor():
-    return agent_executor_instance
\ No newline at end of file
+def warm_up_models():
+    """Membuat client model (agent, test case & tier cepat) dan agent executor lebih awal, dipanggil saat startup."""
+    get_chat_model(settings.model, 0.1)
+    if settings.model_fast:
+        get_chat_model(settings.model_fast, 0.1)
+    get_agent_executor()
\ No newline at end of file
@@ -0,0 +1,7 @@
+# benchmarks/__init__.py
+# Benchmark berjalan offline: isi kredensial palsu agar modul aplikasi bisa diimpor
+# tanpa .env. Nilai asli dari environment tetap dipakai jika ada.
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "fake-google-api-key")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:FAKE")
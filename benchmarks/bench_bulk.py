@@ -0,0 +1,141 @@
+# benchmarks/bench_bulk.py
+"""
+Benchmark bulk API (`POST /bulk/testcases`, respons NDJSON) dengan model palsu:
+- throughput (PRD/detik) dan waktu hingga hasil pertama pada beberapa batas konkurensi
+- resume: klien memutus stream setelah separuh hasil, lalu `GET /bulk/testcases/{batch_id}`
+  melanjutkan; dihitung panggilan model yang terjadi saat resume (harus hanya sisa item)
+
+App berisi bulk router saja (tanpa lifespan main.py), store batch in-memory atau Redis lokal.
+LLM_MAX_CONCURRENCY dinaikkan ke konkurensi terbesar agar yang diukur adalah pool bulk.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_bulk --prds 64 --concurrency 1 4 8 16
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import orjson
+import redis.asyncio as redis
+from fastapi import FastAPI
+
+from benchmarks.common import BackgroundServer, dump
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+from bulk_router import router as bulk_router
+from bulk_service import InMemoryBatchStore, RedisBatchStore
+from config import settings
+
+TOKEN = "bench-token"
+HEADERS = {"Authorization": f"Bearer {TOKEN}"}
+
+
+def _items(prds: int, seed: str) -> list:
+    # PRD unik per skenario agar cache hasil tidak ikut terukur
+    return [
+        {"id": f"PRD-{i}", "format": "bdd" if i % 2 else "steps",
+         "prd_text": f"[{seed}-{i}] Fitur {i}: pengguna dapat mengelola data {i} dengan validasi & hak akses."}
+        for i in range(prds)
+    ]
+
+
+async def _read_stream(response: httpx.Response, stop_after: int = 0) -> tuple:
+    """Membaca baris NDJSON; berhenti (memutus koneksi) setelah `stop_after` hasil jika > 0."""
+    start = time.perf_counter()
+    first_result, results, summary = None, [], None
+    async for line in response.aiter_lines():
+        if not line:
+            continue
+        row = orjson.loads(line)
+        if row["type"] == "result":
+            results.append(row)
+            if first_result is None:
+                first_result = time.perf_counter() - start
+            if stop_after and len(results) >= stop_after:
+                break
+        elif row["type"] == "summary":
+            summary = row
+    return first_result, results, summary
+
+
+async def _throughput(client: httpx.AsyncClient, url: str, args, concurrency: int) -> dict:
+    body = {"items": _items(args.prds, f"c{concurrency}"), "concurrency": concurrency}
+    start = time.perf_counter()
+    async with client.stream("POST", f"{url}/bulk/testcases", json=body, headers=HEADERS) as response:
+        first_result, results, summary = await _read_stream(response)
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "prds_per_s": round(len(results) / elapsed, 2),
+        "time_to_first_result_s": round(first_result, 3),
+        "total_s": round(elapsed, 3),
+        "ok": summary["ok"],
+        "failed": summary["error"],
+    }
+
+
+async def _resume(client: httpx.AsyncClient, url: str, args, fake: FakeChatModel) -> dict:
+    body = {"batch_id": "bench-resume", "items": _items(args.prds, "resume"), "concurrency": args.resume_concurrency}
+    calls_before = fake.stats["calls"]
+    async with client.stream("POST", f"{url}/bulk/testcases", json=body, headers=HEADERS) as response:
+        _, first_part, _ = await _read_stream(response, stop_after=args.prds // 2)
+    await asyncio.sleep(0.2) # Server melihat klien putus, worker dibatalkan & lock dilepas
+    calls_first = fake.stats["calls"] - calls_before
+
+    calls_before = fake.stats["calls"]
+    async with client.stream("GET", f"{url}/bulk/testcases/bench-resume", headers=HEADERS) as response:
+        _, resumed, summary = await _read_stream(response)
+    return {
+        "received_before_disconnect": len(first_part),
+        "model_calls_before_disconnect": calls_first,
+        "replayed_on_resume": sum(1 for row in resumed if row["resumed"]),
+        "model_calls_on_resume": fake.stats["calls"] - calls_before,
+        "all_items_ok": summary is not None and summary["ok"] + summary["resumed"] == args.prds,
+    }
+
+
+async def main(args):
+    fake = install_fake_models(FakeChatModel(latency=args.latency, tokens_per_second=args.tokens_per_second))
+    settings.testcase_direct_mode = True
+    settings.bulk_api_token = TOKEN
+    settings.llm_max_concurrency = max(args.concurrency)
+    settings.bulk_max_concurrency = max(args.concurrency)
+    settings.bulk_max_items = max(settings.bulk_max_items, args.prds)
+
+    app = FastAPI()
+    app.include_router(bulk_router)
+    client_redis = redis.Redis.from_url(args.redis_url, decode_responses=True) if args.redis_url else None
+    app.state.batch_store = (
+        RedisBatchStore(client_redis, 3600, 60) if client_redis else InMemoryBatchStore(100, 3600)
+    )
+    app.state.testcase_cache = None
+
+    async with BackgroundServer(app) as server:
+        async with httpx.AsyncClient(timeout=None) as client:
+            throughput = [await _throughput(client, server.url, args, c) for c in args.concurrency]
+            resume = await _resume(client, server.url, args, fake)
+    if client_redis:
+        await client_redis.aclose()
+
+    dump({
+        "benchmark": "bulk",
+        "config": {
+            "prds": args.prds,
+            "llm_latency_s": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "store": "redis" if args.redis_url else "memory",
+        },
+        "throughput": throughput,
+        "resume": resume,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prds", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--resume-concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3, help="Latensi tetap per panggilan model (detik)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: store in-memory)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,135 @@
+# benchmarks/bench_delivery.py
+"""
+Mengukur pengiriman hasil test case ke banyak chat sekaligus, terhadap Bot API palsu
+yang menegakkan batas Telegram (teks maksimal 4096 karakter, 429 + retry_after saat
+melewati batas kiriman global / per chat per detik):
+- unpaced    : perilaku lama, satu sendMessage berisi seluruh hasil + typing tanpa digabung
+- scheduled  : TelegramService dengan OutboundScheduler (split per test case, token bucket,
+               retry_after, sendDocument untuk hasil sangat panjang, typing digabung)
+
+Tiap chat menerima beberapa typing action (seperti indikator progres), satu pesan status,
+lalu hasil test case berukuran kecil / besar / sangat besar (seed tetap).
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_delivery --chats 40
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import BackgroundServer, dump, summarize
+from benchmarks.fake_llm import _fake_testcases
+from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app
+from config import settings
+from telegram_delivery import OutboundScheduler
+from telegram_service import TelegramService, create_http_client
+
+SUITE_SIZES = {"small": 6, "large": 30, "huge": 120} # Jumlah test case per hasil
+
+
+def _scheduler() -> OutboundScheduler:
+    return OutboundScheduler(
+        settings.delivery_global_rate,
+        settings.delivery_global_burst,
+        settings.delivery_chat_rate,
+        settings.delivery_chat_burst,
+        settings.delivery_max_chats,
+        settings.delivery_max_retries,
+        settings.delivery_typing_interval
+    )
+
+
+async def _chat_unpaced(service: TelegramService, chat_id: int, suite: str, args) -> bool:
+    for _ in range(args.typing):
+        await service._post("sendChatAction", {"chat_id": chat_id, "action": "typing"})
+        await asyncio.sleep(args.typing_interval)
+    ok = True
+    for text in ("⏳ Sedang membuat test case...", suite):
+        response = await service._post("sendMessage", {"chat_id": chat_id, "text": text})
+        ok = ok and response.status_code == 200
+    return ok
+
+
+async def _chat_scheduled(service: TelegramService, chat_id: int, suite: str, args) -> bool:
+    for _ in range(args.typing):
+        await service.send_typing_action(chat_id)
+        await asyncio.sleep(args.typing_interval)
+    status_id = await service.send_reply(chat_id, "⏳ Sedang membuat test case...")
+    suite_id = await service.send_testcases(chat_id, suite, "steps")
+    return status_id is not None and suite_id is not None
+
+
+async def _run(name: str, args, suites: list) -> dict:
+    app = create_fake_telegram_app(
+        latency=args.telegram_latency, rate_limits=(args.global_limit, args.chat_limit), retry_after=args.retry_after
+    )
+    async with BackgroundServer(app) as server:
+        http_client = create_http_client()
+        scheduler = _scheduler() if name == "scheduled" else None
+        service = TelegramService(http_client, f"{server.url}/bot{FAKE_TOKEN}", scheduler)
+        service.scheduler = scheduler # unpaced: tanpa penjadwal proses
+        chat = _chat_scheduled if scheduler else _chat_unpaced
+        durations = []
+
+        async def one(chat_id: int, suite: str) -> bool:
+            start = time.perf_counter()
+            ok = await chat(service, chat_id, suite, args)
+            durations.append(time.perf_counter() - start)
+            return ok
+
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(one(1000 + i, suite) for i, (_, suite) in enumerate(suites)))
+        finally:
+            await http_client.aclose()
+        elapsed = time.perf_counter() - start
+
+    calls = app.state.calls
+    rejected = app.state.rejected
+    return {
+        "chats_fully_delivered": round(sum(results) / len(results), 3),
+        "elapsed_s": round(elapsed, 2),
+        "per_chat_delivery": summarize(durations),
+        "api_calls": {
+            method: sum(1 for _, m, _ in calls if m == method)
+            for method in ("sendChatAction", "sendMessage", "sendDocument")
+        },
+        "rejected_too_long": sum(1 for _, _, code in rejected if code == 400),
+        "rejected_429": sum(1 for _, _, code in rejected if code == 429),
+    }
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    suites = []
+    for _ in range(args.chats):
+        size = rng.choices(list(SUITE_SIZES), weights=(5, 3, 2))[0]
+        suites.append((size, _fake_testcases("steps", SUITE_SIZES[size])))
+
+    dump({
+        "benchmark": "delivery",
+        "config": {
+            "chats": args.chats,
+            "suites": {size: sum(1 for s, _ in suites if s == size) for size in SUITE_SIZES},
+            "fake_limits_per_s": {"global": args.global_limit, "chat": args.chat_limit},
+            "global_rate": settings.delivery_global_rate,
+            "chat_rate": settings.delivery_chat_rate,
+            "document_min_parts": settings.delivery_document_min_parts,
+        },
+        "unpaced": await _run("unpaced", args, suites),
+        "scheduled": await _run("scheduled", args, suites),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--typing", type=int, default=8, help="Typing action per chat selama 'generasi'")
+    parser.add_argument("--typing-interval", type=float, default=0.25)
+    parser.add_argument("--global-limit", type=int, default=30, help="Batas Bot API palsu: kiriman/detik per bot")
+    parser.add_argument("--chat-limit", type=int, default=4, help="Batas Bot API palsu: kiriman/detik per chat")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
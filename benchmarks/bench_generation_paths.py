@@ -0,0 +1,73 @@
+# benchmarks/bench_generation_paths.py
+"""
+Membandingkan latensi dan pemakaian token alur PRD:
+- direct : agent_logic.generate_testcase (satu panggilan model)
+- agent  : AgentExecutor (rencana -> create_testcase -> rangkuman)
+
+Model Gemini diganti FakeChatModel dengan latensi & laju token yang bisa diatur.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_generation_paths --prds 20 --latency 0.5 --tokens-per-second 300
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import dump, summarize
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+import agent_logic
+from job_worker import run_agent_for_prd
+
+SAMPLE_PRD = (
+    "Fitur Login: pengguna dapat masuk memakai email dan password. "
+    "Password minimal 8 karakter. Setelah 5 kali gagal, akun dikunci 15 menit. "
+    "Tersedia tautan 'Lupa Password' yang mengirim email reset."
+)
+
+
+async def _run(path: str, prds: int, concurrency: int, model: FakeChatModel, executor):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    before = dict(model.stats)
+
+    async def one(i: int):
+        fmt = "bdd" if i % 2 else "steps"
+        async with semaphore:
+            start = time.perf_counter()
+            if path == "direct":
+                await agent_logic.generate_testcase(SAMPLE_PRD, fmt)
+            else:
+                await run_agent_for_prd(executor, SAMPLE_PRD, fmt)
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(prds)))
+    usage = {key: model.stats[key] - before[key] for key in model.stats}
+    return {
+        **summarize(samples),
+        "model_calls_per_prd": round(usage["calls"] / prds, 2),
+        "input_tokens_per_prd": round(usage["input_tokens"] / prds, 1),
+        "output_tokens_per_prd": round(usage["output_tokens"] / prds, 1),
+    }
+
+
+async def main(args):
+    model = install_fake_models(FakeChatModel(latency=args.latency, tokens_per_second=args.tokens_per_second))
+    executor = agent_logic.get_qa_agent_executor()
+    executor.verbose = False # Jangan campur log agent dengan output JSON
+
+    dump({
+        "benchmark": "generation_paths",
+        "prds": args.prds,
+        "concurrency": args.concurrency,
+        "direct": await _run("direct", args.prds, args.concurrency, model, executor),
+        "agent": await _run("agent", args.prds, args.concurrency, model, executor),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="Latensi tetap per panggilan model (detik)")
+    parser.add_argument("--tokens-per-second", type=float, default=300.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+# benchmarks/bench_incremental.py
+"""
+Benchmark regenerasi inkremental per bagian PRD dengan model palsu.
+PRD berisi banyak bagian (heading `##`); setelah run awal, sejumlah bagian diubah lalu
+test case dibuat ulang. Dibandingkan:
+- full        : semua bagian dibuat ulang (refresh, seperti /regenerate)
+- incremental : hanya bagian yang hash-nya berubah ke model, sisanya dari store
+Yang diukur per skenario: panggilan model, token input/output, dan durasi.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_incremental --sections 30 --edits 1 3 10
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import redis.asyncio as redis
+
+import agent_logic
+import testcase_sections
+from benchmarks.common import dump
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+from config import settings
+from testcase_sections import SectionResultStore
+
+
+def _prd(sections: int, revision: dict) -> str:
+    """PRD dengan `sections` bagian; `revision[i]` menandai bagian ke-i yang sudah diubah."""
+    parts = []
+    for i in range(sections):
+        rev = revision.get(i, 0)
+        parts.append(
+            f"## Fitur {i}\n"
+            f"Pengguna dapat membuat, mengubah dan menghapus data {i}. Data wajib memiliki nama unik "
+            f"(maksimal 50 karakter) dan hanya admin yang boleh menghapus. Batas data per akun: {100 + rev}.\n"
+            f"Sistem mencatat audit log untuk setiap perubahan data {i} (revisi {rev})."
+        )
+    return "# PRD Aplikasi Inventaris\n\n" + "\n\n".join(parts)
+
+
+async def _measure(fake: FakeChatModel, prd: str, refresh: bool) -> dict:
+    before = dict(fake.stats)
+    start = time.perf_counter()
+    await agent_logic.generate_testcase(prd, "steps", refresh=refresh)
+    elapsed = time.perf_counter() - start
+    return {
+        "model_calls": fake.stats["calls"] - before["calls"],
+        "input_tokens": fake.stats["input_tokens"] - before["input_tokens"],
+        "output_tokens": fake.stats["output_tokens"] - before["output_tokens"],
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+async def main(args):
+    fake = install_fake_models(FakeChatModel(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, cases=args.cases
+    ))
+    settings.testcase_structured = True
+    settings.llm_max_concurrency = max(settings.llm_max_concurrency, settings.chunk_concurrency)
+    client = redis.Redis.from_url(args.redis_url) if args.redis_url else None
+    testcase_sections._section_store = SectionResultStore(client, settings.section_cache_local_size, 3600)
+
+    rng = random.Random(args.seed)
+    revision: dict = {}
+    cold = await _measure(fake, _prd(args.sections, revision), refresh=False)
+
+    edits = []
+    for count in args.edits:
+        for i in rng.sample(range(args.sections), count):
+            revision[i] = revision.get(i, 0) + 1
+        prd = _prd(args.sections, revision)
+        incremental = await _measure(fake, prd, refresh=False)
+        full = await _measure(fake, prd, refresh=True) # Tidak membaca store, jadi urutan tidak memengaruhi
+        edits.append({
+            "sections_changed": count,
+            "full": full,
+            "incremental": incremental,
+            "input_token_ratio": round(incremental["input_tokens"] / full["input_tokens"], 3),
+        })
+    if client:
+        await client.aclose()
+
+    dump({
+        "benchmark": "incremental",
+        "config": {
+            "sections": args.sections,
+            "cases_per_call": args.cases,
+            "llm_latency_s": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "chunk_concurrency": settings.chunk_concurrency,
+            "store": "redis" if args.redis_url else "memory",
+        },
+        "cold": cold,
+        "edits": edits,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=30)
+    parser.add_argument("--edits", type=int, nargs="+", default=[1, 3, 10], help="Jumlah bagian yang diubah per skenario")
+    parser.add_argument("--cases", type=int, default=4, help="Test case per panggilan model palsu")
+    parser.add_argument("--latency", type=float, default=0.3, help="Latensi tetap per panggilan model (detik)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: store hanya di memori)")
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+# benchmarks/bench_memory.py
+"""
+Mengukur ukuran prompt follow-up seiring percakapan memanjang: memori percakapan
+terbatas token (ringkasan bergulir) dibandingkan riwayat penuh tanpa batas.
+
+Satu percakapan = PRD awal lalu serangkaian follow-up ("tambahkan negative case ...")
+yang diproses `process_generate_testcase` lewat agent. Token input model per follow-up
+diambil dari FakeChatModel; memori disimpan di fakeredis (atau Redis lokal via --redis-url).
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_memory --follow-ups 20
+    python -m benchmarks.bench_memory --follow-ups 20 --max-tokens 2000
+"""
+import argparse
+import asyncio
+import time
+
+import redis.asyncio as redis
+
+from benchmarks.common import BackgroundServer, dump, summarize
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app
+from agent_logic import get_qa_agent_executor, summarize_conversation
+from config import settings
+from job_service import GenerateTestcaseJob
+from job_worker import process_generate_testcase
+from memory_service import RedisMemoryService
+from telegram_service import TelegramService, create_http_client
+
+SAMPLE_PRD = "\n".join(
+    f"## Fitur {i}\nPengguna dapat mengelola data {i}: tambah, ubah, hapus, dengan validasi input dan hak akses."
+    for i in range(1, 21)
+)
+FOLLOW_UPS = [
+    "Tambahkan negative case untuk validasi input.",
+    "Tambahkan skenario hak akses untuk pengguna tanpa izin.",
+    "Buat versi singkat hanya untuk smoke test.",
+    "Tambahkan boundary value untuk panjang input.",
+]
+
+
+async def _conversation(args, service: TelegramService, memory: RedisMemoryService, fake: FakeChatModel, chat_id: int):
+    executor = get_qa_agent_executor()
+    executor.verbose = False
+    await memory.clear(chat_id)
+
+    prd_job = GenerateTestcaseJob(chat_id=chat_id, format="steps", prd_text=SAMPLE_PRD)
+    await process_generate_testcase(prd_job, service, executor, cache=None, memory_service=memory)
+
+    input_tokens, history_tokens, durations = [], [], []
+    for i in range(args.follow_ups):
+        history_tokens.append((await memory.load(chat_id)).total_tokens)
+        tokens_before = fake.stats["input_tokens"]
+        start = time.perf_counter()
+        job = GenerateTestcaseJob(
+            chat_id=chat_id, format="steps", prd_text=FOLLOW_UPS[i % len(FOLLOW_UPS)], follow_up=True
+        )
+        await process_generate_testcase(job, service, executor, cache=None, memory_service=memory)
+        durations.append(time.perf_counter() - start)
+        await memory.drain(60.0) # Peringkasan background ikut dihitung di token, bukan di latensi job
+        input_tokens.append(fake.stats["input_tokens"] - tokens_before)
+
+    return {
+        "follow_up_input_tokens": {
+            "first": input_tokens[0],
+            "last": input_tokens[-1],
+            "max": max(input_tokens),
+            "total": sum(input_tokens),
+        },
+        "stored_history_tokens_last": history_tokens[-1],
+        "follow_up_latency": summarize(durations),
+    }
+
+
+async def main(args):
+    fake = install_fake_models(FakeChatModel(latency=0.0, tokens_per_second=1e9, cases=args.cases))
+    settings.testcase_direct_mode = True
+    settings.testcase_streaming = False
+
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    # Riwayat penuh: anggaran & potongan per giliran praktis tak terbatas, tanpa peringkasan
+    unbounded = RedisMemoryService(
+        client, settings.memory_ttl, max_tokens=10**9, turn_max_tokens=10**9, summary_max_tokens=0
+    )
+    bounded = RedisMemoryService(
+        client, settings.memory_ttl,
+        max_tokens=args.max_tokens,
+        turn_max_tokens=args.turn_max_tokens,
+        summary_max_tokens=args.summary_max_tokens,
+        summarizer=summarize_conversation
+    )
+
+    async with BackgroundServer(create_fake_telegram_app()) as server:
+        http_client = create_http_client()
+        service = TelegramService(http_client, f"{server.url}/bot{FAKE_TOKEN}")
+        try:
+            dump({
+                "benchmark": "memory",
+                "config": {
+                    "follow_ups": args.follow_ups,
+                    "max_tokens": args.max_tokens,
+                    "turn_max_tokens": args.turn_max_tokens,
+                    "summary_max_tokens": args.summary_max_tokens,
+                },
+                "unbounded_history": await _conversation(args, service, unbounded, fake, chat_id=1),
+                "token_budgeted_memory": await _conversation(args, service, bounded, fake, chat_id=2),
+            })
+        finally:
+            await http_client.aclose()
+            await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--follow-ups", type=int, default=20)
+    parser.add_argument("--cases", type=int, default=20, help="Jumlah test case palsu per jawaban")
+    parser.add_argument("--max-tokens", type=int, default=settings.memory_max_tokens)
+    parser.add_argument("--turn-max-tokens", type=int, default=settings.memory_turn_max_tokens)
+    parser.add_argument("--summary-max-tokens", type=int, default=settings.memory_summary_max_tokens)
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: fakeredis)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,137 @@
+# benchmarks/bench_model_router.py
+"""
+Membandingkan alur mode langsung (`agent_logic.generate_testcase`) dengan dan tanpa router model:
+- baseline       : semua PRD ke model utama, tanpa retry/failover (perilaku sebelum router)
+- routed         : tier per ukuran PRD + retry + failover ke model cadangan
+- routed_hedged  : seperti routed, ditambah hedging setelah p95 latensi model pertama
+- primary_outage : routed ketika model utama selalu gagal (circuit breaker memindahkannya ke belakang)
+
+Model utama & model cepat diganti FakeChatModel terpisah dengan latensi, error penyedia
+(FakeProviderError), dan latensi ekor buatan. Campuran PRD kecil & besar dengan seed tetap.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_model_router --prds 300 --failure-rate 0.02 --slow-rate 0.02
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import dump, summarize
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+import agent_logic
+import model_router
+from config import settings
+
+PRIMARY = "gemini-2.5-pro"
+FAST = "gemini-2.5-flash"
+
+SMALL_PRD = (
+    "Fitur Login: pengguna dapat masuk memakai email dan password. "
+    "Password minimal 8 karakter. Setelah 5 kali gagal, akun dikunci 15 menit."
+)
+LARGE_PRD = "\n".join(
+    f"## Fitur {i}\nPengguna dapat mengelola data {i}: tambah, ubah, hapus, dengan validasi input, "
+    f"hak akses per peran, audit log, dan notifikasi email saat data {i} berubah."
+    for i in range(1, 61)
+)
+
+
+def _configure(fast: str, fallbacks: list, max_attempts: int, hedge: bool):
+    settings.model = PRIMARY
+    settings.model_fast = fast
+    settings.model_fallbacks = fallbacks
+    settings.model_max_attempts = max_attempts
+    settings.model_hedge_enabled = hedge
+    model_router._model_router = None # Statistik router baru per skenario
+
+
+async def _scenario(args, name: str, primary: FakeChatModel, fast: FakeChatModel) -> dict:
+    rng = random.Random(args.seed)
+    random.seed(args.seed) # Injeksi error & latensi ekor di FakeChatModel
+    prds = [SMALL_PRD if rng.random() < args.small_ratio else LARGE_PRD for _ in range(args.prds)]
+    before = {"primary": dict(primary.stats), "fast": dict(fast.stats)}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    samples, errors = [], 0
+
+    async def one(i: int, prd: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await agent_logic.generate_testcase(prd, "bdd" if i % 2 else "steps", mode="single")
+            except Exception:
+                errors += 1
+                return
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i, prd) for i, prd in enumerate(prds)))
+    usage = {
+        label: {key: model.stats[key] - before[label][key] for key in ("calls", "failures", "output_tokens")}
+        for label, model in (("primary", primary), ("fast", fast))
+    }
+    return {
+        "scenario": name,
+        "latency": summarize(samples),
+        "error_rate": round(errors / len(prds), 4),
+        "model_usage": usage,
+    }
+
+
+async def main(args):
+    settings.llm_max_concurrency = args.concurrency
+    primary = FakeChatModel(
+        latency=args.primary_latency, tokens_per_second=args.primary_tps,
+        failure_rate=args.failure_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        model_name=PRIMARY
+    )
+    fast = FakeChatModel(
+        latency=args.fast_latency, tokens_per_second=args.fast_tps,
+        failure_rate=args.failure_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        model_name=FAST
+    )
+    install_fake_models(primary, models=[PRIMARY])
+    install_fake_models(fast, models=[FAST])
+
+    results = []
+    _configure(fast="", fallbacks=[], max_attempts=1, hedge=False)
+    results.append(await _scenario(args, "baseline", primary, fast))
+    _configure(fast=FAST, fallbacks=[FAST], max_attempts=2, hedge=False)
+    results.append(await _scenario(args, "routed", primary, fast))
+    _configure(fast=FAST, fallbacks=[FAST], max_attempts=2, hedge=True)
+    results.append(await _scenario(args, "routed_hedged", primary, fast))
+
+    primary.failure_rate = 1.0
+    _configure(fast=FAST, fallbacks=[FAST], max_attempts=2, hedge=False)
+    results.append(await _scenario(args, "primary_outage", primary, fast))
+
+    dump({
+        "benchmark": "model_router",
+        "config": {
+            "prds": args.prds,
+            "small_ratio": args.small_ratio,
+            "concurrency": args.concurrency,
+            "failure_rate": args.failure_rate,
+            "slow_rate": args.slow_rate,
+            "slow_latency": args.slow_latency,
+            "fast_max_tokens": settings.model_fast_max_tokens,
+            "hedge_percentile": settings.model_hedge_percentile,
+        },
+        "scenarios": results,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prds", type=int, default=200)
+    parser.add_argument("--small-ratio", type=float, default=0.6, help="Proporsi PRD kecil (kandidat tier cepat)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--primary-latency", type=float, default=0.4)
+    parser.add_argument("--primary-tps", type=float, default=3000.0)
+    parser.add_argument("--fast-latency", type=float, default=0.1)
+    parser.add_argument("--fast-tps", type=float, default=10000.0)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="Peluang latensi ekor per panggilan")
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
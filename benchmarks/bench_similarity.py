@@ -0,0 +1,141 @@
+# benchmarks/bench_similarity.py
+"""
+Benchmark indeks PRD hampir sama (`prd_similarity.PrdSimilarityIndex`, MinHash + LSH di Redis):
+- latensi lookup pada beberapa ukuran korpus (harus tetap datar saat korpus tumbuh)
+- recall untuk PRD yang hanya berbeda sedikit (salah ketik / tambahan kalimat)
+- false positive untuk PRD yang benar-benar baru
+- pembanding: scan linear semua signature (numpy) pada korpus yang sama
+
+PRD sintetis dibuat dari kosakata acak dengan seed tetap.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_similarity --docs 10000
+    python -m benchmarks.bench_similarity --docs 200000 --redis-url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+import redis.asyncio as redis
+
+from benchmarks.common import dump, summarize
+from config import settings
+from prd_similarity import PrdSimilarityIndex
+
+NAMESPACE = "bench"
+
+
+def _vocabulary(rng: random.Random, size: int) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def _prd(rng: random.Random, vocabulary: list) -> str:
+    sentences = []
+    for _ in range(rng.randint(15, 40)):
+        sentences.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 16))) + ".")
+    return "\n".join(sentences)
+
+
+def _near_duplicate(rng: random.Random, vocabulary: list, prd: str) -> str:
+    """Perubahan kecil khas revisi PRD: satu salah ketik diperbaiki atau satu kalimat ditambah."""
+    if rng.random() < 0.5:
+        words = prd.split(" ")
+        index = rng.randrange(len(words))
+        words[index] = words[index][::-1] + "x"
+        return " ".join(words)
+    return prd + "\n" + " ".join(rng.choice(vocabulary) for _ in range(12)) + "."
+
+
+async def _lookups(index: PrdSimilarityIndex, queries: list) -> tuple:
+    samples, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        match = await index.find(query, NAMESPACE)
+        samples.append(time.perf_counter() - start)
+        hits += match is not None
+    return samples, hits
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    vocabulary = _vocabulary(rng, args.vocabulary)
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    index = PrdSimilarityIndex(
+        client,
+        settings.similarity_threshold,
+        settings.similarity_num_perm,
+        settings.similarity_bands,
+        settings.similarity_shingle_size,
+        settings.similarity_min_shingles,
+        settings.similarity_max_candidates,
+        3600
+    )
+    checkpoints = sorted({c for c in (1000, 10000, 100000) if c < args.docs} | {args.docs})
+
+    corpus, signatures, results = [], [], []
+    index_samples = []
+    try:
+        for checkpoint in checkpoints:
+            while len(corpus) < checkpoint:
+                prd = _prd(rng, vocabulary)
+                start = time.perf_counter()
+                await index.add(prd, NAMESPACE, f"key-{len(corpus)}")
+                index_samples.append(time.perf_counter() - start)
+                corpus.append(prd)
+                signatures.append(index.signature(prd))
+
+            near_queries = [_near_duplicate(rng, vocabulary, rng.choice(corpus)) for _ in range(args.queries)]
+            new_queries = [_prd(rng, vocabulary) for _ in range(args.queries)]
+            near_samples, near_hits = await _lookups(index, near_queries)
+            new_samples, false_hits = await _lookups(index, new_queries)
+
+            # Pembanding: bandingkan signature query dengan seluruh korpus
+            matrix = np.vstack(signatures)
+            scan_samples = []
+            for query in near_queries[:20]:
+                start = time.perf_counter()
+                signature = index.signature(query)
+                (matrix == signature).mean(axis=1).max()
+                scan_samples.append(time.perf_counter() - start)
+
+            results.append({
+                "corpus_size": checkpoint,
+                "lsh_lookup": summarize(near_samples + new_samples),
+                "linear_scan": summarize(scan_samples),
+                "near_duplicate_recall": round(near_hits / len(near_queries), 3),
+                "false_positive_rate": round(false_hits / len(new_queries), 3),
+            })
+    finally:
+        await client.aclose()
+
+    dump({
+        "benchmark": "similarity",
+        "redis": args.redis_url or "fakeredis",
+        "config": {
+            "threshold": settings.similarity_threshold,
+            "num_perm": settings.similarity_num_perm,
+            "bands": settings.similarity_bands,
+            "shingle_size": settings.similarity_shingle_size,
+            "queries_per_checkpoint": args.queries,
+        },
+        "index_add": summarize(index_samples),
+        "checkpoints": results,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: fakeredis)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,140 @@
+# benchmarks/bench_startup.py
+"""
+Mengukur waktu cold start aplikasi di proses Python baru (seperti worker gunicorn baru):
+- import_s        : `import main` (termasuk seluruh dependensi yang diimpor saat modul dimuat)
+- startup_s       : lifespan FastAPI hingga server siap (warm-up Redis & client model)
+- first_request_s : update webhook pertama (/help) setelah server siap
+- warm_request_s  : update kedua, sebagai pembanding
+
+Setiap run memakai proses baru. Bot API palsu lokal; Redis memakai fakeredis kecuali --redis-url.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 3 --importtime 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def _update(update_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": 1}, "text": text}}
+
+
+async def _child(args):
+    """Satu cold start. Modul aplikasi & helper benchmark baru diimpor setelah pengukuran import."""
+    start = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - start
+
+    import httpx
+    from benchmarks.common import BackgroundServer
+    from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app
+    from config import settings
+    from state_service import StateService, get_state_service
+
+    settings.job_backend = "memory"
+    if not args.redis_url:
+        import fakeredis
+        fake_redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+        async def get_fake_state_service():
+            yield StateService(fake_redis)
+
+        main.app.dependency_overrides[get_state_service] = get_fake_state_service
+
+    async with BackgroundServer(create_fake_telegram_app()) as fake_server:
+        settings.telegram_api_url = f"{fake_server.url}/bot{FAKE_TOKEN}"
+
+        start = time.perf_counter()
+        async with BackgroundServer(main.app) as app_server:
+            startup_s = time.perf_counter() - start
+
+            async with httpx.AsyncClient(base_url=app_server.url, timeout=30.0) as client:
+                timings = []
+                for update_id in (1, 2):
+                    start = time.perf_counter()
+                    response = await client.post("/webhook/telegram", json=_update(update_id, "/help"))
+                    response.raise_for_status()
+                    timings.append(time.perf_counter() - start)
+                ready = await client.get("/health/ready")
+
+    print(json.dumps({
+        "import_s": import_s,
+        "startup_s": startup_s,
+        "first_request_s": timings[0],
+        "warm_request_s": timings[1],
+        "ready_status": ready.status_code,
+    }))
+
+
+def _import_profile(top: int) -> list:
+    """Modul dengan waktu import kumulatif terbesar (`python -X importtime`)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        rows.append((int(cumulative), module.strip()))
+    rows.sort(reverse=True)
+    return [{"module": module, "cumulative_ms": round(us / 1000, 1)} for us, module in rows[:top]]
+
+
+def main(args):
+    env = os.environ.copy()
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+
+    runs = []
+    for _ in range(args.runs):
+        command = [sys.executable, "-m", "benchmarks.bench_startup", "--child"]
+        if args.redis_url:
+            command += ["--redis-url", args.redis_url]
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            sys.stderr.write(result.stderr)
+            raise SystemExit(f"Run cold start gagal (exit {result.returncode}).")
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    def stats(key: str) -> dict:
+        samples = [run[key] for run in runs]
+        return {
+            "median_s": round(statistics.median(samples), 3),
+            "min_s": round(min(samples), 3),
+            "max_s": round(max(samples), 3),
+        }
+
+    result = {
+        "benchmark": "startup",
+        "runs": args.runs,
+        "redis": args.redis_url or "fakeredis",
+        **{key: stats(key) for key in ("import_s", "startup_s", "first_request_s", "warm_request_s")},
+        "ready_status": [run["ready_status"] for run in runs],
+    }
+    if args.importtime:
+        result["slowest_imports"] = _import_profile(args.importtime)
+
+    from benchmarks.common import dump
+    dump(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: fakeredis, readiness 503)")
+    parser.add_argument("--importtime", type=int, default=0, help="Tampilkan N import terlama")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.child:
+        asyncio.run(_child(parsed))
+    else:
+        main(parsed)
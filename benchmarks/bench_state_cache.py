@@ -0,0 +1,109 @@
+# benchmarks/bench_state_cache.py
+"""
+Benchmark latensi operasi state per update: StateService langsung ke Redis
+dibandingkan dengan near cache lokal (`StateNearCache`) di depannya.
+
+Campuran operasi meniru trafik bot: sebagian besar pesan datang dari chat tanpa
+state (pop_state/clear_state yang near cache jawab dari cache negatif), sisanya
+alur /generate -> pilih format -> kirim PRD (save, transition, pop).
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_state_cache --chats 200 --rounds 20
+    python -m benchmarks.bench_state_cache --redis-url redis://localhost:6379/15
+
+fakeredis berjalan di proses yang sama (tanpa round trip jaringan), jadi selisih
+nyata terhadap Redis sungguhan lebih besar; gunakan --redis-url untuk angka produksi.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import redis.asyncio as redis
+
+from benchmarks.common import dump, summarize
+from observability import STATE_CACHE_LOOKUPS
+from state_service import StateNearCache, StateService
+
+
+async def _run(client: redis.Redis, chats: int, rounds: int, active_ratio: float, cached: bool, seed: int):
+    near_cache = StateNearCache(chats * 2, 60.0) if cached else None
+    if near_cache:
+        await near_cache.start(client)
+        while not near_cache.active:
+            await asyncio.sleep(0.01)
+    service = StateService(client, near_cache)
+    samples = defaultdict(list)
+    rng = random.Random(seed)
+
+    async def timed(op: str, coro):
+        start = time.perf_counter()
+        result = await coro
+        samples[op].append(time.perf_counter() - start)
+        return result
+
+    async def chat_round(chat_id: int):
+        if rng.random() < active_ratio:
+            # /generate -> format:* -> PRD
+            await timed("clear", service.clear_state(chat_id))
+            await timed("save", service.save_state(chat_id, {"state": "awaiting_format", "data": {}}))
+            await timed("transition", service.transition_state(
+                chat_id, "awaiting_format", "awaiting_prd", {"format": "steps"}
+            ))
+            await timed("pop", service.pop_state(chat_id))
+        else:
+            # Pesan teks biasa dari chat tanpa state
+            await timed("pop", service.pop_state(chat_id))
+            await timed("get", service.get_state(chat_id))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(chat_round(chat_id) for chat_id in range(chats)))
+    elapsed = time.perf_counter() - start
+
+    if near_cache:
+        await near_cache.stop()
+    all_samples = [s for op_samples in samples.values() for s in op_samples]
+    return {
+        "overall": summarize(all_samples),
+        "ops_per_s": round(len(all_samples) / elapsed, 1),
+        "per_op": {op: summarize(op_samples) for op, op_samples in sorted(samples.items())},
+    }
+
+
+async def main(args):
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    try:
+        direct = await _run(client, args.chats, args.rounds, args.active_ratio, False, args.seed)
+        results = ("hit", "negative_hit", "miss")
+        lookups_before = {result: STATE_CACHE_LOOKUPS.value(result=result) for result in results}
+        near_cache = await _run(client, args.chats, args.rounds, args.active_ratio, True, args.seed)
+        lookups = {
+            result: int(STATE_CACHE_LOOKUPS.value(result=result) - lookups_before[result]) for result in results
+        }
+    finally:
+        await client.aclose()
+
+    dump({
+        "benchmark": "state_cache",
+        "redis": args.redis_url or "fakeredis",
+        "config": {"chats": args.chats, "rounds": args.rounds, "active_ratio": args.active_ratio},
+        "direct_redis": direct,
+        "near_cache": {**near_cache, "lookups": lookups},
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--active-ratio", type=float, default=0.2, help="Porsi chat yang menjalani alur /generate")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: fakeredis)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+# benchmarks/bench_streaming.py
+"""
+Mengukur time-to-first-content balasan PRD: streaming (edit bertahap) vs non-streaming.
+Memakai Bot API palsu lokal dan FakeChatModel dengan laju token yang bisa diatur.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_streaming --tokens-per-second 80 --cases 40
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import BackgroundServer, dump
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app
+from config import settings
+from job_service import GenerateTestcaseJob
+from job_worker import process_generate_testcase
+from telegram_service import TelegramService, create_http_client
+
+SAMPLE_PRD = "Fitur Checkout: pengguna membayar dengan kartu, e-wallet, atau transfer bank."
+
+
+async def _run(streaming: bool, service: TelegramService, fake_app, chat_id: int):
+    settings.testcase_direct_mode = True
+    settings.testcase_streaming = streaming
+    calls_before = len(fake_app.state.calls)
+
+    start = time.perf_counter()
+    job = GenerateTestcaseJob(chat_id=chat_id, format="steps", prd_text=SAMPLE_PRD)
+    await process_generate_testcase(job, service, agent_executor=None, cache=None)
+    total = time.perf_counter() - start
+
+    calls = fake_app.state.calls[calls_before:]
+    sends = [c for c in calls if c[1] == "sendMessage"]
+    edits = [c for c in calls if c[1] == "editMessageText"]
+    first_content = sends[0][0] - start if sends else None
+    return {
+        "time_to_first_content_s": round(first_content, 3) if first_content is not None else None,
+        "total_s": round(total, 3),
+        "messages_sent": len(sends),
+        "edits": len(edits),
+        "max_message_chars": max((len(c[2].get("text", "")) for c in sends + edits), default=0),
+    }
+
+
+async def main(args):
+    install_fake_models(FakeChatModel(latency=args.latency, tokens_per_second=args.tokens_per_second, cases=args.cases))
+    settings.stream_edit_interval = args.edit_interval
+    fake_app = create_fake_telegram_app()
+
+    async with BackgroundServer(fake_app) as server:
+        client = create_http_client()
+        service = TelegramService(client, f"{server.url}/bot{FAKE_TOKEN}")
+        try:
+            dump({
+                "benchmark": "streaming",
+                "non_streaming": await _run(False, service, fake_app, chat_id=1),
+                "streaming": await _run(True, service, fake_app, chat_id=2),
+            })
+        finally:
+            await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=1.0, help="Latensi sebelum token pertama (detik)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--cases", type=int, default=40, help="Jumlah test case palsu (panjang output)")
+    parser.add_argument("--edit-interval", type=float, default=1.5)
+    asyncio.run(main(parser.parse_args()))
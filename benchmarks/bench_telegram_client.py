@@ -0,0 +1,77 @@
+# benchmarks/bench_telegram_client.py
+"""
+Benchmark latensi outbound per update: AsyncClient baru per update (perilaku lama)
+dibandingkan client ber-pool bersama dari `telegram_service.create_http_client`.
+
+Pemakaian (dari root repo):
+    python -m benchmarks.bench_telegram_client --updates 200 --concurrency 10
+    python -m benchmarks.bench_telegram_client --api-url https://api.telegram.org/bot<TOKEN>
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import BackgroundServer, dump, summarize
+from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app
+from telegram_service import TelegramService, create_http_client
+
+
+async def _one_update(service: TelegramService, chat_id: int):
+    """Satu burst outbound khas sebuah update (callback format:*)."""
+    await service.answer_callback_query("bench-callback")
+    await service.send_typing_action(chat_id)
+    await service.edit_message_text(chat_id, 1, "👍 Format `steps` dipilih.")
+    await service.send_reply(chat_id, "Sekarang, silakan kirimkan **deskripsi PRD** Anda.")
+
+
+async def _run(api_url: str, updates: int, concurrency: int, shared: bool):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    client = create_http_client() if shared else None
+
+    async def worker(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            if shared:
+                await _one_update(TelegramService(client, api_url), i)
+            else:
+                async with httpx.AsyncClient() as per_update_client:
+                    await _one_update(TelegramService(per_update_client, api_url), i)
+            samples.append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(updates)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if client:
+            await client.aclose()
+    return {**summarize(samples), "updates_per_s": round(updates / elapsed, 2)}
+
+
+async def main(args):
+    async def bench(api_url: str):
+        return {
+            "per_update_client": await _run(api_url, args.updates, args.concurrency, shared=False),
+            "shared_client": await _run(api_url, args.updates, args.concurrency, shared=True),
+        }
+
+    if args.api_url:
+        results = await bench(args.api_url)
+    else:
+        app = create_fake_telegram_app(latency=args.latency)
+        async with BackgroundServer(app) as server:
+            results = await bench(f"{server.url}/bot{FAKE_TOKEN}")
+
+    dump({"benchmark": "telegram_client", "updates": args.updates, "concurrency": args.concurrency, **results})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latensi buatan Bot API palsu (detik)")
+    parser.add_argument("--api-url", default=None, help="Base URL Bot API sungguhan (default: server palsu lokal)")
+    asyncio.run(main(parser.parse_args()))
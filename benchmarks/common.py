@@ -0,0 +1,65 @@
+# benchmarks/common.py
+"""Utilitas bersama untuk skrip benchmark (statistik & server latar)."""
+import asyncio
+import json
+import statistics
+import sys
+from typing import Any, Dict, List
+
+import uvicorn
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Persentil sederhana (nearest-rank) dari daftar sampel."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Ringkasan latensi dalam milidetik."""
+    ms = [s * 1000 for s in samples]
+    return {
+        "count": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def dump(result: Dict[str, Any]):
+    """Menulis hasil benchmark sebagai JSON ke stdout (mudah diproses CI)."""
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+class BackgroundServer:
+    """Menjalankan aplikasi ASGI dengan uvicorn di task asyncio (port acak)."""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0):
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.host = host
+        self.port = port
+        self._task = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            if self._task.done():
+                self._task.result() # Lempar error start-up jika ada
+            await asyncio.sleep(0.01)
+        self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.should_exit = True
+        await self._task
@@ -0,0 +1,229 @@
+# benchmarks/fake_llm.py
+"""
+Chat model palsu pengganti ChatGoogleGenerativeAI untuk benchmark offline.
+Mendukung tool calling (untuk AgentExecutor), output terstruktur
+(`with_structured_output` dengan skema pydantic), streaming, latensi buatan,
+injeksi error penyedia & latensi ekor, dan menghitung jumlah panggilan
+serta token input/output.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import BaseModel
+
+import agent_logic
+from observability import llm_metrics_handler
+
+
+def count_tokens(text: str) -> int:
+    """Perkiraan kasar token (~4 karakter per token), cukup untuk perbandingan relatif."""
+    return max(1, len(text) // 4)
+
+
+class FakeProviderError(ConnectionError):
+    """Error sementara buatan (setara 503 / koneksi putus dari penyedia model)."""
+
+
+def _fake_testcases(context: str, cases: int) -> str:
+    is_bdd = "BDD" in context or "Gherkin" in context
+    blocks = []
+    for i in range(1, cases + 1):
+        if is_bdd:
+            blocks.append(
+                f"Scenario: Skenario {i}\n"
+                f"  Given pengguna berada di halaman fitur {i}\n"
+                f"  When pengguna melakukan aksi {i}\n"
+                f"  Then sistem menampilkan hasil yang sesuai {i}"
+            )
+        else:
+            blocks.append(
+                f"Test Case {i}: Validasi fitur {i}\n"
+                f"Deskripsi: Memastikan fitur {i} berjalan sesuai PRD.\n"
+                f"Prekondisi: Pengguna sudah login.\n"
+                f"Langkah: 1. Buka fitur {i} 2. Isi data valid 3. Simpan\n"
+                f"Hasil: Data tersimpan dan notifikasi sukses muncul."
+            )
+    header = "Feature: Fitur dari PRD\n\n" if is_bdd else ""
+    return header + "\n\n".join(blocks)
+
+
+def _fake_structured(schema: type, context: str, cases: int) -> Dict[str, Any]:
+    """Argumen tool call untuk skema bagian PRD; judul memuat nama bagian agar tidak dianggap duplikat."""
+    match = re.search(r"BAGIAN PRD: (.+)", context)
+    section = match.group(1).strip() if match else "PRD"
+    if "scenarios" in schema.model_fields:
+        return {"scenarios": [
+            {"name": f"{section} - skenario {i}",
+             "given": [f"pengguna berada di halaman {section}"],
+             "when": [f"pengguna melakukan aksi {i}"],
+             "then": [f"sistem menampilkan hasil yang sesuai {i}"]}
+            for i in range(1, cases + 1)
+        ]}
+    return {"test_cases": [
+        {"title": f"{section} - validasi {i}",
+         "description": f"Memastikan {section} berjalan sesuai PRD.",
+         "preconditions": ["Pengguna sudah login."],
+         "steps": [f"Buka {section}", "Isi data valid", "Simpan"],
+         "expected_result": "Data tersimpan dan notifikasi sukses muncul."}
+        for i in range(1, cases + 1)
+    ]}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Model palsu: latensi = latency + output_tokens / tokens_per_second.
+    Dengan peluang `failure_rate` panggilan gagal (FakeProviderError) setelah `latency`;
+    dengan peluang `slow_rate` latensinya ditambah `slow_latency` (latensi ekor).
+    """
+
+    latency: float = 0.2
+    tokens_per_second: float = 2000.0
+    cases: int = 8
+    failure_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    model_name: str = "fake-gemini"
+    stats: Dict[str, int] = {}
+    tools: List[Any] = []
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.stats = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "failures": 0}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_model_name"] = self.model_name # Label model di metrik LLM
+        return params
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tools": list(tools), "stats": self.stats})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt = "\n".join(str(m.content) for m in messages)
+        tool_outputs = [m for m in messages if isinstance(m, ToolMessage)]
+
+        schemas = [t for t in self.tools if isinstance(t, type) and issubclass(t, BaseModel)]
+
+        if schemas:
+            # with_structured_output: satu tool call berisi objek skema
+            message = AIMessage(content="", tool_calls=[{
+                "name": schemas[0].__name__,
+                "args": _fake_structured(schemas[0], prompt, self.cases),
+                "id": uuid.uuid4().hex,
+            }])
+        elif self.tools and not tool_outputs:
+            # Langkah perencanaan agent: panggil create_testcase
+            fmt = "bdd" if "'bdd'" in prompt else "steps"
+            message = AIMessage(content="", tool_calls=[{
+                "name": "create_testcase",
+                "args": {"prd_context": str(messages[-1].content), "format": fmt},
+                "id": uuid.uuid4().hex,
+            }])
+        elif tool_outputs:
+            # Langkah akhir agent: menyatakan ulang hasil tool
+            message = AIMessage(content=f"Berikut test case Anda:\n\n{tool_outputs[-1].content}")
+        else:
+            message = AIMessage(content=_fake_testcases(prompt, self.cases))
+
+        input_tokens = count_tokens(prompt)
+        if message.content:
+            output_tokens = count_tokens(str(message.content))
+        else:
+            output_tokens = count_tokens(json.dumps([call["args"] for call in message.tool_calls], ensure_ascii=False))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        self.stats["calls"] += 1
+        self.stats["input_tokens"] += input_tokens
+        self.stats["output_tokens"] += output_tokens
+        return message
+
+    def _first_byte(self) -> float:
+        if self.slow_rate and random.random() < self.slow_rate:
+            return self.latency + self.slow_latency
+        return self.latency
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            raise FakeProviderError(f"{self.model_name}: 503 Service Unavailable (buatan)")
+
+    def _output_delay(self, message: AIMessage) -> float:
+        return message.usage_metadata["output_tokens"] / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._first_byte())
+        self._maybe_fail()
+        message = self._reply(messages)
+        time.sleep(self._output_delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._first_byte())
+        self._maybe_fail()
+        message = self._reply(messages)
+        await asyncio.sleep(self._output_delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._first_byte())
+        self._maybe_fail()
+        message = self._reply(messages)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            ))
+            return
+
+        text = str(message.content)
+        step = 64
+        for start in range(0, len(text), step):
+            piece = text[start:start + step]
+            await asyncio.sleep(count_tokens(piece) / self.tokens_per_second)
+            last = start + step >= len(text)
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=piece,
+                usage_metadata=message.usage_metadata if last else None,
+            ))
+
+
+def router_models() -> List[str]:
+    """Semua model yang bisa dipilih router: utama, tier cepat, dan cadangan."""
+    settings = agent_logic.settings
+    return list(dict.fromkeys(m for m in (settings.model, settings.model_fast, *settings.model_fallbacks) if m))
+
+
+def install_fake_models(
+    fake: Optional[FakeChatModel] = None,
+    temperatures=(0, 0.1),
+    models: Optional[List[str]] = None
+) -> FakeChatModel:
+    """
+    Mengganti client di registry agent_logic dengan model palsu (untuk semua temperature).
+    Default dipasang untuk semua model router agar tier cepat & cadangan juga tidak ke jaringan.
+    """
+    fake = fake or FakeChatModel()
+    fake.callbacks = [llm_metrics_handler] # Sama seperti client asli, agar /metrics terisi
+    for model in models or router_models():
+        for temperature in temperatures:
+            agent_logic._chat_models[(model, temperature)] = fake
+    return fake
@@ -0,0 +1,162 @@
+# benchmarks/fake_telegram.py
+"""Bot API Telegram palsu untuk benchmark dan uji lokal tanpa jaringan."""
+import asyncio
+import email
+import os
+import itertools
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+FAKE_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "123456:FAKE")
+
+
+SENDING_METHODS = ("sendMessage", "editMessageText", "sendDocument")
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Dict[str, Any]:
+    """Form multipart (sendDocument) tanpa python-multipart: field teks & ukuran file."""
+    message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    payload: Dict[str, Any] = {}
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        data = part.get_payload(decode=True) or b""
+        if part.get_filename():
+            payload[name] = {"filename": part.get_filename(), "size": len(data)}
+        else:
+            payload[name] = data.decode("utf-8")
+    if "chat_id" in payload:
+        payload["chat_id"] = int(payload["chat_id"])
+    return payload
+
+
+def create_fake_telegram_app(
+    latency: float = 0.0,
+    rate_limits: Optional[Tuple[int, int]] = None,
+    retry_after: int = 1
+) -> FastAPI:
+    """
+    Membuat app yang meniru endpoint `/bot<token>/<method>`.
+    Setiap panggilan dicatat di `app.state.calls` sebagai (waktu, method, payload).
+    File untuk getFile/unduhan didaftarkan di `app.state.files` (file_id -> bytes).
+    Update untuk getUpdates (long polling) ditambahkan dengan `push_update`.
+    Seperti Telegram, teks > 4096 karakter ditolak (400). `rate_limits=(global, per_chat)`
+    membatasi kiriman per detik (jendela geser 1 detik) dan membalas 429 + `retry_after`;
+    penolakan dicatat di `app.state.rejected` sebagai (waktu, method, kode).
+    """
+    app = FastAPI(title="Fake Telegram Bot API")
+    app.state.calls = []
+    app.state.rejected = []
+    sent_global: deque = deque()
+    sent_chat: Dict[Any, deque] = {}
+    app.state.files = {}
+    app.state.updates = [] # Antrian getUpdates yang belum dikonfirmasi
+    app.state.offset = 0 # Offset terakhir yang dikirim bot (update_id < offset = terkonfirmasi)
+    app.state.updates_changed = asyncio.Condition()
+    app.state.update_ids = itertools.count(1)
+    message_ids = itertools.count(1000)
+
+    @app.get("/file/bot{token}/documents/{file_id}")
+    async def download_file(token: str, file_id: str) -> Response:
+        if file_id not in app.state.files:
+            raise HTTPException(status_code=404)
+        return Response(content=app.state.files[file_id], media_type="application/octet-stream")
+
+    @app.post("/bot{token}/{method}")
+    async def bot_method(token: str, method: str, request: Request) -> Dict[str, Any]:
+        body = await request.body()
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/"):
+            payload = _parse_multipart(content_type, body)
+        else:
+            payload = await request.json() if body else {}
+        if latency:
+            await asyncio.sleep(latency)
+        now = time.perf_counter()
+        app.state.calls.append((now, method, payload))
+
+        if method in ("sendMessage", "editMessageText") and len(payload.get("text", "")) > 4096:
+            app.state.rejected.append((now, method, 400))
+            return JSONResponse(
+                {"ok": False, "error_code": 400, "description": "Bad Request: message is too long"}, status_code=400
+            )
+        if rate_limits and method in SENDING_METHODS:
+            chat_window = sent_chat.setdefault(payload.get("chat_id"), deque())
+            for window in (sent_global, chat_window):
+                while window and now - window[0] > 1.0:
+                    window.popleft()
+            if len(sent_global) >= rate_limits[0] or len(chat_window) >= rate_limits[1]:
+                app.state.rejected.append((now, method, 429))
+                return JSONResponse({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, status_code=429)
+            sent_global.append(now)
+            chat_window.append(now)
+
+        if method in SENDING_METHODS:
+            result: Any = {
+                "message_id": payload.get("message_id") or next(message_ids),
+                "chat": {"id": payload.get("chat_id")},
+                "text": payload.get("text"),
+            }
+        elif method == "getUpdates":
+            result = await _get_updates(app, payload)
+        elif method == "getFile":
+            file_id = payload.get("file_id")
+            if file_id not in app.state.files:
+                return {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(app.state.files[file_id]),
+                "file_path": f"documents/{file_id}",
+            }
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    return app
+
+
+async def _get_updates(app: FastAPI, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Semantik getUpdates: offset mengonfirmasi update lama, lalu long poll hingga `timeout` detik."""
+    offset = payload.get("offset", 0)
+    condition = app.state.updates_changed
+    async with condition:
+        if offset > app.state.offset:
+            app.state.offset = offset
+            app.state.updates = [u for u in app.state.updates if u["update_id"] >= offset]
+            condition.notify_all()
+
+        def available() -> List[Dict[str, Any]]:
+            return [u for u in app.state.updates if u["update_id"] >= offset]
+
+        try:
+            await asyncio.wait_for(condition.wait_for(available), payload.get("timeout", 0) or 0.001)
+        except asyncio.TimeoutError:
+            pass
+        return available()[:payload.get("limit", 100)]
+
+
+async def push_update(app: FastAPI, update: Dict[str, Any]) -> int:
+    """
+    Menambahkan update yang akan diterima bot lewat getUpdates. Seperti Telegram,
+    update_id diberikan server secara berurutan saat update masuk; nilainya dikembalikan.
+    """
+    async with app.state.updates_changed:
+        update["update_id"] = next(app.state.update_ids)
+        app.state.updates.append(update)
+        app.state.updates_changed.notify_all()
+        return update["update_id"]
+
+
+async def wait_confirmed(app: FastAPI, update_id: int):
+    """Menunggu hingga bot mengonfirmasi update (offset getUpdates berikutnya melewatinya)."""
+    async with app.state.updates_changed:
+        await app.state.updates_changed.wait_for(lambda: app.state.offset > update_id)
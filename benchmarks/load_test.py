@@ -0,0 +1,300 @@
+# benchmarks/load_test.py
+"""
+Load test offline untuk `main.app` tanpa Telegram, Gemini, maupun Redis sungguhan.
+
+- Bot API  : server Telegram palsu lokal (benchmarks.fake_telegram)
+- Gemini   : FakeChatModel dengan latensi & laju token yang bisa diatur
+- Redis    : fakeredis untuk StateService (default), atau Redis lokal via --redis-url
+
+Load generator memulai sesi chat dengan laju target (open-loop). Setiap sesi
+mengirim campuran update realistis: /start, /create-testcase, callback format:*,
+lalu teks PRD. Hasil (throughput, p50/p95/p99 latensi webhook & end-to-end)
+ditulis sebagai JSON ke stdout atau --output.
+
+Dengan --mode polling, update tidak di-POST ke webhook tetapi diantrikan di
+Bot API palsu dan diambil PollingRunner lewat getUpdates. Latensi "webhook"
+pada mode ini adalah waktu hingga update dikonfirmasi (offset melewatinya).
+
+Pemakaian (dari root repo):
+    python -m benchmarks.load_test --rate 20 --duration 30
+    python -m benchmarks.load_test --rate 20 --duration 30 --mode polling
+    python -m benchmarks.load_test --redis-url redis://localhost:6379/15 --output load.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import BackgroundServer, summarize
+from benchmarks.fake_llm import FakeChatModel, install_fake_models
+from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app, push_update, wait_confirmed
+
+SAMPLE_PRDS = [
+    "Fitur Login: pengguna masuk dengan email & password. Akun dikunci setelah 5 kali gagal.",
+    "Fitur Keranjang: pengguna menambah, mengubah jumlah, dan menghapus produk. Stok divalidasi.",
+    "Fitur Checkout: pembayaran kartu, e-wallet, dan transfer bank. Voucher opsional.",
+    "Fitur Profil: pengguna mengubah nama, foto, dan nomor telepon dengan verifikasi OTP.",
+]
+
+# Bobot jenis sesi: alur PRD lengkap, hanya /start, hanya /help
+SESSION_MIX = {"prd_flow": 0.6, "start_only": 0.2, "help_only": 0.2}
+
+
+class LoadGenerator:
+    def __init__(self, webhook_url: str, fake_app, seed: int, polling: bool = False):
+        self.webhook_url = webhook_url
+        self.fake_app = fake_app
+        self.polling = polling
+        self.random = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.chat_ids = itertools.count(10_000)
+        self.webhook_latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self.prd_sent_at: Dict[int, float] = {}
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {"message_id": next(self.update_ids), "chat": {"id": chat_id}, "text": text},
+        }
+
+    def _callback(self, chat_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": f"cb-{chat_id}",
+                "data": data,
+                "message": {"message_id": 1, "chat": {"id": chat_id}},
+            },
+        }
+
+    async def _post(self, client: httpx.AsyncClient, kind: str, update: dict):
+        start = time.perf_counter()
+        try:
+            if self.polling:
+                await wait_confirmed(self.fake_app, await push_update(self.fake_app, update))
+            else:
+                response = await client.post(self.webhook_url, json=update)
+                if response.status_code != 200:
+                    self.errors += 1
+        except Exception:
+            self.errors += 1
+        self.webhook_latency[kind].append(time.perf_counter() - start)
+
+    async def session(self, client: httpx.AsyncClient, think_time: float):
+        chat_id = next(self.chat_ids)
+        kind = self.random.choices(list(SESSION_MIX), weights=list(SESSION_MIX.values()))[0]
+        await self._post(client, "start", self._message(chat_id, "/start"))
+        if kind == "help_only":
+            await self._post(client, "help", self._message(chat_id, "/help"))
+            return
+        if kind == "start_only":
+            return
+
+        await asyncio.sleep(think_time)
+        await self._post(client, "create_testcase", self._message(chat_id, "/create-testcase"))
+        await asyncio.sleep(think_time)
+        fmt = self.random.choice(["steps", "bdd"])
+        await self._post(client, "callback_format", self._callback(chat_id, f"format:{fmt}"))
+        await asyncio.sleep(think_time)
+        self.prd_sent_at[chat_id] = time.perf_counter()
+        await self._post(client, "prd", self._message(chat_id, self.random.choice(SAMPLE_PRDS)))
+
+    def end_to_end(self) -> Dict[str, dict]:
+        """Latensi dari PRD terkirim hingga balasan pertama & terakhir tiba di Bot API palsu."""
+        replies = defaultdict(list)
+        for timestamp, method, payload in self.fake_app.state.calls:
+            if method in ("sendMessage", "editMessageText", "sendDocument"):
+                replies[payload.get("chat_id")].append(timestamp)
+
+        first, last = [], []
+        for chat_id, sent_at in self.prd_sent_at.items():
+            after = [t for t in replies.get(chat_id, []) if t >= sent_at]
+            if after:
+                first.append(after[0] - sent_at)
+                last.append(after[-1] - sent_at)
+        return {
+            "prd_sessions": len(self.prd_sent_at),
+            "completed": len(last),
+            "first_reply": summarize(first),
+            "complete_reply": summarize(last),
+        }
+
+    def pending(self) -> int:
+        """Jumlah sesi PRD yang belum menerima balasan."""
+        answered = {
+            payload.get("chat_id")
+            for timestamp, method, payload in self.fake_app.state.calls
+            if method in ("sendMessage", "editMessageText", "sendDocument")
+            and timestamp >= self.prd_sent_at.get(payload.get("chat_id"), float("inf"))
+        }
+        return len(set(self.prd_sent_at) - answered)
+
+
+def _configure_app(args, fake_url: str):
+    """Mengarahkan aplikasi ke stand-in lokal sebelum lifespan berjalan."""
+    from config import settings
+    settings.telegram_api_url = f"{fake_url}/bot{FAKE_TOKEN}"
+    settings.testcase_direct_mode = not args.agent_mode
+    settings.testcase_streaming = not args.no_streaming
+    settings.testcase_cache_enabled = args.cache
+    settings.job_worker_concurrency = args.workers
+    settings.job_run_in_process = True
+    if not args.redis_url:
+        settings.job_backend = "memory"
+        settings.memory_backend = "memory"
+
+    import agent_logic
+    import main
+    from state_service import StateService, get_state_service
+    from update_dedup import UpdateDeduplicator, get_update_deduplicator
+
+    install_fake_models(FakeChatModel(
+        latency=args.llm_latency, tokens_per_second=args.tokens_per_second, cases=args.cases
+    ))
+    agent_logic.agent_executor_instance = agent_logic.get_qa_agent_executor()
+    agent_logic.agent_executor_instance.verbose = False
+
+    if not args.redis_url:
+        import fakeredis
+        fake_redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+        async def get_fake_state_service():
+            yield StateService(fake_redis)
+
+        fake_deduplicator = UpdateDeduplicator(
+            fake_redis, settings.update_dedup_local_size, settings.update_dedup_ttl
+        )
+        main.app.dependency_overrides[get_state_service] = get_fake_state_service
+        main.app.dependency_overrides[get_update_deduplicator] = lambda: fake_deduplicator
+    return main.app
+
+
+def _create_polling_runner(app, redis_url: str):
+    """PollingRunner memakai antrian & worker milik `app` (dibuat lifespan) serta Redis/fakeredis yang sama."""
+    from config import settings
+    from polling_runner import PollingRunner, RedisOffsetStore
+    from state_service import StateService
+    from telegram_service import TelegramService
+    from update_dedup import UpdateDeduplicator
+
+    if redis_url:
+        import redis.asyncio as redis
+        client = redis.Redis.from_url(redis_url, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return PollingRunner(
+        TelegramService(app.state.telegram_http_client),
+        RedisOffsetStore(client),
+        app.state.job_queue,
+        app.state.memory_service,
+        StateService(client),
+        UpdateDeduplicator(client, settings.update_dedup_local_size, settings.update_dedup_ttl),
+        settings.polling_batch_size,
+        settings.polling_timeout,
+        settings.polling_concurrency
+    )
+
+
+async def main(args):
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url # Harus sebelum state_service diimpor
+
+    fake_app = create_fake_telegram_app(latency=args.telegram_latency)
+    async with BackgroundServer(fake_app) as fake_server:
+        app = _configure_app(args, fake_server.url)
+        logging.getLogger().setLevel(logging.WARNING)
+
+        async with BackgroundServer(app) as app_server:
+            polling = args.mode == "polling"
+            generator = LoadGenerator(f"{app_server.url}/webhook/telegram", fake_app, args.seed, polling)
+            stop_polling = asyncio.Event()
+            polling_task = None
+            if polling:
+                runner = _create_polling_runner(app, args.redis_url)
+                polling_task = asyncio.create_task(runner.run(stop_polling))
+            limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+            async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+                sessions = []
+                start = time.perf_counter()
+                interval = 1.0 / args.rate
+                for i in range(int(args.rate * args.duration)):
+                    # Open-loop: sesi dimulai sesuai jadwal, tidak menunggu sesi sebelumnya
+                    delay = start + i * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    sessions.append(asyncio.create_task(generator.session(client, args.think_time)))
+                await asyncio.gather(*sessions)
+                load_elapsed = time.perf_counter() - start
+
+            # Tunggu worker menyelesaikan antrian PRD
+            deadline = time.perf_counter() + args.drain_timeout
+            while generator.pending() and time.perf_counter() < deadline:
+                await asyncio.sleep(0.2)
+            await asyncio.sleep(args.stream_settle) # Beri waktu edit streaming terakhir
+            if polling_task:
+                stop_polling.set()
+                await polling_task
+
+    all_webhook = [sample for samples in generator.webhook_latency.values() for sample in samples]
+    result = {
+        "benchmark": "load_test",
+        "config": {
+            "mode": args.mode,
+            "rate_sessions_per_s": args.rate,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "direct_mode": not args.agent_mode,
+            "streaming": not args.no_streaming,
+            "llm_latency_s": args.llm_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "redis": args.redis_url or "fakeredis",
+        },
+        "throughput": {
+            "webhook_requests": len(all_webhook),
+            "webhook_requests_per_s": round(len(all_webhook) / load_elapsed, 2),
+            "errors": generator.errors,
+        },
+        "webhook_latency": summarize(all_webhook),
+        "webhook_latency_by_update": {kind: summarize(samples) for kind, samples in generator.webhook_latency.items()},
+        "end_to_end": generator.end_to_end(),
+    }
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook", help="Jalur masuk update")
+    parser.add_argument("--rate", type=float, default=10.0, help="Sesi chat baru per detik")
+    parser.add_argument("--duration", type=float, default=10.0, help="Lama pembangkitan beban (detik)")
+    parser.add_argument("--think-time", type=float, default=0.05, help="Jeda antar update dalam satu sesi")
+    parser.add_argument("--workers", type=int, default=8, help="Jumlah job worker in-process")
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--cases", type=int, default=8)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--agent-mode", action="store_true", help="Pakai AgentExecutor, bukan mode langsung")
+    parser.add_argument("--no-streaming", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="Aktifkan cache hasil test case")
+    parser.add_argument("--redis-url", default=None, help="Redis lokal (default: fakeredis + antrian memori)")
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--stream-settle", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Tulis hasil JSON ke file ini")
+    asyncio.run(main(parser.parse_args()))
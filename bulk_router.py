@@ -0,0 +1,81 @@
+# bulk_router.py
+import hmac
+import uuid
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from bulk_service import BatchConflictError, BulkRequest, BulkRunner, get_bulk_runner
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/bulk",
+    tags=["bulk"]
+)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# --- Autentikasi ---
+def verify_bulk_token(authorization: Optional[str] = Header(None)):
+    """API bulk untuk CI: `Authorization: Bearer <BULK_API_TOKEN>`. Nonaktif jika token tidak diatur."""
+    if not settings.bulk_api_token:
+        raise HTTPException(status_code=503, detail="Bulk API nonaktif (BULK_API_TOKEN belum diatur).")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token, settings.bulk_api_token):
+        raise HTTPException(status_code=401, detail="Token tidak valid.")
+
+# --- Helper ---
+async def _ndjson(lines: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for line in lines:
+        yield orjson.dumps(line) + b"\n"
+
+async def _stream_batch(runner: BulkRunner, batch_id: str, items, concurrency: Optional[int]) -> StreamingResponse:
+    """
+    Klaim batch lalu stream hasilnya; 409 jika batch sedang dijalankan request lain.
+    Klaim dilepas oleh runner di akhir stream, dan juga lewat background task respons
+    untuk kasus klien putus sebelum body mulai dikirim (runner tidak pernah berjalan).
+    Jika keduanya terlewat (proses mati), lock kedaluwarsa setelah BULK_LOCK_TTL tanpa heartbeat.
+    """
+    token = await runner.store.acquire(batch_id)
+    if token is None:
+        raise HTTPException(status_code=409, detail=f"Batch {batch_id} sedang berjalan.")
+    return StreamingResponse(
+        _ndjson(runner.run(batch_id, items, token, concurrency)),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Batch-Id": batch_id},
+        background=BackgroundTask(runner.store.release, batch_id, token)
+    )
+
+# --- Endpoint ---
+@router.post("/testcases", dependencies=[Depends(verify_bulk_token)])
+async def create_bulk_testcases(request: BulkRequest, runner: BulkRunner = Depends(get_bulk_runner)):
+    """
+    Membuat test case untuk sekumpulan PRD secara paralel (dibatasi `BULK_MAX_CONCURRENCY`).
+    Respons NDJSON di-stream: baris `batch`, satu baris `result` per item begitu selesai, lalu `summary`.
+    Kirim ulang dengan `batch_id` & item yang sama untuk melanjutkan batch yang terputus.
+    """
+    if len(request.items) > settings.bulk_max_items:
+        raise HTTPException(status_code=413, detail=f"Maksimal {settings.bulk_max_items} PRD per batch.")
+    batch_id = request.batch_id or uuid.uuid4().hex
+    try:
+        resumed = await runner.prepare(batch_id, request.items)
+    except BatchConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Batch bulk {batch_id}: {len(request.items)} PRD ({'lanjutan' if resumed else 'baru'}).")
+    return await _stream_batch(runner, batch_id, request.items, request.concurrency)
+
+@router.get("/testcases/{batch_id}", dependencies=[Depends(verify_bulk_token)])
+async def resume_bulk_testcases(
+    batch_id: str,
+    concurrency: Optional[int] = Query(None, ge=1),
+    runner: BulkRunner = Depends(get_bulk_runner)
+):
+    """Melanjutkan batch dari item yang tersimpan: hasil yang sudah ada dikirim ulang, sisanya diproses."""
+    batch = await runner.store.load(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} tidak ditemukan atau kedaluwarsa.")
+    return await _stream_batch(runner, batch_id, batch["items"], concurrency)
@@ -0,0 +1,365 @@
+# bulk_service.py
+import time
+import asyncio
+import uuid
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+import orjson
+from cachetools import TTLCache
+from fastapi import Request
+from pydantic import BaseModel, Field
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+from config import settings
+from agent_logic import PROMPT_VERSION, generate_testcase
+from state_service import get_redis_pool
+from model_router import get_model_router, track_served_models
+from testcase_cache import TestcaseCache, make_cache_key
+from token_counter import count_tokens
+from observability import BULK_IN_FLIGHT, BULK_ITEMS, STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+# --- Model Permintaan ---
+class BulkItem(BaseModel):
+    """Satu PRD dalam batch."""
+    id: Optional[str] = Field(None, max_length=128) # Id milik pemanggil (default: indeks)
+    prd_text: str = Field(..., min_length=1)
+    format: str = Field("steps", pattern="^(?i:steps|bdd)$")
+
+class BulkRequest(BaseModel):
+    """Batch PRD dari CI. `batch_id` yang sama dengan item yang sama melanjutkan batch sebelumnya."""
+    batch_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_.\-]{1,64}$")
+    items: List[BulkItem] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+def items_fingerprint(items: List[BulkItem]) -> str:
+    """Sidik jari isi batch: resume hanya diizinkan untuk item yang sama persis."""
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(orjson.dumps([item.id, item.format.lower(), item.prd_text]))
+    return digest.hexdigest()
+
+
+class BatchConflictError(Exception):
+    """batch_id sudah dipakai untuk item lain, atau sedang dijalankan oleh request lain."""
+
+
+# --- Penyimpanan Batch ---
+class BaseBatchStore(ABC):
+    """
+    Menyimpan item & hasil per item sebuah batch agar batch yang terputus
+    (CI timeout, koneksi putus, deploy) bisa dilanjutkan dengan batch_id yang sama.
+    Hanya hasil sukses yang disimpan: item gagal dijalankan ulang saat resume.
+    """
+
+    @abstractmethod
+    async def create(self, batch_id: str, items: List[BulkItem]) -> bool:
+        """Menyimpan batch baru. False jika batch_id sudah ada (item tidak ditimpa)."""
+        pass
+
+    @abstractmethod
+    async def load(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """{'fingerprint', 'items'} batch, atau None jika tidak ada / kedaluwarsa."""
+        pass
+
+    @abstractmethod
+    async def completed(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        """Hasil yang sudah selesai, per indeks item."""
+        pass
+
+    @abstractmethod
+    async def save_result(self, batch_id: str, index: int, result: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    async def acquire(self, batch_id: str) -> Optional[str]:
+        """Klaim eksklusif menjalankan batch: token klaim, atau None jika sedang dijalankan request lain."""
+        pass
+
+    @abstractmethod
+    async def renew(self, batch_id: str, token: str) -> bool:
+        """Memperpanjang klaim (heartbeat); False jika klaim sudah bukan milik token ini."""
+        pass
+
+    @abstractmethod
+    async def release(self, batch_id: str, token: str):
+        """Melepas klaim hanya jika masih milik token ini (aman dipanggil lebih dari sekali)."""
+        pass
+
+
+class InMemoryBatchStore(BaseBatchStore):
+    """Implementasi dalam memori proses (untuk lokal/test); resume hanya di proses yang sama."""
+
+    def __init__(self, max_batches: int, ttl_seconds: int):
+        self.batches: TTLCache = TTLCache(maxsize=max_batches, ttl=ttl_seconds)
+        self.running: Dict[str, str] = {} # batch_id -> token klaim
+        logger.info("Menggunakan InMemory Batch Store")
+
+    async def create(self, batch_id: str, items: List[BulkItem]) -> bool:
+        if batch_id in self.batches:
+            return False
+        self.batches[batch_id] = {
+            "fingerprint": items_fingerprint(items),
+            "items": [item.model_copy() for item in items],
+            "results": {}
+        }
+        return True
+
+    async def load(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self.batches.get(batch_id)
+        return {"fingerprint": batch["fingerprint"], "items": batch["items"]} if batch else None
+
+    async def completed(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        batch = self.batches.get(batch_id)
+        return dict(batch["results"]) if batch else {}
+
+    async def save_result(self, batch_id: str, index: int, result: Dict[str, Any]):
+        batch = self.batches.get(batch_id)
+        if batch:
+            batch["results"][index] = result
+
+    async def acquire(self, batch_id: str) -> Optional[str]:
+        if batch_id in self.running:
+            return None
+        token = self.running[batch_id] = uuid.uuid4().hex
+        return token
+
+    async def renew(self, batch_id: str, token: str) -> bool:
+        return self.running.get(batch_id) == token
+
+    async def release(self, batch_id: str, token: str):
+        if self.running.get(batch_id) == token:
+            del self.running[batch_id]
+
+
+class RedisBatchStore(BaseBatchStore):
+    """
+    Batch di Redis, dibagi antar worker (resume bisa mendarat di proses mana pun):
+    - `bot:bulk:{batch_id}`         : fingerprint & item (orjson), dibuat atomik dengan `SET NX`
+    - `bot:bulk:{batch_id}:results` : hash indeks -> hasil (orjson)
+    - `bot:bulk:{batch_id}:lock`    : token klaim (`SET NX EX`), diperpanjang heartbeat runner
+    """
+
+    def __init__(self, client: redis.Redis, ttl_seconds: int, lock_ttl_seconds: int, cas_retries: int = 5):
+        self.client = client
+        self.cas_retries = cas_retries
+        self.ttl_seconds = ttl_seconds
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.prefix = "bot:bulk:"
+
+    def _key(self, batch_id: str, suffix: str = "") -> str:
+        return f"{self.prefix}{batch_id}{suffix}"
+
+    async def create(self, batch_id: str, items: List[BulkItem]) -> bool:
+        value = orjson.dumps({
+            "fingerprint": items_fingerprint(items),
+            "items": [item.model_dump() for item in items]
+        })
+        return bool(await self.client.set(self._key(batch_id), value, nx=True, ex=self.ttl_seconds))
+
+    async def load(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self._key(batch_id))
+        if not raw:
+            return None
+        data = orjson.loads(raw)
+        return {
+            "fingerprint": data["fingerprint"],
+            "items": [BulkItem.model_validate(item) for item in data["items"]]
+        }
+
+    async def completed(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        raw = await self.client.hgetall(self._key(batch_id, ":results"))
+        return {int(index): orjson.loads(value) for index, value in raw.items()}
+
+    async def save_result(self, batch_id: str, index: int, result: Dict[str, Any]):
+        results_key = self._key(batch_id, ":results")
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(results_key, str(index), orjson.dumps(result))
+            pipe.expire(results_key, self.ttl_seconds)
+            await pipe.execute()
+
+    async def acquire(self, batch_id: str) -> Optional[str]:
+        # TTL: lock dari proses yang mati (atau response yang tidak pernah dimulai) tidak mengunci batch selamanya
+        token = uuid.uuid4().hex
+        if await self.client.set(self._key(batch_id, ":lock"), token, nx=True, ex=self.lock_ttl_seconds):
+            return token
+        return None
+
+    async def _if_owner(self, batch_id: str, token: str, renew: bool) -> bool:
+        """Perpanjang / hapus lock dalam satu transaksi dengan pengecekan token (WATCH)."""
+        lock_key = self._key(batch_id, ":lock")
+        async with self.client.pipeline(transaction=True) as pipe:
+            for _ in range(self.cas_retries):
+                try:
+                    await pipe.watch(lock_key)
+                    if await pipe.get(lock_key) != token:
+                        await pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    if renew:
+                        pipe.expire(lock_key, self.lock_ttl_seconds)
+                    else:
+                        pipe.delete(lock_key)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+        return False
+
+    async def renew(self, batch_id: str, token: str) -> bool:
+        return await self._if_owner(batch_id, token, renew=True)
+
+    async def release(self, batch_id: str, token: str):
+        await self._if_owner(batch_id, token, renew=False)
+
+
+# --- Eksekusi Batch ---
+class BulkRunner:
+    """
+    Menjalankan item batch lewat pipeline create_testcase (mode langsung, termasuk chunked
+    & router model) dengan pool worker terbatas. Hasil dihasilkan begitu tiap item selesai
+    (urutan selesai, bukan urutan input) dan langsung disimpan agar batch bisa dilanjutkan.
+    """
+
+    def __init__(
+        self,
+        store: BaseBatchStore,
+        cache: Optional[TestcaseCache],
+        max_concurrency: int,
+        lock_renew_interval: float
+    ):
+        self.store = store
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.lock_renew_interval = lock_renew_interval
+
+    async def prepare(self, batch_id: str, items: List[BulkItem]) -> bool:
+        """Membuat batch atau memvalidasi resume. True jika batch sudah ada sebelumnya."""
+        if await self.store.create(batch_id, items):
+            return False
+        existing = await self.store.load(batch_id)
+        if existing and existing["fingerprint"] != items_fingerprint(items):
+            raise BatchConflictError(f"batch_id {batch_id} sudah dipakai untuk item yang berbeda.")
+        if existing is None: # Kedaluwarsa di antara create & load: buat ulang
+            await self.store.create(batch_id, items)
+        return True
+
+    async def _generate(self, item: BulkItem) -> Dict[str, Any]:
+        """Satu item: cache hasil test case dulu, lalu model. Error dikembalikan sebagai status."""
+        start = time.perf_counter()
+        tier_model = get_model_router().tier_model(count_tokens(item.prd_text), item.format)
+        cache_key = make_cache_key(item.prd_text, item.format, tier_model, PROMPT_VERSION)
+        try:
+            output = await self.cache.get(cache_key) if self.cache else None
+            cached = output is not None
+            if not cached:
+                with track_served_models() as served, STAGE_DURATION.time(stage="generation", op="bulk"):
+                    output = await generate_testcase(item.prd_text, item.format)
+                if self.cache and not served.degraded: # Hasil failover / hedge tidak di-cache
+                    await self.cache.set(cache_key, output)
+            return {"status": "ok", "output": output, "cached": cached,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            logger.error(f"Gagal membuat test case item bulk {item.id}: {e}")
+            return {"status": "error", "error": str(e),
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    async def _heartbeat(self, batch_id: str, token: str):
+        """Memperpanjang lock batch selama runner berjalan (item lambat tidak membuat lock kedaluwarsa)."""
+        while True:
+            await asyncio.sleep(self.lock_renew_interval)
+            try:
+                if not await self.store.renew(batch_id, token):
+                    logger.warning(f"Lock batch {batch_id} sudah tidak dimiliki runner ini.")
+                    return
+            except Exception as e:
+                logger.warning(f"Gagal memperpanjang lock batch {batch_id}: {e}")
+
+    async def run(
+        self,
+        batch_id: str,
+        items: List[BulkItem],
+        token: str,
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Menghasilkan baris NDJSON: header batch, hasil per item (yang tersimpan dulu, ditandai
+        `resumed`), lalu ringkasan. Dipanggil setelah `store.acquire` (`token` = klaimnya);
+        lock diperpanjang heartbeat selama berjalan dan dilepas di akhir.
+        Jika konsumen berhenti (klien putus), worker dibatalkan; hasil yang sudah selesai tetap tersimpan.
+        """
+        start = time.perf_counter()
+        workers_count = min(concurrency or self.max_concurrency, self.max_concurrency)
+        heartbeat = asyncio.create_task(self._heartbeat(batch_id, token))
+        try:
+            done = await self.store.completed(batch_id)
+            pending = [index for index in range(len(items)) if index not in done]
+            yield {"type": "batch", "batch_id": batch_id, "total": len(items),
+                   "resumed": len(done), "concurrency": workers_count}
+
+            counts = {"ok": 0, "error": 0, "resumed": len(done)}
+            for index in sorted(done):
+                BULK_ITEMS.inc(result="resumed")
+                yield {**done[index], "resumed": True}
+
+            work: asyncio.Queue = asyncio.Queue()
+            for index in pending:
+                work.put_nowait(index)
+            results: asyncio.Queue = asyncio.Queue()
+
+            async def worker():
+                while True:
+                    try:
+                        index = work.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    item = items[index]
+                    with BULK_IN_FLIGHT.track_inprogress():
+                        outcome = await self._generate(item)
+                    result = {"type": "result", "batch_id": batch_id, "index": index,
+                              "id": item.id or str(index), "format": item.format.lower(), **outcome}
+                    if outcome["status"] == "ok":
+                        try:
+                            await self.store.save_result(batch_id, index, result)
+                        except Exception as e:
+                            # Hasil tetap dikirim; hanya item ini yang akan diulang saat resume
+                            logger.error(f"Gagal menyimpan hasil item {index} batch {batch_id}: {e}")
+                    await results.put(result)
+
+            tasks = [asyncio.create_task(worker()) for _ in range(min(workers_count, len(pending)))]
+            try:
+                for _ in pending:
+                    result = await results.get()
+                    counts["ok" if result["status"] == "ok" else "error"] += 1
+                    BULK_ITEMS.inc(result="cached" if result.get("cached") else result["status"])
+                    yield {**result, "resumed": False}
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            yield {"type": "summary", "batch_id": batch_id, "total": len(items), **counts,
+                   "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+        finally:
+            heartbeat.cancel()
+            await self.store.release(batch_id, token)
+
+
+# --- Factory & Dependency ---
+def create_batch_store() -> BaseBatchStore:
+    """Membuat penyimpanan batch sesuai `settings.bulk_backend` ('redis' atau 'memory')."""
+    redis_pool = get_redis_pool() if settings.bulk_backend == "redis" else None
+    if not redis_pool:
+        return InMemoryBatchStore(settings.bulk_local_batches, settings.bulk_ttl)
+    return RedisBatchStore(redis.Redis(connection_pool=redis_pool), settings.bulk_ttl, settings.bulk_lock_ttl)
+
+def get_bulk_runner(request: Request) -> BulkRunner:
+    """Dependency: runner dengan store & cache hasil milik aplikasi (dibuat di lifespan main.py)."""
+    return BulkRunner(
+        request.app.state.batch_store,
+        request.app.state.testcase_cache,
+        settings.bulk_max_concurrency,
+        settings.bulk_lock_ttl / 3
+    )
@@ -1,5 +1,6 @@
 # config.py
 import os
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -11,6 +12,133 @@ class Settings(BaseSettings):
     telegram_api_url: str = f"https://api.telegram.org/bot{os.getenv('TELEGRAM_BOT_TOKEN')}"
     model: str = "gemini-2.5-pro"
     redis_url: str = os.getenv("REDIS_URL", "YOUR_FALLBACK_KEY")
+
+    openai_api_key: str = os.getenv("OPENAI_API_KEY", "") # Hanya untuk model cadangan 'openai:<nama>'
+
+    # --- Router model: tier per ukuran PRD, failover, retry, hedging ---
+    model_fast: str = "gemini-2.5-flash" # Kosongkan untuk mematikan tier cepat
+    # Batas token prompt per format agar memakai model cepat ('summary' = ringkasan memori)
+    model_fast_max_tokens: Dict[str, int] = {"steps": 1500, "bdd": 800, "summary": 8000}
+    model_fallbacks: List[str] = ["gemini-2.5-flash"] # Dicoba berurutan; 'openai:gpt-4o-mini' dsb.
+    model_max_attempts: int = 2 # Percobaan per model untuk error sementara (429/5xx/timeout)
+    model_timeout: float = 120.0
+    model_client_max_retries: int = 1 # Retry bawaan SDK dikecilkan: retry & failover diatur router
+    model_hedge_enabled: bool = False # Menggandakan panggilan lambat ke kandidat berikutnya (biaya token)
+    model_hedge_percentile: float = 95.0 # Hedge setelah latensi melewati persentil ini
+    model_hedge_min_samples: int = 20 # Sampel latensi minimal sebelum hedging aktif
+    model_breaker_threshold: int = 5 # Gagal berturut-turut sebelum model dipindah ke belakang
+    model_breaker_cooldown: float = 30.0
+    model_stats_window: int = 200
+
+    # --- HTTP client ke Bot API (satu pool untuk seluruh umur aplikasi) ---
+    telegram_max_connections: int = 100
+    telegram_max_keepalive_connections: int = 20
+    telegram_keepalive_expiry: float = 60.0
+    telegram_http2: bool = False # Butuh paket 'h2' (httpx[http2])
+    telegram_connect_timeout: float = 5.0
+    telegram_read_timeout: float = 15.0
+    telegram_write_timeout: float = 10.0
+    telegram_pool_timeout: float = 5.0
+
+    # --- Penjadwal kiriman keluar (batas Bot API: ~30 pesan/detik per bot, ~1/detik per chat) ---
+    delivery_enabled: bool = True
+    delivery_global_rate: float = 25.0 # Per proses; bagi jika ada beberapa proses worker
+    delivery_global_burst: float = 5.0
+    delivery_chat_rate: float = 1.0
+    delivery_chat_burst: float = 3.0 # Balasan interaktif singkat tetap langsung terkirim
+    delivery_max_chats: int = 10000
+    delivery_max_retries: int = 3 # Pengulangan setelah 429 (menunggu retry_after)
+    delivery_typing_interval: float = 4.0 # Status typing Telegram bertahan ~5 detik
+    delivery_document_min_parts: int = 4 # Hasil sepanjang ini (dalam pesan) dikirim sebagai file
+    delivery_drain_timeout: float = 10.0 # Shutdown: waktu tunggu antrian kirim sebelum dibatalkan
+
+    # --- Bulk API untuk CI (POST /bulk/testcases, hasil NDJSON) ---
+    bulk_api_token: str = os.getenv("BULK_API_TOKEN", "") # Kosong = endpoint nonaktif
+    bulk_backend: str = "redis" # 'redis' atau 'memory' (untuk test/lokal)
+    bulk_max_items: int = 500
+    # Item paralel per batch; tetap dibatasi LLM_MAX_CONCURRENCY (dibagi dengan job chat)
+    bulk_max_concurrency: int = 8
+    bulk_ttl: int = 24 * 3600 # Batas waktu batch bisa dilanjutkan
+    bulk_lock_ttl: int = 60 # Diperpanjang heartbeat (tiap TTL/3); klaim tanpa runner hidup dilepas setelah ini
+    bulk_local_batches: int = 100 # Hanya untuk backend 'memory'
+
+    # --- Mode long polling (`python polling_runner.py`), alternatif webhook ---
+    polling_batch_size: int = 100 # Maksimal dari Bot API
+    polling_timeout: int = 25 # Detik long poll getUpdates
+    polling_concurrency: int = 32 # Chat yang diproses bersamaan dalam satu batch
+
+    # --- Observability ---
+    log_trace_id: bool = True # Trace id per update di setiap baris log
+
+    # --- Memori percakapan (chat_history untuk follow-up), dibatasi token tiktoken ---
+    memory_backend: str = "redis" # 'redis' atau 'memory' (untuk test/lokal)
+    memory_max_tokens: int = 4000 # Ringkasan + giliran terbaru yang dikirim ke agent
+    memory_turn_max_tokens: int = 1500 # Satu giliran (PRD / hasil test case) dipotong saat disimpan
+    memory_summary_max_tokens: int = 600 # Ringkasan bergulir untuk giliran yang lebih tua
+    memory_ttl: int = 7 * 24 * 3600
+    memory_drain_timeout: float = 10.0 # Shutdown: tunggu peringkasan background yang masih berjalan
+    memory_local_chats: int = 10000 # Hanya untuk backend 'memory'
+
+    # --- Near cache state percakapan (lokal per proses, invalidasi via pub/sub) ---
+    state_cache_enabled: bool = True
+    state_cache_size: int = 10000
+    state_cache_ttl: float = 60.0 # Batas staleness jika pesan invalidasi terlewat
+
+    # --- De-duplikasi update_id (kiriman ulang Telegram) ---
+    update_dedup_enabled: bool = True
+    update_dedup_local_size: int = 10000
+    update_dedup_ttl: int = 24 * 3600 # Telegram berhenti mengirim ulang setelah ~24 jam
+
+    # --- Antrian job pembuatan test case ---
+    job_backend: str = "redis" # 'redis' atau 'memory' (untuk test/lokal)
+    job_run_in_process: bool = True # False jika worker dijalankan terpisah: python job_worker.py
+    job_worker_concurrency: int = 4
+    job_visibility_timeout: float = 300.0
+    job_max_attempts: int = 3
+    # Admission control: job yang diterima & belum selesai; di atas batas PRD baru ditolak
+    job_max_queue_depth: int = 200
+    job_per_chat_quota: int = 2 # PRD per chat yang boleh antre (diproses berurutan)
+    llm_max_concurrency: int = 8 # Panggilan model test case bersamaan per proses
+
+    # --- Mode langsung: alur PRD memanggil chain test case tanpa AgentExecutor ---
+    # (agent hanya untuk chat bebas; hemat 2 round trip model per PRD)
+    testcase_direct_mode: bool = True
+    # Streaming hasil (hanya mode langsung): pesan diedit bertahap, minimal jeda antar edit
+    testcase_streaming: bool = True
+    stream_edit_interval: float = 1.5
+
+    # --- PRD besar: dipecah per bagian lalu diproses paralel (map-reduce) ---
+    tiktoken_encoding: str = "cl100k_base"
+    chunk_threshold_tokens: int = 6000 # Di atas ini create_testcase memakai mode chunked
+    chunk_max_tokens: int = 3000
+    chunk_overlap_tokens: int = 150
+    chunk_concurrency: int = 4
+    # Output terstruktur per bagian PRD (skema pydantic): PRD ber-heading hanya membuat ulang
+    # bagian yang berubah, bagian lain dipakai ulang dari hasil tersimpan (per hash bagian).
+    # Opt-in: saat aktif, PRD ber-heading tidak memakai chunked/streaming/shortcut PRD mirip
+    testcase_structured: bool = False
+    section_cache_local_size: int = 2048
+
+    # --- Upload PDF PRD ---
+    pdf_max_bytes: int = 10 * 1024 * 1024 # Bot API hanya mengizinkan unduhan hingga 20 MB
+    pdf_max_pages: int = 50
+    pdf_extract_workers: int = 2 # Ukuran process pool untuk parsing pypdf
+    pdf_cache_ttl: int = 7 * 24 * 3600
+
+    # --- Cache hasil test case (PRD + format + model + versi prompt) ---
+    testcase_cache_enabled: bool = True
+    testcase_cache_local_size: int = 256
+    testcase_cache_ttl: int = 7 * 24 * 3600
+    testcase_cache_max_entries: int = 10000
+
+    # --- PRD hampir sama (MinHash + LSH di Redis): pakai ulang hasil PRD sebelumnya ---
+    similarity_enabled: bool = True # Butuh cache hasil test case aktif
+    similarity_threshold: float = 0.9 # Estimasi Jaccard n-gram kata minimal
+    similarity_num_perm: int = 128
+    similarity_bands: int = 16 # 16 band x 8 baris: kandidat mulai muncul di sekitar Jaccard 0.7
+    similarity_shingle_size: int = 3 # Kata per n-gram
+    similarity_min_shingles: int = 20 # PRD lebih pendek dari ini tidak dibandingkan
+    similarity_max_candidates: int = 50 # Kandidat LSH yang diverifikasi per lookup
     # Tambahkan konfigurasi lain jika perlu
 
     class Config:
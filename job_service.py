@@ -0,0 +1,483 @@
+# job_service.py
+import time
+import uuid
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, Field
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+from config import settings
+from state_service import get_redis_pool # Pakai pool Redis yang sama dengan StateService
+from observability import JOB_QUEUE_DEPTH, JOBS_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# --- Model Job ---
+class GenerateTestcaseJob(BaseModel):
+    """Job 'buat test case' yang dikirim router ke worker."""
+    job_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    chat_id: int
+    format: str = "steps"
+    prd_text: str = ""
+    # PRD dari upload PDF: teks diekstrak oleh worker, bukan oleh webhook
+    file_id: Optional[str] = None
+    file_unique_id: Optional[str] = None
+    force_regenerate: bool = False # Lewati cache hasil test case
+    follow_up: bool = False # prd_text berisi pesan follow-up; PRD diambil dari memori percakapan
+    trace_id: Optional[str] = None # Trace id update asal, untuk korelasi log
+    attempts: int = 0
+    enqueued_at: float = Field(default_factory=time.time)
+    # Token reservasi yang sedang dipegang worker ini; ack/retry dengan token lama (setelah
+    # visibility timeout & job diambil ulang) diabaikan. Tidak ikut disimpan di payload.
+    reservation: Optional[str] = Field(default=None, exclude=True)
+
+
+class JobRejectedError(Exception):
+    """Job ditolak admission control: antrian penuh ('queue_full') atau kuota chat habis ('chat_quota')."""
+
+    def __init__(self, reason: str, pending: int):
+        self.reason = reason
+        self.pending = pending # Jumlah job yang sedang antre (global atau milik chat)
+        super().__init__(f"Job ditolak ({reason}), {pending} job dalam antrian.")
+
+
+class BaseJobQueue(ABC):
+    """
+    Antrian job dengan semantik at-least-once:
+    job yang di-reserve harus di-ack, jika tidak ia kembali ke antrian
+    setelah visibility timeout habis, sampai batas percobaan lalu masuk dead-letter.
+
+    Penjadwalan:
+    - per chat FIFO: job berikutnya dari chat yang sama baru bisa di-reserve
+      setelah job sebelumnya selesai (ack / dead-letter)
+    - admission: total job yang belum selesai dibatasi `max_depth`, per chat `chat_quota`
+      (0 = tanpa batas); di atas batas, enqueue melempar JobRejectedError
+    """
+
+    def __init__(self, visibility_timeout: float, max_attempts: int, max_depth: int = 0, chat_quota: int = 0):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.max_depth = max_depth
+        self.chat_quota = chat_quota
+
+    def _check_admission(self, depth: int, chat_depth: int):
+        if self.max_depth and depth >= self.max_depth:
+            JOBS_REJECTED.inc(reason="queue_full")
+            raise JobRejectedError("queue_full", depth)
+        if self.chat_quota and chat_depth >= self.chat_quota:
+            JOBS_REJECTED.inc(reason="chat_quota")
+            raise JobRejectedError("chat_quota", chat_depth)
+
+    @staticmethod
+    def _position(processing: int, ready: int, chat_depth: int) -> int:
+        """
+        Posisi job baru: job yang sedang diproses + job siap di depannya + job chat yang sama
+        yang masih menunggu, ditambah job ini. Job terdepan chat ini (jika ada) sudah terhitung
+        di `processing` atau `ready`. Posisi <= jumlah worker berarti job langsung diproses
+        (kecuali masih menunggu job chat yang sama).
+        """
+        return processing + ready + max(chat_depth - 1, 0) + 1
+
+    @abstractmethod
+    async def enqueue(self, job: GenerateTestcaseJob) -> int:
+        """
+        Menambahkan job ke antrian, mengembalikan posisinya (lihat `_position`).
+        Melempar JobRejectedError jika ditolak.
+        """
+
+    @abstractmethod
+    async def reserve(self, timeout: float = 1.0) -> Optional[GenerateTestcaseJob]:
+        """Mengambil satu job (menunggu maksimal `timeout` detik)."""
+
+    @abstractmethod
+    async def ack(self, job: GenerateTestcaseJob):
+        """Menandai job selesai dan menghapusnya. No-op jika reservasi job sudah tidak berlaku."""
+
+    @abstractmethod
+    async def extend(self, job: GenerateTestcaseJob):
+        """Memperpanjang visibility timeout job yang masih diproses."""
+
+    @abstractmethod
+    async def retry(self, job: GenerateTestcaseJob) -> bool:
+        """
+        Mengembalikan job gagal ke antrian. False jika job masuk dead-letter.
+        No-op (True) jika reservasi job sudah tidak berlaku.
+        """
+
+    @abstractmethod
+    async def requeue_expired(self) -> int:
+        """Mengembalikan job yang visibility timeout-nya habis, mengembalikan jumlahnya."""
+
+    @abstractmethod
+    async def size(self) -> int:
+        """Jumlah job yang diterima dan belum selesai (menunggu + sedang diproses)."""
+
+    @abstractmethod
+    async def dead_letters(self) -> List[GenerateTestcaseJob]:
+        """Daftar job yang gagal permanen."""
+
+
+class InMemoryJobQueue(BaseJobQueue):
+    """Implementasi antrian dalam memori (untuk test & pengembangan lokal)."""
+
+    def __init__(self, visibility_timeout: float, max_attempts: int, max_depth: int = 0, chat_quota: int = 0):
+        super().__init__(visibility_timeout, max_attempts, max_depth, chat_quota)
+        self._pending: asyncio.Queue = asyncio.Queue() # Hanya job terdepan tiap chat
+        self._inflight: Dict[str, Tuple[float, GenerateTestcaseJob]] = {} # Salinan milik worker
+        self._dead: List[GenerateTestcaseJob] = []
+        self._admitted: Dict[str, GenerateTestcaseJob] = {} # Urutan masuk = urutan antrian
+        self._chat_jobs: Dict[int, Deque[str]] = {}
+        logger.info("Menggunakan InMemory Job Queue")
+
+    async def enqueue(self, job: GenerateTestcaseJob) -> int:
+        chat_depth = len(self._chat_jobs.get(job.chat_id, ()))
+        self._check_admission(len(self._admitted), chat_depth)
+        position = self._position(len(self._inflight), self._pending.qsize(), chat_depth)
+        self._admitted[job.job_id] = job
+        chat_jobs = self._chat_jobs.setdefault(job.chat_id, deque())
+        chat_jobs.append(job.job_id)
+        if len(chat_jobs) == 1:
+            await self._pending.put(job)
+        JOB_QUEUE_DEPTH.set(len(self._admitted))
+        return position
+
+    async def _finish(self, job: GenerateTestcaseJob):
+        """Melepas job dari antrian chat-nya dan memajukan job berikutnya dari chat yang sama."""
+        self._admitted.pop(job.job_id, None)
+        chat_jobs = self._chat_jobs.get(job.chat_id)
+        if chat_jobs is not None:
+            if job.job_id in chat_jobs:
+                chat_jobs.remove(job.job_id)
+            if chat_jobs:
+                await self._pending.put(self._admitted[chat_jobs[0]])
+            else:
+                del self._chat_jobs[job.chat_id]
+        JOB_QUEUE_DEPTH.set(len(self._admitted))
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[GenerateTestcaseJob]:
+        try:
+            job = await asyncio.wait_for(self._pending.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        # Salinan per reservasi: worker lama yang masih memegang objek sebelumnya tidak ikut berubah
+        job = job.model_copy(update={"attempts": job.attempts + 1, "reservation": uuid.uuid4().hex})
+        if job.job_id in self._admitted:
+            self._admitted[job.job_id] = job
+        self._inflight[job.job_id] = (time.monotonic() + self.visibility_timeout, job)
+        return job
+
+    def _claim(self, job: GenerateTestcaseJob) -> bool:
+        """Melepas reservasi job jika masih milik pemanggil (token cocok)."""
+        entry = self._inflight.get(job.job_id)
+        if entry is None or entry[1].reservation != job.reservation:
+            logger.warning(f"Reservasi job {job.job_id} sudah tidak berlaku, ack/retry diabaikan.")
+            return False
+        del self._inflight[job.job_id]
+        return True
+
+    async def ack(self, job: GenerateTestcaseJob):
+        if self._claim(job):
+            await self._finish(job)
+
+    async def extend(self, job: GenerateTestcaseJob):
+        entry = self._inflight.get(job.job_id)
+        if entry is not None and entry[1].reservation == job.reservation:
+            self._inflight[job.job_id] = (time.monotonic() + self.visibility_timeout, job)
+
+    async def retry(self, job: GenerateTestcaseJob) -> bool:
+        if not self._claim(job):
+            return True # Sudah dikembalikan oleh requeue_expired (dan mungkin diambil worker lain)
+        return await self._requeue_or_bury(job)
+
+    async def _requeue_or_bury(self, job: GenerateTestcaseJob) -> bool:
+        if job.attempts >= self.max_attempts:
+            self._dead.append(job)
+            await self._finish(job)
+            logger.error(f"Job {job.job_id} masuk dead-letter setelah {job.attempts} percobaan.")
+            return False
+        await self._pending.put(job)
+        return True
+
+    async def requeue_expired(self) -> int:
+        now = time.monotonic()
+        expired = [job for deadline, job in self._inflight.values() if deadline <= now]
+        for job in expired:
+            del self._inflight[job.job_id]
+            await self._requeue_or_bury(job)
+        return len(expired)
+
+    async def size(self) -> int:
+        return len(self._admitted)
+
+    async def dead_letters(self) -> List[GenerateTestcaseJob]:
+        return list(self._dead)
+
+
+class RedisJobQueue(BaseJobQueue):
+    """
+    Antrian berbasis Redis list.
+    - pending    : list job_id yang siap diambil (LPUSH / BLMOVE dari kanan), maksimal satu per chat
+    - processing : list job_id yang sedang diproses (dipindah atomik oleh BLMOVE)
+    - inflight   : sorted set job_id -> deadline visibility timeout
+    - dead       : list job_id yang gagal permanen
+    - admitted   : sorted set job_id -> waktu masuk, semua job yang belum selesai (kedalaman antrian)
+    - chat:{id}  : list job_id milik satu chat (FIFO); hanya elemen terdepan yang ada di pending
+    - lease:{id} : token reservasi yang berlaku; ack/retry dengan token lain diabaikan
+    Payload job disimpan terpisah di key `data:{job_id}`.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        visibility_timeout: float,
+        max_attempts: int,
+        max_depth: int = 0,
+        chat_quota: int = 0
+    ):
+        super().__init__(visibility_timeout, max_attempts, max_depth, chat_quota)
+        self.client = client
+        self.prefix = "bot:jobs:"
+        self.pending_key = f"{self.prefix}pending"
+        self.processing_key = f"{self.prefix}processing"
+        self.inflight_key = f"{self.prefix}inflight"
+        self.dead_key = f"{self.prefix}dead"
+        self.admitted_key = f"{self.prefix}admitted"
+        # Payload job di dead-letter disimpan lebih lama untuk investigasi
+        self.dead_ttl_seconds = 7 * 24 * 3600
+        # Pengaman: antrian chat yang tertinggal (misal payload hilang) tidak mengunci chat selamanya
+        self.chat_ttl_seconds = 24 * 3600
+        # Batas percobaan ulang WATCH/MULTI jika antrian chat berubah di tengah transaksi
+        self.cas_retries = 5
+
+    def _data_key(self, job_id: str) -> str:
+        return f"{self.prefix}data:{job_id}"
+
+    def _chat_key(self, chat_id: int) -> str:
+        return f"{self.prefix}chat:{chat_id}"
+
+    def _lease_key(self, job_id: str) -> str:
+        return f"{self.prefix}lease:{job_id}"
+
+    async def enqueue(self, job: GenerateTestcaseJob) -> int:
+        chat_key = self._chat_key(job.chat_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for _ in range(self.cas_retries):
+                try:
+                    await pipe.watch(chat_key)
+                    chat_depth = await pipe.llen(chat_key)
+                    # Batas global bersifat lunak: admission bersamaan bisa sedikit melewatinya
+                    self._check_admission(await pipe.zcard(self.admitted_key), chat_depth)
+                    # Perkiraan: job lain bisa diambil / selesai sebelum transaksi dijalankan
+                    position = self._position(
+                        await pipe.llen(self.processing_key), await pipe.llen(self.pending_key), chat_depth
+                    )
+
+                    pipe.multi()
+                    pipe.set(self._data_key(job.job_id), job.model_dump_json())
+                    pipe.rpush(chat_key, job.job_id)
+                    pipe.expire(chat_key, self.chat_ttl_seconds)
+                    pipe.zadd(self.admitted_key, {job.job_id: job.enqueued_at})
+                    pipe.zcard(self.admitted_key)
+                    if chat_depth == 0:
+                        pipe.lpush(self.pending_key, job.job_id)
+                    depth = (await pipe.execute())[4]
+                    JOB_QUEUE_DEPTH.set(depth)
+                    logger.debug(f"Job {job.job_id} masuk antrian Redis untuk chat {job.chat_id} (posisi {position})")
+                    return position
+                except WatchError:
+                    # Antrian chat berubah (job lain masuk/selesai), ulangi
+                    continue
+        raise Exception(f"Gagal mengantrikan job {job.job_id} setelah {self.cas_retries} percobaan.")
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[GenerateTestcaseJob]:
+        job_id = await self.client.blmove(self.pending_key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if not job_id:
+            return None
+
+        reservation = uuid.uuid4().hex
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.inflight_key, {job_id: time.time() + self.visibility_timeout})
+            pipe.set(self._lease_key(job_id), reservation, ex=self.chat_ttl_seconds)
+            await pipe.execute()
+        raw = await self.client.get(self._data_key(job_id))
+        if not raw:
+            logger.warning(f"Payload job {job_id} tidak ditemukan, dibuang.")
+            await self._forget(job_id)
+            return None
+
+        job = GenerateTestcaseJob.model_validate_json(raw)
+        job.attempts += 1
+        await self.client.set(self._data_key(job_id), job.model_dump_json())
+        job.reservation = reservation
+        return job
+
+    async def _forget(self, job_id: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 0, job_id)
+            pipe.zrem(self.inflight_key, job_id)
+            pipe.zrem(self.admitted_key, job_id)
+            pipe.delete(self._lease_key(job_id))
+            await pipe.execute()
+
+    async def _finish(self, job: GenerateTestcaseJob, bury: bool = False, check_lease: bool = True):
+        """
+        Menyelesaikan job (ack atau dead-letter) dan, dalam transaksi yang sama,
+        memajukan job berikutnya dari chat yang sama ke pending.
+        `check_lease`: hanya jika token reservasi job masih berlaku (di-WATCH bersama antrian chat);
+        False jika reservasi sudah diklaim pemanggil (retry / reaper). Mengembalikan False jika basi.
+        """
+        chat_key = self._chat_key(job.chat_id)
+        lease_key = self._lease_key(job.job_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for _ in range(self.cas_retries):
+                try:
+                    await pipe.watch(chat_key, lease_key)
+                    if check_lease and await pipe.get(lease_key) != job.reservation:
+                        await pipe.unwatch()
+                        logger.warning(f"Reservasi job {job.job_id} sudah tidak berlaku, ack diabaikan.")
+                        return False
+                    head = await pipe.lrange(chat_key, 0, 1)
+
+                    pipe.multi()
+                    pipe.lrem(self.processing_key, 0, job.job_id)
+                    pipe.zrem(self.inflight_key, job.job_id)
+                    pipe.zrem(self.admitted_key, job.job_id)
+                    pipe.lrem(chat_key, 1, job.job_id)
+                    pipe.delete(lease_key)
+                    if bury:
+                        pipe.lpush(self.dead_key, job.job_id)
+                        pipe.expire(self._data_key(job.job_id), self.dead_ttl_seconds)
+                    else:
+                        pipe.delete(self._data_key(job.job_id))
+                    if len(head) == 2 and head[0] == job.job_id:
+                        pipe.lpush(self.pending_key, head[1])
+                    pipe.zcard(self.admitted_key)
+                    JOB_QUEUE_DEPTH.set((await pipe.execute())[-1])
+                    return True
+                except WatchError:
+                    continue
+        logger.error(f"Gagal menyelesaikan job {job.job_id} setelah {self.cas_retries} percobaan.")
+        return False
+
+    async def ack(self, job: GenerateTestcaseJob):
+        await self._finish(job)
+
+    async def extend(self, job: GenerateTestcaseJob):
+        # Heartbeat worker basi tidak memperpanjang reservasi milik worker lain
+        if await self.client.get(self._lease_key(job.job_id)) != job.reservation:
+            return
+        # XX: hanya perbarui jika job masih tercatat in-flight
+        await self.client.zadd(self.inflight_key, {job.job_id: time.time() + self.visibility_timeout}, xx=True)
+
+    async def retry(self, job: GenerateTestcaseJob) -> bool:
+        # Klaim: token reservasi dicek & dihapus bersama ZREM inflight dalam satu transaksi,
+        # sehingga hanya pemegang reservasi yang berlaku (atau reaper) yang mengembalikan job
+        lease_key = self._lease_key(job.job_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for _ in range(self.cas_retries):
+                try:
+                    await pipe.watch(lease_key)
+                    if await pipe.get(lease_key) != job.reservation:
+                        await pipe.unwatch()
+                        logger.warning(f"Reservasi job {job.job_id} sudah tidak berlaku, retry diabaikan.")
+                        return True
+                    pipe.multi()
+                    pipe.zrem(self.inflight_key, job.job_id)
+                    pipe.delete(lease_key)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+            else:
+                return True
+        return await self._requeue_or_bury(job)
+
+    async def _requeue_or_bury(self, job: GenerateTestcaseJob) -> bool:
+        """Dipanggil setelah reservasi diklaim (lease sudah dihapus)."""
+        if job.attempts >= self.max_attempts:
+            await self._finish(job, bury=True, check_lease=False)
+            logger.error(f"Job {job.job_id} masuk dead-letter setelah {job.attempts} percobaan.")
+            return False
+
+        # Job tetap terdepan di antrian chat-nya, jadi urutan per chat terjaga
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 0, job.job_id)
+            pipe.lpush(self.pending_key, job.job_id)
+            await pipe.execute()
+        return True
+
+    async def requeue_expired(self) -> int:
+        now = time.time()
+        count = 0
+
+        # Job yang dipindah BLMOVE tapi worker-nya mati sebelum ZADD: beri deadline baru
+        processing = await self.client.lrange(self.processing_key, 0, -1)
+        for job_id in processing:
+            if await self.client.zscore(self.inflight_key, job_id) is None:
+                await self.client.zadd(self.inflight_key, {job_id: now + self.visibility_timeout}, nx=True)
+
+        for job_id in await self.client.zrangebyscore(self.inflight_key, "-inf", now):
+            if not await self.client.zrem(self.inflight_key, job_id):
+                continue # Sudah diklaim worker/reaper lain
+            # Reservasi dicabut sebelum payload dibaca: ack/retry worker lama setelah ini no-op
+            await self.client.delete(self._lease_key(job_id))
+            raw = await self.client.get(self._data_key(job_id))
+            if not raw:
+                logger.warning(f"Payload job {job_id} yang kedaluwarsa tidak ditemukan, dibuang.")
+                await self._forget(job_id)
+                continue
+            job = GenerateTestcaseJob.model_validate_json(raw)
+            logger.warning(f"Visibility timeout job {job_id} habis (percobaan ke-{job.attempts}).")
+            await self._requeue_or_bury(job)
+            count += 1
+        return count
+
+    async def size(self) -> int:
+        return await self.client.zcard(self.admitted_key)
+
+    async def dead_letters(self) -> List[GenerateTestcaseJob]:
+        jobs = []
+        for job_id in await self.client.lrange(self.dead_key, 0, -1):
+            raw = await self.client.get(self._data_key(job_id))
+            if raw:
+                jobs.append(GenerateTestcaseJob.model_validate_json(raw))
+        return jobs
+
+
+# --- Factory & Dependency ---
+def create_job_queue() -> Optional[BaseJobQueue]:
+    """
+    Membuat antrian sesuai `settings.job_backend` ('redis' atau 'memory').
+    None jika Redis tidak tersedia: aplikasi tetap start, tetapi belum ready (503).
+    """
+    if settings.job_backend == "memory":
+        return InMemoryJobQueue(
+            settings.job_visibility_timeout,
+            settings.job_max_attempts,
+            settings.job_max_queue_depth,
+            settings.job_per_chat_quota
+        )
+
+    redis_pool = get_redis_pool()
+    if not redis_pool:
+        logger.error("Redis pool tidak terinisialisasi, antrian job tidak tersedia.")
+        return None
+    return RedisJobQueue(
+        redis.Redis(connection_pool=redis_pool),
+        settings.job_visibility_timeout,
+        settings.job_max_attempts,
+        settings.job_max_queue_depth,
+        settings.job_per_chat_quota
+    )
+
+def get_job_queue(request: Request) -> BaseJobQueue:
+    """Dependency: antrian milik aplikasi (dibuat di lifespan main.py); 503 jika tidak tersedia."""
+    job_queue = getattr(request.app.state, "job_queue", None)
+    if job_queue is None:
+        # 503: Telegram mengirim ulang update nanti, sehingga PRD tidak hilang
+        raise HTTPException(status_code=503, detail="Antrian job tidak tersedia.")
+    return job_queue
\ No newline at end of file
@@ -0,0 +1,395 @@
+# job_worker.py
+import asyncio
+import logging
+import signal
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional
+from langchain_core.messages import BaseMessage
+from config import settings
+from agent_logic import PROMPT_VERSION, generate_testcase, get_agent_executor_for, stream_testcase, warm_up_models
+from job_service import BaseJobQueue, GenerateTestcaseJob, create_job_queue
+from memory_service import BaseMemoryService, create_memory_service
+from model_router import ServedModels, get_model_router, track_served_models
+from prd_similarity import PrdSimilarityIndex, create_similarity_index, make_similarity_namespace
+from telegram_service import ProgressiveMessage, TelegramService, create_http_client
+from telegram_delivery import drain_outbound_scheduler
+from testcase_cache import TestcaseCache, create_testcase_cache, make_cache_key
+from testcase_chunking import has_sections, should_chunk
+from token_counter import count_tokens
+from observability import (
+    JOB_QUEUE_DEPTH, JOB_QUEUE_WAIT, JOBS_IN_FLIGHT, JOBS_TOTAL, STAGE_DURATION, TraceIdFilter, trace_id_var
+)
+from pdf_ingestion import (
+    PdfIngestionError, PdfIngestionService, create_pdf_ingestion_service, shutdown_process_pool
+)
+
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- Handler Job ---
+async def run_agent_for_prd(
+    agent_executor: "AgentExecutor",
+    prd_text: str,
+    format: str,
+    chat_history: Optional[List[BaseMessage]] = None
+) -> str:
+    """Jalur agent: model memutuskan memanggil create_testcase lalu merangkum hasilnya."""
+    prompt_input = f"""
+        Buatkan saya test case dengan format '{format}' berdasarkan PRD berikut.
+
+        PRD:
+        {prd_text}
+        """
+    response = await agent_executor.ainvoke(
+        {"input": prompt_input, "chat_history": chat_history or []},
+        config={"metadata": {"format": format}} # Label format untuk metrik LLM
+    )
+    return response["output"]
+
+async def run_agent_follow_up(
+    agent_executor: "AgentExecutor",
+    text: str,
+    format: str,
+    chat_history: List[BaseMessage]
+) -> str:
+    """Follow-up ("tambahkan negative case"): agent menjawab berdasarkan riwayat, tanpa PRD dikirim ulang."""
+    prompt_input = f"""
+        {text}
+
+        (Format test case yang sedang dipakai: '{format}'. PRD dan test case sebelumnya ada di riwayat percakapan.)
+        """
+    response = await agent_executor.ainvoke(
+        {"input": prompt_input, "chat_history": chat_history},
+        config={"metadata": {"format": format}}
+    )
+    return response["output"]
+
+async def run_agent_routed(
+    agent_executor: Optional["AgentExecutor"],
+    run: Callable[["AgentExecutor"], Awaitable[str]],
+    prompt_tokens: int,
+    format: str
+) -> str:
+    """
+    Executor eksplisit dipakai apa adanya; tanpa executor, model agent dipilih router
+    (tier & failover). Tidak di-hedge: agent memanggil tools sehingga mahal digandakan.
+    """
+    if agent_executor:
+        return await run(agent_executor)
+    return await get_model_router().run(
+        lambda model: run(get_agent_executor_for(model)), prompt_tokens, format, hedge=False
+    )
+
+async def stream_testcase_reply(job: GenerateTestcaseJob, telegram_service: TelegramService) -> Optional[str]:
+    """
+    Mode langsung + streaming: balasan muncul bertahap lewat edit pesan.
+    Gagal sebelum ada isi terkirim: error diteruskan (job di-retry). Gagal setelah sebagian
+    terkirim: tidak di-retry (retry akan mengirim ulang potongan yang sama), pengguna diberi
+    tahu dan None dikembalikan agar hasil parsial tidak di-cache.
+    """
+    reply = ProgressiveMessage(telegram_service, job.chat_id, settings.stream_edit_interval)
+    parts = []
+    try:
+        async for piece in stream_testcase(job.prd_text, job.format):
+            parts.append(piece)
+            await reply.append(piece)
+    except Exception as e:
+        if reply.first_content_at is None:
+            raise
+        logger.error(f"Streaming job {job.job_id} terputus setelah sebagian terkirim, tidak di-retry: {e}")
+        await reply.finish() # Potongan yang sudah diterima tetap ditampilkan
+        await telegram_service.send_reply(
+            job.chat_id,
+            "⚠️ Maaf, pembuatan test case terhenti di tengah jalan sehingga hasil di atas belum lengkap. "
+            "Untuk membuat ulang, kirim /regenerate lalu PRD ini lagi."
+        )
+        return None
+    await reply.finish()
+
+    ttfc = reply.time_to_first_content
+    ttfc_text = f"{ttfc:.2f}s" if ttfc is not None else "-"
+    total = time.monotonic() - reply.started_at
+    logger.info(f"Streaming job {job.job_id} selesai: time-to-first-content {ttfc_text}, total {total:.2f}s")
+    return "".join(parts)
+
+async def process_generate_testcase(
+    job: GenerateTestcaseJob,
+    telegram_service: TelegramService,
+    agent_executor: Optional["AgentExecutor"] = None,
+    cache: Optional[TestcaseCache] = None,
+    pdf_ingestion: Optional[PdfIngestionService] = None,
+    memory_service: Optional[BaseMemoryService] = None,
+    similarity_index: Optional[PrdSimilarityIndex] = None
+):
+    """
+    Membuat test case untuk PRD pada job lalu mengirim hasilnya ke chat.
+    `agent_executor` dipakai untuk follow-up dan jika mode langsung dimatikan (default: dipilih router model).
+    PRD yang hampir sama dengan PRD sebelumnya memakai ulang hasilnya (`similarity_index`).
+    Setiap hasil dicatat di memori percakapan agar bisa dirujuk oleh follow-up.
+    """
+    async def remember(output: str):
+        if memory_service:
+            user_text = job.prd_text if job.follow_up else f"PRD (format {job.format}):\n{job.prd_text}"
+            await memory_service.add_exchange(job.chat_id, user_text, output, job.format)
+
+    async def get_chat_history() -> List[BaseMessage]:
+        return await memory_service.get_chat_history(job.chat_id) if memory_service else []
+
+    if job.follow_up:
+        await telegram_service.send_typing_action(job.chat_id)
+        logger.debug(f"Memproses follow-up dari {job.chat_id} dengan agent (job {job.job_id}).")
+        chat_history = await get_chat_history()
+        with STAGE_DURATION.time(stage="generation", op="follow_up"):
+            output = await run_agent_routed(
+                agent_executor,
+                lambda executor: run_agent_follow_up(executor, job.prd_text, job.format, chat_history),
+                count_tokens(job.prd_text) + sum(count_tokens(str(message.content)) for message in chat_history),
+                job.format
+            )
+        await telegram_service.send_testcases(job.chat_id, output, job.format)
+        await remember(output)
+        return
+
+    if job.file_id:
+        await telegram_service.send_typing_action(job.chat_id)
+        pdf_ingestion = pdf_ingestion or create_pdf_ingestion_service(telegram_service)
+        try:
+            with STAGE_DURATION.time(stage="pdf", op="extract"):
+                job.prd_text = await pdf_ingestion.extract_text(job.file_id, job.file_unique_id or job.file_id)
+        except PdfIngestionError as e:
+            # Ditolak / tidak terbaca: tidak perlu retry
+            logger.warning(f"PDF job {job.job_id} ditolak: {e}")
+            await telegram_service.send_reply(job.chat_id, f"Maaf, PDF tidak dapat diproses: {e}")
+            return
+
+    # Key memakai model pilihan tier untuk PRD ini (bisa model cepat), bukan selalu model utama
+    tier_model = get_model_router().tier_model(count_tokens(job.prd_text), job.format)
+    cache_key = make_cache_key(job.prd_text, job.format, tier_model, PROMPT_VERSION)
+    if cache and not job.force_regenerate:
+        with STAGE_DURATION.time(stage="cache", op="get"):
+            cached = await cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Cache hit test case untuk chat {job.chat_id} (job {job.job_id}), LLM dilewati.")
+            await telegram_service.send_testcases(job.chat_id, cached, job.format)
+            await remember(cached)
+            return
+
+    # PRD ber-bagian (mode terstruktur) tidak memakai shortcut PRD mirip: regenerasi inkremental
+    # sudah hanya membayar bagian yang berubah, dan hasilnya sesuai PRD terbaru
+    incremental = settings.testcase_direct_mode and settings.testcase_structured and has_sections(job.prd_text)
+    namespace = make_similarity_namespace(job.format, tier_model, PROMPT_VERSION)
+    if cache and similarity_index and not job.force_regenerate and not incremental:
+        with STAGE_DURATION.time(stage="similarity", op="find"):
+            similar = await similarity_index.find(job.prd_text, namespace)
+        previous = await cache.get(similar.cache_key) if similar else None
+        if previous is not None:
+            logger.info(
+                f"PRD chat {job.chat_id} {similar.similarity:.0%} mirip dengan PRD {similar.doc_id}, "
+                f"hasil sebelumnya dipakai (job {job.job_id})."
+            )
+            await cache.set(cache_key, previous) # PRD yang persis sama berikutnya langsung cache hit
+            await telegram_service.send_testcases(job.chat_id, previous, job.format)
+            await telegram_service.send_reply(
+                job.chat_id,
+                f"ℹ️ PRD ini {similar.similarity:.0%} mirip dengan PRD yang pernah diproses, jadi hasil "
+                "sebelumnya dipakai. Untuk membuat ulang, kirim /regenerate lalu PRD ini lagi."
+            )
+            await remember(previous)
+            return
+
+    async def save_result(output: str, served: ServedModels):
+        if served.degraded:
+            # Dijawab model cadangan / hedge: jangan disimpan sebagai hasil model tier
+            logger.info(f"Hasil job {job.job_id} dari model {served.models} (failover), tidak di-cache.")
+            return
+        if cache:
+            await cache.set(cache_key, output)
+            if similarity_index:
+                await similarity_index.add(job.prd_text, namespace, cache_key)
+
+    await telegram_service.send_typing_action(job.chat_id)
+
+    # Exception dibiarkan naik agar worker bisa retry / dead-letter
+    # PRD besar diproses chunked dan PRD ber-bagian diproses inkremental (paralel per bagian), tidak di-stream
+    streaming = settings.testcase_streaming and not should_chunk(job.prd_text) and not incremental
+    if settings.testcase_direct_mode and streaming:
+        logger.debug(f"Memproses PRD dari {job.chat_id} secara streaming (job {job.job_id}).")
+        with track_served_models() as served, STAGE_DURATION.time(stage="generation", op="stream"):
+            output = await stream_testcase_reply(job, telegram_service)
+        if output is None: # Terputus setelah sebagian terkirim, pengguna sudah diberi tahu
+            return
+        await save_result(output, served)
+        await remember(output)
+        return
+
+    if settings.testcase_direct_mode:
+        # Format & PRD sudah diketahui dari state: langsung ke chain test case
+        logger.debug(f"Memproses PRD dari {job.chat_id} secara langsung (job {job.job_id}).")
+        with track_served_models() as served, STAGE_DURATION.time(stage="generation", op="direct"):
+            output = await generate_testcase(job.prd_text, job.format, refresh=job.force_regenerate)
+    else:
+        logger.debug(f"Memproses PRD dari {job.chat_id} dengan agent (job {job.job_id}).")
+        chat_history = await get_chat_history()
+        with track_served_models() as served, STAGE_DURATION.time(stage="generation", op="agent"):
+            output = await run_agent_routed(
+                agent_executor,
+                lambda executor: run_agent_for_prd(executor, job.prd_text, job.format, chat_history),
+                count_tokens(job.prd_text),
+                job.format
+            )
+    await save_result(output, served)
+    await telegram_service.send_testcases(job.chat_id, output, job.format)
+    await remember(output)
+
+
+# --- Worker Pool ---
+class JobWorker:
+    """Pool worker async yang menguras antrian job dan membalas via TelegramService."""
+
+    def __init__(
+        self,
+        queue: BaseJobQueue,
+        telegram_service: TelegramService,
+        agent_executor: Optional["AgentExecutor"],
+        concurrency: int,
+        cache: Optional[TestcaseCache] = None,
+        pdf_ingestion: Optional[PdfIngestionService] = None,
+        memory_service: Optional[BaseMemoryService] = None,
+        similarity_index: Optional[PrdSimilarityIndex] = None
+    ):
+        self.queue = queue
+        self.telegram_service = telegram_service
+        self.agent_executor = agent_executor
+        self.concurrency = concurrency
+        self.cache = cache
+        self.pdf_ingestion = pdf_ingestion or create_pdf_ingestion_service(telegram_service)
+        self.memory_service = memory_service
+        self.similarity_index = similarity_index
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        """Menjalankan `concurrency` worker dan satu reaper visibility timeout."""
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._reaper_loop()))
+        logger.info(f"{self.concurrency} job worker dijalankan.")
+
+    async def stop(self):
+        """Berhenti mengambil job baru dan menunggu job yang sedang berjalan selesai."""
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.memory_service:
+            await self.memory_service.drain(settings.memory_drain_timeout)
+        logger.info("Job worker dihentikan.")
+
+    async def _worker_loop(self, worker_id: int):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.reserve(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} gagal mengambil job: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if job:
+                await self._run_job(job)
+
+    async def _run_job(self, job: GenerateTestcaseJob):
+        trace_token = trace_id_var.set(job.trace_id or f"job-{job.job_id}")
+        if job.attempts == 1:
+            JOB_QUEUE_WAIT.observe(time.time() - job.enqueued_at)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            with JOBS_IN_FLIGHT.track_inprogress(), STAGE_DURATION.time(stage="job", op="generate_testcase"):
+                await process_generate_testcase(
+                    job, self.telegram_service, self.agent_executor, self.cache, self.pdf_ingestion,
+                    self.memory_service, self.similarity_index
+                )
+            await self.queue.ack(job)
+            JOBS_TOTAL.inc(result="ok")
+        except Exception as e:
+            logger.error(f"Error dari Agent untuk job {job.job_id} (chat {job.chat_id}): {e}", exc_info=True)
+            if await self.queue.retry(job):
+                JOBS_TOTAL.inc(result="retried")
+            else:
+                JOBS_TOTAL.inc(result="dead_lettered")
+                await self.telegram_service.send_reply(
+                    job.chat_id, f"Maaf, terjadi error saat memproses PRD: {e}"
+                )
+        finally:
+            heartbeat.cancel()
+            trace_id_var.reset(trace_token)
+
+    async def _heartbeat(self, job: GenerateTestcaseJob):
+        """Memperpanjang visibility timeout selama job masih diproses."""
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            try:
+                await self.queue.extend(job)
+            except Exception as e:
+                logger.warning(f"Gagal memperpanjang visibility job {job.job_id}: {e}")
+
+    async def _reaper_loop(self):
+        interval = min(self.queue.visibility_timeout / 2, 30.0)
+        while not self._stopping.is_set():
+            try:
+                requeued = await self.queue.requeue_expired()
+                if requeued:
+                    logger.warning(f"{requeued} job dikembalikan ke antrian (visibility timeout).")
+                JOB_QUEUE_DEPTH.set(await self.queue.size())
+            except Exception as e:
+                logger.error(f"Reaper job gagal: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+# --- Entry Point Worker Terpisah ---
+async def run_worker(concurrency: Optional[int] = None):
+    """Menjalankan worker sebagai proses terpisah: `python job_worker.py`."""
+    http_client = create_http_client()
+    try:
+        await asyncio.to_thread(warm_up_models) # Client model dibuat sebelum job pertama
+    except Exception as e:
+        logger.error(f"Warm-up model gagal: {e}")
+    job_queue = create_job_queue()
+    if job_queue is None:
+        raise Exception("Antrian job tidak tersedia (Redis pool tidak terinisialisasi).")
+    worker = JobWorker(
+        job_queue,
+        TelegramService(http_client),
+        None, # Agent executor dibuat saat pertama dibutuhkan
+        concurrency or settings.job_worker_concurrency,
+        create_testcase_cache(),
+        memory_service=create_memory_service(),
+        similarity_index=create_similarity_index()
+    )
+    worker.start()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await stop_event.wait()
+    finally:
+        await worker.stop()
+        await drain_outbound_scheduler()
+        await http_client.aclose()
+        shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    log_handler = logging.StreamHandler()
+    log_handler.addFilter(TraceIdFilter())
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
+        handlers=[log_handler]
+    )
+    asyncio.run(run_worker())
\ No newline at end of file
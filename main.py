@@ -1,21 +1,113 @@
 # main.py
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from telegram_router import router as telegram_router # Impor router telegram
+from bulk_router import router as bulk_router
+from telegram_service import TelegramService, create_http_client
+from telegram_delivery import drain_outbound_scheduler
+import redis.asyncio as redis
+from state_service import close_redis_pool, get_redis_pool, get_state_near_cache, ping_redis
+from job_service import create_job_queue
+from update_dedup import create_update_deduplicator
+from memory_service import create_memory_service
+from job_worker import JobWorker
+from testcase_cache import create_testcase_cache
+from bulk_service import create_batch_store
+from prd_similarity import create_similarity_index
+from pdf_ingestion import shutdown_process_pool
+from observability import TraceIdFilter, render_metrics
+from agent_logic import warm_up_models
 from config import settings # Impor konfigurasi
 
 # Konfigurasi logging dasar
+log_handler = logging.StreamHandler() # Output ke console
+log_handler.addFilter(TraceIdFilter()) # Menyediakan %(trace_id)s per update
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     handlers=[
-        logging.StreamHandler() # Output ke console
+        log_handler
         # Anda bisa menambahkan FileHandler di sini jika perlu
     ]
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="QA Agent Bot")
+async def _warm_up_models() -> Optional[str]:
+    """Membuat client model & agent di thread terpisah; mengembalikan pesan error jika gagal."""
+    try:
+        await asyncio.to_thread(warm_up_models)
+        return None
+    except Exception as e:
+        logger.error(f"Warm-up model gagal, aplikasi belum ready: {e}")
+        return str(e)
+
+async def warm_up(app: FastAPI):
+    """
+    Warm-up eksplisit sebelum menerima trafik: koneksi Redis pertama dibuka dan
+    client model dibuat bersamaan. Kegagalan tidak menghentikan proses, tetapi
+    membuat /health/ready mengembalikan 503.
+    """
+    start = time.perf_counter()
+    redis_ok, model_error = await asyncio.gather(ping_redis(), _warm_up_models())
+    app.state.models_error = model_error
+    logger.info(
+        f"Warm-up selesai dalam {time.perf_counter() - start:.2f}s "
+        f"(redis={'OK' if redis_ok else 'GAGAL'}, model={'OK' if model_error is None else 'GAGAL'})"
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Mengelola resource yang hidup selama aplikasi berjalan."""
+    app.state.ready = False
+    # Satu HTTP client ber-pool untuk semua panggilan ke Bot API
+    app.state.telegram_http_client = create_http_client()
+    app.state.job_queue = create_job_queue()
+    app.state.update_deduplicator = create_update_deduplicator()
+    app.state.memory_service = create_memory_service()
+    app.state.testcase_cache = create_testcase_cache() # Dipakai worker job & bulk API
+    app.state.batch_store = create_batch_store()
+    await warm_up(app)
+    # Listener invalidasi near cache state (koherensi antar worker gunicorn)
+    state_near_cache = get_state_near_cache()
+    if state_near_cache and get_redis_pool():
+        await state_near_cache.start(redis.Redis(connection_pool=get_redis_pool()))
+    app.state.ready = True # Warm-up selesai (berhasil atau tidak), readiness dicek per request
+
+    # Worker in-process; set JOB_RUN_IN_PROCESS=false jika memakai `python job_worker.py`
+    job_worker = None
+    if settings.job_run_in_process and app.state.job_queue is not None:
+        job_worker = JobWorker(
+            app.state.job_queue,
+            TelegramService(app.state.telegram_http_client),
+            None, # Agent executor bersama, sudah dibuat saat warm-up
+            settings.job_worker_concurrency,
+            app.state.testcase_cache,
+            memory_service=app.state.memory_service,
+            similarity_index=create_similarity_index()
+        )
+        job_worker.start()
+
+    logger.info("Aplikasi FastAPI dimulai...")
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        if job_worker:
+            await job_worker.stop()
+        await drain_outbound_scheduler() # Balasan yang masih di antrian kirim
+        await app.state.telegram_http_client.aclose()
+        shutdown_process_pool()
+        if state_near_cache:
+            await state_near_cache.stop()
+        await close_redis_pool()
+        logger.info("Aplikasi FastAPI dimatikan, HTTP client Telegram & Redis pool ditutup.")
+
+app = FastAPI(title="QA Agent Bot", lifespan=lifespan)
 
 # Cek variabel penting saat startup
 logger.info(f"Memuat token Telegram: {'OK' if settings.telegram_bot_token != 'YOUR_FALLBACK_TOKEN' else 'MISSING!'}")
@@ -23,6 +115,7 @@ logger.info(f"Memuat Google API Key: {'OK' if settings.google_api_key != 'YOUR_F
 
 # Sertakan router Telegram
 app.include_router(telegram_router)
+app.include_router(bulk_router)
 
 @app.get("/", tags=["root"])
 def read_root():
@@ -30,11 +123,28 @@ def read_root():
     logger.info("Root endpoint diakses.")
     return {"message": f"Server {app.title} (Gemini) berjalan."}
 
-# Anda bisa menambahkan event startup/shutdown jika perlu
-# @app.on_event("startup")
-# async def startup_event():
-#     logger.info("Aplikasi FastAPI dimulai...")
 
-# @app.on_event("shutdown")
-# async def shutdown_event():
-#     logger.info("Aplikasi FastAPI dimatikan...")
\ No newline at end of file
+@app.get("/health/live", tags=["health"])
+def liveness():
+    """Liveness: proses hidup dan event loop merespons (tanpa cek dependensi)."""
+    return {"status": "ok"}
+
+@app.get("/health/ready", tags=["health"])
+async def readiness():
+    """Readiness: warm-up selesai, client model siap, antrian job ada, dan Redis bisa di-ping saat ini."""
+    checks = {
+        "started": getattr(app.state, "ready", False), # False selama warm-up & shutdown
+        "models": getattr(app.state, "models_error", "belum warm-up") is None,
+        "redis": await ping_redis(timeout=1.0),
+        "job_queue": getattr(app.state, "job_queue", None) is not None,
+    }
+    ready = all(checks.values())
+    body = {"status": "ready" if ready else "not_ready", "checks": checks}
+    if getattr(app.state, "models_error", None):
+        body["error"] = app.state.models_error
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics", tags=["observability"])
+def metrics():
+    """Metrik format Prometheus: durasi per tahap, token LLM, gauge in-flight."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
@@ -1,25 +1,434 @@
 # memory_service.py
 from abc import ABC, abstractmethod
+import copy
+import asyncio
 import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import orjson
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+from cachetools import TTLCache
+from fastapi import Request
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from config import settings
+from agent_logic import summarize_conversation
+from state_service import get_redis_pool
+from token_counter import count_tokens, truncate_tokens
+from observability import MEMORY_HISTORY_TOKENS, MEMORY_SUMMARIZATIONS, STAGE_DURATION
 
 logger = logging.getLogger(__name__)
 
+# (ringkasan lama, transkrip giliran yang dilipat) -> ringkasan baru
+Summarizer = Callable[[str, str], Awaitable[str]]
+
+@dataclass
+class ConversationTurn:
+    role: str # 'human' atau 'ai'
+    content: str
+    tokens: int
+
+@dataclass
+class ConversationMemory:
+    summary: str = ""
+    summary_tokens: int = 0
+    format: Optional[str] = None # Format test case terakhir, dipakai untuk follow-up
+    turns: List[ConversationTurn] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.turns and not self.summary
+
+
 class BaseMemoryService(ABC):
     """
-    Struktur dasar untuk memory service.
-    Dikosongkan karena tidak ada state yang perlu disimpan untuk /start dan /help.
+    Memori percakapan per chat, agar follow-up ("tambahkan negative case untuk itu")
+    tidak perlu mengirim ulang PRD. Riwayat dibatasi anggaran token (tiktoken):
+    - setiap giliran dipotong ke `turn_max_tokens` saat disimpan
+    - jika ringkasan + giliran melewati `max_tokens`, giliran tertua dilipat ke
+      ringkasan bergulir (ringkasan lama + giliran yang dilipat -> ringkasan baru)
+    Peringkasan (panggilan LLM) berjalan sebagai task background per chat, sehingga
+    job hanya membayar penambahan giliran. Hasilnya dipakai sebagai `chat_history` AgentExecutor.
     """
-    pass
+
+    def __init__(
+        self,
+        max_tokens: int,
+        turn_max_tokens: int,
+        summary_max_tokens: int,
+        summarizer: Optional[Summarizer] = None
+    ):
+        self.max_tokens = max_tokens
+        self.turn_max_tokens = turn_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer
+        self._compactions: Dict[int, asyncio.Task] = {} # chat_id -> task peringkasan background
+
+    @abstractmethod
+    async def load(self, chat_id: int) -> ConversationMemory:
+        """Memori chat (kosong jika belum ada)."""
+
+    async def clear(self, chat_id: int):
+        """
+        Menghapus seluruh memori chat (dipakai /start). Peringkasan yang sedang berjalan
+        dibatalkan, dan generasi memori dinaikkan agar peringkasan dari proses lain
+        tidak melipat percakapan baru.
+        """
+        task = self._compactions.get(chat_id)
+        if task is not None:
+            task.cancel()
+        await self._clear(chat_id)
+
+    @abstractmethod
+    async def _clear(self, chat_id: int):
+        """Menghapus memori chat dan menaikkan generasinya."""
+
+    @abstractmethod
+    async def _generation(self, chat_id: int) -> int:
+        """Generasi memori chat; naik setiap `clear`."""
+
+    @abstractmethod
+    async def _append(self, chat_id: int, turns: List[ConversationTurn], format: Optional[str]) -> int:
+        """Menambahkan giliran di akhir riwayat; mengembalikan total token memori (tanpa memuat giliran)."""
+
+    @abstractmethod
+    async def _fold(
+        self, chat_id: int, generation: int, count: int, folded_tokens: int, summary: str, summary_tokens: int
+    ) -> bool:
+        """
+        Membuang `count` giliran tertua (`folded_tokens` token) dan menyimpan ringkasan barunya.
+        Tidak menulis apa pun (False) jika memori sudah di-clear sejak `generation` dibaca.
+        """
+
+    @abstractmethod
+    async def get_follow_up_format(self, chat_id: int) -> Optional[str]:
+        """Format test case terakhir jika chat punya riwayat percakapan; None jika belum ada."""
+
+    async def _lock_fold(self, chat_id: int) -> bool:
+        """Mencegah dua peringkasan bersamaan untuk chat yang sama."""
+        return True
+
+    async def _unlock_fold(self, chat_id: int):
+        pass
+
+    def _make_turn(self, role: str, content: str) -> ConversationTurn:
+        content = truncate_tokens(content, self.turn_max_tokens)
+        return ConversationTurn(role, content, count_tokens(content))
+
+    async def add_exchange(self, chat_id: int, user_text: str, ai_text: str, format: Optional[str] = None):
+        """
+        Menyimpan satu pasang giliran (permintaan pengguna & jawaban bot). Jika riwayat melewati
+        `max_tokens`, peringkasan dijadwalkan di background; job tidak menunggu panggilan LLM.
+        """
+        try:
+            with STAGE_DURATION.time(stage="memory", op="append"):
+                total_tokens = await self._append(
+                    chat_id, [self._make_turn("human", user_text), self._make_turn("ai", ai_text)], format
+                )
+            if total_tokens > self.max_tokens:
+                self.schedule_compaction(chat_id)
+        except Exception as e:
+            # Memori bersifat pelengkap: kegagalan tidak menggagalkan job
+            logger.error(f"Gagal menyimpan memori percakapan chat {chat_id}: {e}")
+
+    def schedule_compaction(self, chat_id: int):
+        """Menjalankan `compact` di background; satu task per chat (giliran baru ikut terlipat oleh task itu)."""
+        if chat_id in self._compactions:
+            return
+        task = asyncio.create_task(self._run_compaction(chat_id))
+        self._compactions[chat_id] = task
+
+    async def _run_compaction(self, chat_id: int):
+        try:
+            # Giliran yang ditambahkan selama peringkasan bisa membuat riwayat melewati anggaran lagi
+            while await self.compact(chat_id):
+                pass
+        except Exception as e:
+            logger.error(f"Peringkasan memori chat {chat_id} gagal: {e}")
+        finally:
+            del self._compactions[chat_id]
+
+    async def drain(self, timeout: float):
+        """Menunggu peringkasan background selesai (shutdown / benchmark), sisanya dibatalkan."""
+        tasks = list(self._compactions.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logger.warning(f"Peringkasan memori {len(pending)} chat dibatalkan setelah {timeout}s.")
+
+    def _fold_count(self, memory: ConversationMemory) -> int:
+        """Jumlah giliran tertua yang harus dilipat agar sisa giliran muat di anggaran."""
+        budget = self.max_tokens - self.summary_max_tokens
+        remaining = sum(turn.tokens for turn in memory.turns)
+        count = 0
+        while count < len(memory.turns) and remaining > budget:
+            remaining -= memory.turns[count].tokens
+            count += 1
+        return count
+
+    async def compact(self, chat_id: int) -> bool:
+        """
+        Melipat giliran tertua ke ringkasan bergulir jika riwayat melewati `max_tokens`.
+        Biasanya dipanggil dari task background (`schedule_compaction`). True jika ada giliran dilipat.
+        """
+        memory = await self.load(chat_id)
+        if memory.total_tokens <= self.max_tokens or not await self._lock_fold(chat_id):
+            return False
+        try:
+            generation = await self._generation(chat_id) # Dibaca sebelum memori: clear sesudahnya terdeteksi
+            memory = await self.load(chat_id)
+            count = self._fold_count(memory)
+            if count == 0:
+                return False
+            summary = memory.summary
+            if self.summarizer:
+                transcript = "\n\n".join(
+                    f"{'Pengguna' if turn.role == 'human' else 'Bot'}: {turn.content}"
+                    for turn in memory.turns[:count]
+                )
+                try:
+                    with STAGE_DURATION.time(stage="memory", op="summarize"):
+                        summary = await self.summarizer(memory.summary, transcript)
+                    summary = truncate_tokens(summary.strip(), self.summary_max_tokens)
+                    MEMORY_SUMMARIZATIONS.inc(result="ok")
+                except Exception as e:
+                    # Giliran tetap dibuang agar batas token terjaga; ringkasan lama dipertahankan
+                    MEMORY_SUMMARIZATIONS.inc(result="failed")
+                    logger.warning(f"Peringkasan memori chat {chat_id} gagal: {e}")
+            folded_tokens = sum(turn.tokens for turn in memory.turns[:count])
+            summary_tokens = count_tokens(summary) if summary else 0
+            if not await self._fold(chat_id, generation, count, folded_tokens, summary, summary_tokens):
+                logger.info(f"Memori chat {chat_id} di-clear saat peringkasan, hasil peringkasan dibuang.")
+                return False
+            logger.debug(f"{count} giliran memori chat {chat_id} dilipat ke ringkasan.")
+            return True
+        finally:
+            await self._unlock_fold(chat_id)
+
+    def to_messages(self, memory: ConversationMemory) -> List[BaseMessage]:
+        """
+        Riwayat sebagai pesan LangChain. Anggaran token ditegakkan lagi di sini
+        (giliran tertua dibuang) untuk berjaga jika peringkasan tertinggal.
+        """
+        turns = memory.turns
+        tokens = memory.total_tokens
+        while turns and tokens > self.max_tokens:
+            tokens -= turns[0].tokens
+            turns = turns[1:]
+        MEMORY_HISTORY_TOKENS.observe(tokens)
+
+        messages: List[BaseMessage] = []
+        if memory.summary:
+            messages.append(SystemMessage(content=f"Ringkasan percakapan sebelumnya:\n{memory.summary}"))
+        for turn in turns:
+            message_class = HumanMessage if turn.role == "human" else AIMessage
+            messages.append(message_class(content=turn.content))
+        return messages
+
+    async def get_chat_history(self, chat_id: int) -> List[BaseMessage]:
+        """`chat_history` untuk AgentExecutor; kosong jika memori tidak bisa dibaca."""
+        try:
+            with STAGE_DURATION.time(stage="memory", op="load"):
+                memory = await self.load(chat_id)
+        except Exception as e:
+            logger.error(f"Gagal membaca memori percakapan chat {chat_id}: {e}")
+            return []
+        return self.to_messages(memory)
+
 
 class InMemoryMemoryService(BaseMemoryService):
     """
-    Implementasi memory service dalam memori.
-    Dikosongkan karena tidak ada state yang perlu disimpan.
+    Implementasi memory service dalam memori proses (untuk lokal/test).
+    Tidak dibagi antar worker; jumlah chat dibatasi dan memori kedaluwarsa setelah TTL.
     """
-    def __init__(self):
-        logger.info("Menggunakan InMemory Memory Service (Kosong)")
-        pass
 
-def get_memory_service() -> BaseMemoryService:
-    """Dependency injector untuk memory service."""
-    return InMemoryMemoryService()
\ No newline at end of file
+    def __init__(self, max_chats: int, ttl_seconds: int, **kwargs):
+        super().__init__(**kwargs)
+        self.memories: TTLCache = TTLCache(maxsize=max_chats, ttl=ttl_seconds)
+        self._folding = set()
+        self._generations: TTLCache = TTLCache(maxsize=max_chats, ttl=ttl_seconds)
+        logger.info("Menggunakan InMemory Memory Service")
+
+    async def load(self, chat_id: int) -> ConversationMemory:
+        memory = self.memories.get(chat_id)
+        return copy.deepcopy(memory) if memory else ConversationMemory()
+
+    async def _clear(self, chat_id: int):
+        self.memories.pop(chat_id, None)
+        self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+
+    async def _generation(self, chat_id: int) -> int:
+        return self._generations.get(chat_id, 0)
+
+    async def get_follow_up_format(self, chat_id: int) -> Optional[str]:
+        memory = self.memories.get(chat_id)
+        return memory.format if memory and not memory.is_empty else None
+
+    async def _append(self, chat_id: int, turns: List[ConversationTurn], format: Optional[str]) -> int:
+        memory = self.memories.get(chat_id) or ConversationMemory()
+        memory.turns.extend(turns)
+        if format:
+            memory.format = format
+        self.memories[chat_id] = memory # Set ulang: TTL dihitung dari penulisan terakhir
+        return memory.total_tokens
+
+    async def _fold(
+        self, chat_id: int, generation: int, count: int, folded_tokens: int, summary: str, summary_tokens: int
+    ) -> bool:
+        memory = self.memories.get(chat_id)
+        if not memory or self._generations.get(chat_id, 0) != generation:
+            return False
+        del memory.turns[:count]
+        memory.summary = summary
+        memory.summary_tokens = summary_tokens
+        return True
+
+    async def _lock_fold(self, chat_id: int) -> bool:
+        if chat_id in self._folding:
+            return False
+        self._folding.add(chat_id)
+        return True
+
+    async def _unlock_fold(self, chat_id: int):
+        self._folding.discard(chat_id)
+
+
+class RedisMemoryService(BaseMemoryService):
+    """
+    Memori percakapan di Redis, dibagi antar worker:
+    - `bot:memory:{chat_id}`       : hash ringkasan, jumlah token ringkasan & giliran, format terakhir
+    - `bot:memory:{chat_id}:turns` : list giliran, masing-masing orjson ringkas [peran, isi, token]
+    - `bot:memory:{chat_id}:generation` : naik setiap clear; pelipatan dari generasi lama dibuang
+    Giliran baru hanya ditambahkan di ekor list, sehingga pelipatan (LTRIM dari kepala)
+    aman berjalan bersamaan dengan penambahan.
+    """
+
+    def __init__(self, client: redis.Redis, ttl_seconds: int, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = "bot:memory:"
+        # Batas waktu kunci peringkasan (jika proses mati di tengah panggilan LLM)
+        self.fold_lock_seconds = 120
+
+    def _get_keys(self, chat_id: int) -> Tuple[str, str]:
+        key = f"{self.prefix}{chat_id}"
+        return key, f"{key}:turns"
+
+    @staticmethod
+    def _encode_turn(turn: ConversationTurn) -> bytes:
+        return orjson.dumps(["h" if turn.role == "human" else "a", turn.content, turn.tokens])
+
+    @staticmethod
+    def _decode_turn(raw: str) -> ConversationTurn:
+        role, content, tokens = orjson.loads(raw)
+        return ConversationTurn("human" if role == "h" else "ai", content, tokens)
+
+    async def load(self, chat_id: int) -> ConversationMemory:
+        meta_key, turns_key = self._get_keys(chat_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(meta_key)
+            pipe.lrange(turns_key, 0, -1)
+            meta, raw_turns = await pipe.execute()
+        return ConversationMemory(
+            summary=meta.get("summary", ""),
+            summary_tokens=int(meta.get("summary_tokens", 0)),
+            format=meta.get("format"),
+            turns=[self._decode_turn(raw) for raw in raw_turns]
+        )
+
+    def _generation_key(self, chat_id: int) -> str:
+        return f"{self.prefix}{chat_id}:generation"
+
+    async def _clear(self, chat_id: int):
+        try:
+            generation_key = self._generation_key(chat_id)
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(*self._get_keys(chat_id))
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Gagal menghapus memori percakapan chat {chat_id}: {e}")
+
+    async def _generation(self, chat_id: int) -> int:
+        return int(await self.client.get(self._generation_key(chat_id)) or 0)
+
+    async def get_follow_up_format(self, chat_id: int) -> Optional[str]:
+        # Hash meta selalu berisi format sejak giliran pertama; satu round trip ringan di jalur webhook
+        try:
+            return await self.client.hget(self._get_keys(chat_id)[0], "format")
+        except Exception as e:
+            logger.error(f"Gagal membaca memori percakapan chat {chat_id}: {e}")
+            return None
+
+    async def _append(self, chat_id: int, turns: List[ConversationTurn], format: Optional[str]) -> int:
+        # Total token dijaga sebagai counter di hash meta: cek anggaran tanpa LRANGE seluruh riwayat
+        meta_key, turns_key = self._get_keys(chat_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(turns_key, *(self._encode_turn(turn) for turn in turns))
+            pipe.hincrby(meta_key, "turn_tokens", sum(turn.tokens for turn in turns))
+            pipe.hget(meta_key, "summary_tokens")
+            if format:
+                pipe.hset(meta_key, "format", format)
+            pipe.expire(turns_key, self.ttl_seconds)
+            pipe.expire(meta_key, self.ttl_seconds)
+            results = await pipe.execute()
+        return int(results[1]) + int(results[2] or 0)
+
+    async def _fold(
+        self, chat_id: int, generation: int, count: int, folded_tokens: int, summary: str, summary_tokens: int
+    ) -> bool:
+        # Generasi dicek (WATCH) dalam transaksi yang sama dengan LTRIM: clear di tengah jalan membatalkannya
+        meta_key, turns_key = self._get_keys(chat_id)
+        generation_key = self._generation_key(chat_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(generation_key)
+                if int(await pipe.get(generation_key) or 0) != generation:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.ltrim(turns_key, count, -1)
+                pipe.hincrby(meta_key, "turn_tokens", -folded_tokens)
+                pipe.hset(meta_key, mapping={"summary": summary, "summary_tokens": summary_tokens})
+                pipe.expire(meta_key, self.ttl_seconds)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def _lock_fold(self, chat_id: int) -> bool:
+        meta_key, _ = self._get_keys(chat_id)
+        return bool(await self.client.set(f"{meta_key}:folding", 1, nx=True, ex=self.fold_lock_seconds))
+
+    async def _unlock_fold(self, chat_id: int):
+        meta_key, _ = self._get_keys(chat_id)
+        await self.client.delete(f"{meta_key}:folding")
+
+
+# --- Factory & Dependency ---
+def create_memory_service() -> BaseMemoryService:
+    """Membuat memory service sesuai `settings.memory_backend` ('redis' atau 'memory')."""
+    options = dict(
+        max_tokens=settings.memory_max_tokens,
+        turn_max_tokens=settings.memory_turn_max_tokens,
+        summary_max_tokens=settings.memory_summary_max_tokens,
+        summarizer=summarize_conversation
+    )
+    redis_pool = get_redis_pool() if settings.memory_backend == "redis" else None
+    if not redis_pool:
+        return InMemoryMemoryService(settings.memory_local_chats, settings.memory_ttl, **options)
+    return RedisMemoryService(redis.Redis(connection_pool=redis_pool), settings.memory_ttl, **options)
+
+def get_memory_service(request: Request) -> BaseMemoryService:
+    """Dependency: memory service milik aplikasi (dibuat di lifespan main.py)."""
+    return request.app.state.memory_service
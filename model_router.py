@@ -0,0 +1,363 @@
+# model_router.py
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple, TypeVar
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from config import settings
+from observability import MODEL_BREAKER_OPEN, MODEL_CALLS, MODEL_HEDGES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Modul asal exception penyedia model (dicek lewat nama agar SDK tidak perlu diimpor di sini)
+PROVIDER_ERROR_MODULES = ("google.api_core", "langchain_google_genai", "openai", "grpc", "httpx")
+# Hanya error sementara: rate limit, 5xx, timeout. 400/403/safety block tidak di-retry / failover.
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError", "BadGateway",
+    "GatewayTimeout", "DeadlineExceeded", "RateLimitError", "APITimeoutError", "APIConnectionError"
+}
+TRANSIENT_GRPC_CODES = {"UNAVAILABLE", "RESOURCE_EXHAUSTED", "DEADLINE_EXCEEDED"}
+
+def is_provider_error(exc: BaseException) -> bool:
+    """Error sementara dari penyedia model (rate limit, 5xx, timeout, jaringan): layak di-retry & failover."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in TRANSIENT_STATUS_CODES
+    if not type(exc).__module__.startswith(PROVIDER_ERROR_MODULES):
+        # Error penyedia yang dibungkus (misal ChatGoogleGenerativeAIError): lihat penyebabnya
+        cause = exc.__cause__
+        return cause is not None and cause is not exc and is_provider_error(cause)
+    if type(exc).__name__ in TRANSIENT_ERROR_NAMES:
+        return True
+    for attr in ("status_code", "code"): # openai: status_code; google.api_core: code (HTTP)
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value in TRANSIENT_STATUS_CODES
+    code = getattr(exc, "code", None)
+    if callable(code): # grpc: code() -> StatusCode
+        try:
+            return getattr(code(), "name", "") in TRANSIENT_GRPC_CODES
+        except Exception:
+            return False
+    cause = exc.__cause__
+    return cause is not None and cause is not exc and is_provider_error(cause)
+
+
+# --- Model yang Menjawab ---
+class ServedModels:
+    """Model yang menjawab panggilan router di dalam blok `track_served_models`."""
+
+    def __init__(self, parent: Optional["ServedModels"] = None):
+        self.parent = parent
+        self.models: List[str] = []
+        self.degraded = False # Ada jawaban dari failover / hedge, bukan model pilihan tier
+
+    def record(self, model: str, degraded: bool):
+        tracker = self
+        while tracker is not None: # Blok bersarang juga tercatat di blok luar
+            tracker.models.append(model)
+            tracker.degraded = tracker.degraded or degraded
+            tracker = tracker.parent
+
+_served_models: ContextVar[Optional[ServedModels]] = ContextVar("served_models", default=None)
+
+@contextmanager
+def track_served_models() -> Iterator[ServedModels]:
+    """
+    Mencatat model yang menjawab (termasuk dari task hedge / fan-out yang dibuat di dalam blok).
+    Dipakai pemanggil cache: hasil failover / hedge tidak disimpan sebagai hasil model tier.
+    """
+    served = ServedModels(_served_models.get())
+    token = _served_models.set(served)
+    try:
+        yield served
+    finally:
+        _served_models.reset(token)
+
+def _record_served(model: str, intended: str):
+    served = _served_models.get()
+    if served is not None:
+        served.record(model, model != intended)
+
+
+class ModelStats:
+    """Statistik per model di proses ini: latensi terakhir, error, dan circuit breaker."""
+
+    def __init__(self, window: int, breaker_threshold: int, breaker_cooldown: float):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window) # True = sukses
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.breaker_threshold:
+            # Dibuka (lagi): percobaan half-open yang gagal memulai cooldown baru
+            self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        """Circuit terbuka selama cooldown; setelahnya half-open (permintaan berikutnya jadi percobaan)."""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.breaker_cooldown
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class ModelRouter:
+    """
+    Memilih model untuk setiap panggilan LLM:
+    - tier    : PRD kecil (token di bawah batas per format) ke model cepat, sisanya ke model utama
+    - failover: model cadangan dicoba berurutan; model dengan circuit terbuka dipindah ke belakang
+    - retry   : error sementara penyedia di-retry per model (tenacity, backoff + jitter)
+    - hedging : jika model pertama belum selesai setelah persentil latensinya, kandidat
+                berikutnya dijalankan paralel dan hasil tercepat dipakai
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        fast: Optional[str],
+        fast_max_tokens: Dict[str, int],
+        fallbacks: List[str],
+        max_attempts: int,
+        timeout: float,
+        hedge_enabled: bool,
+        hedge_percentile: float,
+        hedge_min_samples: int,
+        breaker_threshold: int,
+        breaker_cooldown: float,
+        stats_window: int
+    ):
+        self.primary = primary
+        self.fast = fast
+        self.fast_max_tokens = fast_max_tokens
+        self.fallbacks = fallbacks
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.stats_window = stats_window
+        self.stats: Dict[str, ModelStats] = {}
+
+    def stats_for(self, model: str) -> ModelStats:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats(self.stats_window, self.breaker_threshold, self.breaker_cooldown)
+        return stats
+
+    def tier_model(self, prompt_tokens: int, format: str) -> str:
+        """Model pilihan tier (tanpa memperhitungkan kesehatan model)."""
+        use_fast = self.fast and prompt_tokens <= self.fast_max_tokens.get(format.lower(), 0)
+        return self.fast if use_fast else self.primary
+
+    def choose(self, prompt_tokens: int, format: str) -> List[str]:
+        """Urutan model kandidat: model tier terpilih, lalu cadangan; yang sedang tidak sehat di belakang."""
+        ordered = [self.tier_model(prompt_tokens, format), self.primary, *self.fallbacks]
+        candidates = list(dict.fromkeys(model for model in ordered if model))
+        # Stabil: urutan konfigurasi dipertahankan di antara model yang sama sehatnya
+        return sorted(candidates, key=lambda model: (
+            self.stats_for(model).is_open, self.stats_for(model).error_rate >= 0.5
+        ))
+
+    async def _call(self, model: str, fn: Callable[[str], Awaitable[T]], role: str) -> T:
+        """Satu model dengan retry untuk error sementara; hasil & error dicatat di statistik."""
+        stats = self.stats_for(model)
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential_jitter(initial=0.5, max=8.0),
+            retry=retry_if_exception(is_provider_error),
+            reraise=True
+        ):
+            with attempt:
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(fn(model), self.timeout)
+                except Exception as e:
+                    MODEL_CALLS.inc(model=model, role=role, result="error")
+                    if is_provider_error(e): # Bug / request tidak valid tidak membuka circuit
+                        stats.record_failure()
+                        MODEL_BREAKER_OPEN.set(1 if stats.is_open else 0, model=model)
+                    raise
+                stats.record_success(time.perf_counter() - start)
+                MODEL_CALLS.inc(model=model, role=role, result="ok")
+                MODEL_BREAKER_OPEN.set(0, model=model)
+                return result
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        stats = self.stats_for(model)
+        if not self.hedge_enabled or len(stats.latencies) < self.hedge_min_samples:
+            return None
+        return stats.percentile(self.hedge_percentile)
+
+    async def _hedged(
+        self,
+        primary: str,
+        secondary: str,
+        fn: Callable[[str], Awaitable[T]],
+        delay: float,
+        attempted: Set[str]
+    ) -> Tuple[T, str]:
+        """
+        Menjalankan `secondary` jika `primary` belum selesai setelah `delay`; hasil sukses pertama dipakai.
+        Mengembalikan (hasil, model yang menjawab). Task yang belum selesai selalu dibatalkan,
+        termasuk jika pemanggil sendiri dibatalkan.
+        """
+        tasks = {asyncio.create_task(self._call(primary, fn, "primary")): ("primary", primary)}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                attempted.add(secondary)
+                tasks[asyncio.create_task(self._call(secondary, fn, "hedge"))] = ("hedge", secondary)
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        role, model = tasks[task]
+                        MODEL_HEDGES.inc(winner=role if len(tasks) > 1 else "unhedged")
+                        return task.result(), model
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def run(
+        self,
+        fn: Callable[[str], Awaitable[T]],
+        prompt_tokens: int,
+        format: str,
+        hedge: bool = True
+    ) -> T:
+        """
+        Menjalankan `fn(model)` dengan model terpilih dan failover ke kandidat berikutnya.
+        Hanya error sementara penyedia (`is_provider_error`) yang memicu failover; error lain
+        (request tidak valid, bug parsing) langsung diteruskan.
+        `hedge=False` untuk panggilan berefek samping / mahal digandakan (misal agent dengan tools).
+        """
+        candidates = self.choose(prompt_tokens, format)
+        intended = self.tier_model(prompt_tokens, format)
+        attempted: Set[str] = set()
+        error: Optional[BaseException] = None
+        for index, model in enumerate(candidates):
+            if model in attempted:
+                continue # Sudah dijalankan sebagai hedge
+            attempted.add(model)
+            remaining = [other for other in candidates[index + 1:] if other not in attempted]
+            delay = self._hedge_delay(model) if hedge and remaining else None
+            served = model
+            try:
+                if delay is not None:
+                    result, served = await self._hedged(model, remaining[0], fn, delay, attempted)
+                else:
+                    result = await self._call(model, fn, "primary" if index == 0 else "fallback")
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                logger.warning(f"Model {model} gagal ({type(e).__name__}: {e}), mencoba model berikutnya.")
+                error = e
+                continue
+            _record_served(served, intended)
+            return result
+        raise error
+
+    async def stream(
+        self,
+        fn: Callable[[str], AsyncIterator[T]],
+        prompt_tokens: int,
+        format: str
+    ) -> AsyncIterator[T]:
+        """
+        Versi streaming: failover (hanya error sementara) sebelum potongan pertama terkirim;
+        setelah itu error diteruskan ke pemanggil. Tidak di-hedge.
+        `model_timeout` berlaku per potongan: stream yang macet dianggap timeout.
+        """
+        candidates = self.choose(prompt_tokens, format)
+        intended = self.tier_model(prompt_tokens, format)
+        for index, model in enumerate(candidates):
+            stats = self.stats_for(model)
+            role = "primary" if index == 0 else "fallback"
+            start = time.perf_counter()
+            started = False
+            pieces = fn(model).__aiter__()
+            try:
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(pieces.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield piece
+            except Exception as e:
+                MODEL_CALLS.inc(model=model, role=role, result="error")
+                transient = is_provider_error(e)
+                if transient:
+                    stats.record_failure()
+                    MODEL_BREAKER_OPEN.set(1 if stats.is_open else 0, model=model)
+                if started or not transient or index + 1 == len(candidates):
+                    raise
+                logger.warning(f"Model {model} gagal sebelum streaming dimulai ({e}), mencoba model berikutnya.")
+                continue
+            finally:
+                aclose = getattr(pieces, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            stats.record_success(time.perf_counter() - start)
+            MODEL_CALLS.inc(model=model, role=role, result="ok")
+            _record_served(model, intended)
+            return
+
+
+# --- Instance Bersama ---
+_model_router: Optional[ModelRouter] = None
+
+def get_model_router() -> ModelRouter:
+    """Router model proses ini (statistik latensi/error dikumpulkan per proses)."""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter(
+            settings.model,
+            settings.model_fast,
+            settings.model_fast_max_tokens,
+            settings.model_fallbacks,
+            settings.model_max_attempts,
+            settings.model_timeout,
+            settings.model_hedge_enabled,
+            settings.model_hedge_percentile,
+            settings.model_hedge_min_samples,
+            settings.model_breaker_threshold,
+            settings.model_breaker_cooldown,
+            settings.model_stats_window
+        )
+    return _model_router
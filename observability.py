@@ -0,0 +1,259 @@
+# observability.py
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# --- Metrik format Prometheus (tanpa dependensi tambahan) ---
+# Cukup murah untuk selalu aktif di produksi: setiap observasi hanya
+# lookup dict + bisect di bawah satu lock per metrik.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_registry: List["_Metric"] = []
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [hitungan per bucket (+Inf di akhir), sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+def render_metrics() -> str:
+    """Seluruh metrik dalam format teks Prometheus (untuk route /metrics)."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Metrik Aplikasi ---
+STAGE_DURATION = Histogram(
+    "qa_bot_stage_duration_seconds",
+    "Durasi tiap tahap pemrosesan update (webhook, state Redis, Telegram, job, generasi).",
+    ("stage", "op")
+)
+WEBHOOK_IN_FLIGHT = Gauge("qa_bot_webhook_in_flight", "Update Telegram (webhook/polling) yang sedang diproses.")
+POLLED_UPDATES = Counter("qa_bot_polled_updates_total", "Update yang diterima lewat getUpdates.")
+JOBS_IN_FLIGHT = Gauge("qa_bot_jobs_in_flight", "Job pembuatan test case yang sedang diproses worker.")
+JOBS_TOTAL = Counter("qa_bot_jobs_total", "Job yang selesai diproses worker menurut hasilnya.", ("result",))
+LLM_IN_FLIGHT = Gauge("qa_bot_llm_in_flight", "Panggilan LLM yang sedang berjalan.", ("model",))
+LLM_DURATION = Histogram("qa_bot_llm_duration_seconds", "Durasi panggilan LLM.", ("model", "format"))
+LLM_TOKENS = Histogram(
+    "qa_bot_llm_tokens", "Token per panggilan LLM.", ("model", "format", "direction"), buckets=TOKEN_BUCKETS
+)
+LLM_TOKENS_TOTAL = Counter("qa_bot_llm_tokens_total", "Total token LLM.", ("model", "format", "direction"))
+LLM_ERRORS = Counter("qa_bot_llm_errors_total", "Panggilan LLM yang gagal.", ("model",))
+JOB_QUEUE_DEPTH = Gauge("qa_bot_job_queue_depth", "Job yang diterima dan belum selesai (menunggu + diproses).")
+JOB_QUEUE_WAIT = Histogram("qa_bot_job_queue_wait_seconds", "Waktu tunggu job dari masuk antrian hingga mulai diproses.")
+JOBS_REJECTED = Counter("qa_bot_jobs_rejected_total", "Job yang ditolak admission control.", ("reason",))
+LLM_SLOT_WAIT = Histogram("qa_bot_llm_slot_wait_seconds", "Waktu tunggu slot konkurensi LLM.")
+UPDATES_DUPLICATE = Counter(
+    "qa_bot_updates_duplicate_total", "Update Telegram kiriman ulang yang diabaikan.", ("tier",)
+)
+STATE_CACHE_LOOKUPS = Counter("qa_bot_state_cache_total", "Lookup near cache state percakapan.", ("result",))
+MEMORY_HISTORY_TOKENS = Histogram(
+    "qa_bot_memory_history_tokens", "Token chat_history yang dikirim ke agent.", buckets=TOKEN_BUCKETS
+)
+MEMORY_SUMMARIZATIONS = Counter(
+    "qa_bot_memory_summarizations_total", "Peringkasan bergulir memori percakapan.", ("result",)
+)
+SIMILAR_PRD_LOOKUPS = Counter("qa_bot_similar_prd_total", "Lookup indeks PRD hampir sama.", ("result",))
+BULK_ITEMS = Counter("qa_bot_bulk_items_total", "Item batch bulk API menurut hasilnya.", ("result",))
+BULK_IN_FLIGHT = Gauge("qa_bot_bulk_in_flight", "Item batch bulk API yang sedang dibuatkan test case.")
+DELIVERY_WAIT = Histogram("qa_bot_delivery_wait_seconds", "Waktu tunggu kuota kirim Telegram (rate limiter).", ("kind",))
+DELIVERY_QUEUED = Gauge("qa_bot_delivery_queued", "Balasan di antrian kirim (belum dikirim task pengirim chat).")
+DELIVERY_SENT = Counter("qa_bot_delivery_sent_total", "Balasan keluar menurut cara kirim.", ("kind",))
+TELEGRAM_RETRY_AFTER = Counter("qa_bot_telegram_retry_after_total", "Balasan 429 (retry_after) dari Bot API.", ("method",))
+TYPING_COALESCED = Counter("qa_bot_typing_coalesced_total", "Typing action yang tidak dikirim.", ("reason",))
+MODEL_CALLS = Counter(
+    "qa_bot_model_calls_total", "Panggilan model lewat router menurut peran & hasil.", ("model", "role", "result")
+)
+MODEL_BREAKER_OPEN = Gauge("qa_bot_model_breaker_open", "Circuit breaker model terbuka (1) atau tertutup (0).", ("model",))
+MODEL_HEDGES = Counter("qa_bot_model_hedges_total", "Panggilan ber-hedge menurut pemenangnya.", ("winner",))
+SECTION_RESULTS = Counter("qa_bot_prd_sections_total", "Bagian PRD menurut hasil (dipakai ulang / dibuat).", ("result",))
+CACHE_LOOKUPS = Counter("qa_bot_testcase_cache_total", "Lookup cache hasil test case.", ("result",))
+
+
+class LLMMetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Callback LangChain yang mencatat durasi, token input/output, dan in-flight
+    untuk setiap panggilan chat model (termasuk langkah perencanaan agent).
+    Label format diambil dari metadata run (lihat agent_logic.get_testcase_chain).
+    """
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[float, str, str]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs):
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or (kwargs.get("invocation_params") or {}).get("model", "unknown")
+        self._runs[run_id] = (time.perf_counter(), str(model), str(metadata.get("format", "-")))
+        LLM_IN_FLIGHT.inc(model=model)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        start, model, format = run
+        LLM_IN_FLIGHT.dec(model=model)
+        LLM_DURATION.observe(time.perf_counter() - start, model=model, format=format)
+
+        usage: Dict[str, int] = {}
+        for generations in response.generations:
+            for generation in generations:
+                message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for direction in ("input_tokens", "output_tokens"):
+                    usage[direction] = usage.get(direction, 0) + message_usage.get(direction, 0)
+        for direction, tokens in usage.items():
+            if tokens:
+                label = direction.replace("_tokens", "")
+                LLM_TOKENS.observe(tokens, model=model, format=format, direction=label)
+                LLM_TOKENS_TOTAL.inc(tokens, model=model, format=format, direction=label)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        LLM_IN_FLIGHT.dec(model=run[1])
+        LLM_ERRORS.inc(model=run[1])
+
+llm_metrics_handler = LLMMetricsCallbackHandler()
+
+
+# --- Trace ID per Update ---
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+class TraceIdFilter(logging.Filter):
+    """Menambahkan atribut `trace_id` ke setiap log record (dipakai di format log)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
\ No newline at end of file
@@ -0,0 +1,121 @@
+# pdf_ingestion.py
+import io
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import redis.asyncio as redis
+from config import settings
+from state_service import get_redis_pool
+from telegram_service import TelegramService
+
+logger = logging.getLogger(__name__)
+
+class PdfIngestionError(Exception):
+    """PDF ditolak atau gagal diproses; pesannya aman ditampilkan ke pengguna."""
+
+
+# --- Ekstraksi (berjalan di process pool) ---
+def _extract_pages(data: bytes, max_pages: int) -> List[str]:
+    """Parsing pypdf (CPU-bound) di proses terpisah agar event loop tidak terblokir."""
+    from pypdf import PdfReader # Diimpor di proses pool saja, tidak memperlambat startup web
+    reader = PdfReader(io.BytesIO(data))
+    if len(reader.pages) > max_pages:
+        raise PdfIngestionError(f"PDF memiliki {len(reader.pages)} halaman, maksimal {max_pages} halaman.")
+    return [page.extract_text() or "" for page in reader.pages]
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.pdf_extract_workers)
+    return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+# --- Service ---
+class PdfIngestionService:
+    """
+    Mengunduh PDF dari Telegram lalu mengekstrak teksnya.
+    Teks di-cache per `file_unique_id` dan halaman (Redis hash) sehingga
+    PDF yang dikirim ulang tidak diunduh & di-parse lagi.
+    """
+
+    def __init__(self, client: Optional[redis.Redis], telegram_service: TelegramService):
+        self.client = client
+        self.telegram_service = telegram_service
+        self.prefix = "bot:pdf:"
+        self.expire_seconds = settings.pdf_cache_ttl
+
+    def _get_key(self, file_unique_id: str) -> str:
+        return f"{self.prefix}{file_unique_id}"
+
+    async def _get_cached_pages(self, file_unique_id: str) -> Optional[List[str]]:
+        if not self.client:
+            return None
+        try:
+            cached = await self.client.hgetall(self._get_key(file_unique_id))
+        except Exception as e:
+            logger.error(f"Gagal membaca cache PDF dari Redis: {e}")
+            return None
+        if "pages" not in cached:
+            return None
+        page_count = int(cached["pages"])
+        pages = [cached.get(f"page:{index}") for index in range(page_count)]
+        if any(page is None for page in pages):
+            return None
+        return pages
+
+    async def _cache_pages(self, file_unique_id: str, pages: List[str]):
+        if not self.client:
+            return
+        mapping = {f"page:{index}": text for index, text in enumerate(pages)}
+        mapping["pages"] = len(pages)
+        try:
+            key = self._get_key(file_unique_id)
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, self.expire_seconds)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Gagal menyimpan cache PDF ke Redis: {e}")
+
+    async def extract_text(self, file_id: str, file_unique_id: str) -> str:
+        """Mengembalikan teks PDF (dari cache jika ada). Melempar PdfIngestionError jika ditolak."""
+        pages = await self._get_cached_pages(file_unique_id)
+        if pages is not None:
+            logger.info(f"Cache hit teks PDF {file_unique_id} ({len(pages)} halaman).")
+        else:
+            data = await self.telegram_service.download_file(file_id, settings.pdf_max_bytes)
+            if data is None:
+                raise PdfIngestionError("Gagal mengunduh PDF dari Telegram. Silakan coba kirim ulang.")
+
+            loop = asyncio.get_running_loop()
+            try:
+                pages = await loop.run_in_executor(
+                    get_process_pool(), _extract_pages, data, settings.pdf_max_pages
+                )
+            except PdfIngestionError:
+                raise
+            except Exception as e:
+                logger.error(f"Gagal mengekstrak PDF {file_unique_id}: {e}", exc_info=True)
+                raise PdfIngestionError("PDF tidak dapat dibaca. Pastikan file tidak rusak atau terkunci.")
+            await self._cache_pages(file_unique_id, pages)
+            logger.info(f"Teks PDF {file_unique_id} diekstrak ({len(pages)} halaman).")
+
+        text = "\n\n".join(page.strip() for page in pages if page.strip())
+        if not text:
+            raise PdfIngestionError("PDF tidak berisi teks yang bisa dibaca (mungkin hasil scan).")
+        return text
+
+
+def create_pdf_ingestion_service(telegram_service: TelegramService) -> PdfIngestionService:
+    redis_pool = get_redis_pool()
+    client = redis.Redis(connection_pool=redis_pool) if redis_pool else None
+    return PdfIngestionService(client, telegram_service)
\ No newline at end of file
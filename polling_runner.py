@@ -0,0 +1,235 @@
+# polling_runner.py
+import asyncio
+import logging
+import signal
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+import redis.asyncio as redis
+from pydantic import ValidationError
+from config import settings
+from agent_logic import warm_up_models
+from job_service import BaseJobQueue, create_job_queue
+from job_worker import JobWorker
+from memory_service import BaseMemoryService, create_memory_service
+from observability import POLLED_UPDATES, STAGE_DURATION, TraceIdFilter
+from pdf_ingestion import shutdown_process_pool
+from state_service import StateService, close_redis_pool, get_redis_pool, get_state_near_cache, ping_redis
+from telegram_router import Update, dispatch_update
+from telegram_service import TelegramService, create_http_client
+from telegram_delivery import drain_outbound_scheduler
+from testcase_cache import create_testcase_cache
+from prd_similarity import create_similarity_index
+from update_dedup import UpdateDeduplicator, create_update_deduplicator
+
+logger = logging.getLogger(__name__)
+
+class RedisOffsetStore:
+    """
+    Offset getUpdates (update_id terakhir + 1) disimpan di Redis, sehingga runner
+    yang restart melanjutkan dari batch terakhir yang selesai diproses.
+    """
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+        self.key = "bot:polling:offset"
+
+    async def get(self) -> Optional[int]:
+        value = await self.client.get(self.key)
+        return int(value) if value else None
+
+    async def set(self, offset: int):
+        await self.client.set(self.key, offset)
+
+
+def get_update_chat_id(update: Update) -> Optional[int]:
+    """Chat asal update (untuk menjaga urutan per chat); None jika tidak ada chat."""
+    if update.callback_query:
+        return update.callback_query.message.chat.id
+    if update.message:
+        return update.message.chat.id
+    return None
+
+
+class PollingRunner:
+    """
+    Mengambil update dengan getUpdates (batch + long polling) lalu memprosesnya
+    dengan logika yang sama seperti webhook (dispatch_update).
+    Dalam satu batch, chat berbeda diproses bersamaan dan update dari chat yang
+    sama diproses berurutan. Offset baru disimpan setelah seluruh batch selesai;
+    jika runner mati di tengah batch, update yang sudah diproses tersaring oleh
+    de-duplikasi update_id.
+    """
+
+    def __init__(
+        self,
+        telegram_service: TelegramService,
+        offset_store: RedisOffsetStore,
+        job_queue: BaseJobQueue,
+        memory_service: BaseMemoryService,
+        state_service: StateService,
+        deduplicator: Optional[UpdateDeduplicator],
+        batch_size: int,
+        poll_timeout: int,
+        concurrency: int
+    ):
+        self.telegram_service = telegram_service
+        self.offset_store = offset_store
+        self.job_queue = job_queue
+        self.memory_service = memory_service
+        self.state_service = state_service
+        self.deduplicator = deduplicator
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.concurrency = concurrency
+        self.max_backoff = 30.0
+
+    async def run(self, stop_event: asyncio.Event):
+        """Loop polling sampai `stop_event` di-set. Batch yang sedang diproses diselesaikan dulu."""
+        offset = await self.offset_store.get()
+        logger.info(f"Long polling dimulai dari offset {offset}.")
+        backoff = 1.0
+        while not stop_event.is_set():
+            poll = asyncio.create_task(
+                self.telegram_service.get_updates(offset, self.batch_size, self.poll_timeout)
+            )
+            stop = asyncio.create_task(stop_event.wait())
+            await asyncio.wait({poll, stop}, return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            if not poll.done():
+                poll.cancel() # Berhenti saat masih long polling: belum ada yang diproses
+                break
+
+            try:
+                raw_updates = poll.result()
+            except Exception as e:
+                logger.error(f"getUpdates gagal, coba lagi dalam {backoff:.0f}s: {e}")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), backoff)
+                except asyncio.TimeoutError:
+                    pass
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 1.0
+            if not raw_updates:
+                continue
+            POLLED_UPDATES.inc(len(raw_updates))
+            with STAGE_DURATION.time(stage="polling", op="batch"):
+                await self.process_batch(raw_updates)
+            offset = max(raw["update_id"] for raw in raw_updates) + 1
+            await self.offset_store.set(offset)
+        logger.info("Long polling dihentikan.")
+
+    async def process_batch(self, raw_updates: List[Dict[str, Any]]):
+        """Memproses satu batch: paralel antar chat, berurutan (urutan update_id) dalam satu chat."""
+        by_chat: Dict[Any, List[Update]] = defaultdict(list)
+        for raw in sorted(raw_updates, key=lambda raw: raw["update_id"]):
+            try:
+                update = Update.model_validate(raw)
+            except ValidationError as e:
+                logger.warning(f"Update {raw.get('update_id')} tidak dikenali, diabaikan: {e}")
+                continue
+            chat_id = get_update_chat_id(update)
+            by_chat[chat_id if chat_id is not None else f"update:{update.update_id}"].append(update)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_chat(updates: List[Update]):
+            async with semaphore:
+                for update in updates:
+                    await self._dispatch(update)
+
+        await asyncio.gather(*(run_chat(updates) for updates in by_chat.values()))
+
+    async def _dispatch(self, update: Update):
+        try:
+            await dispatch_update(
+                update,
+                self.job_queue,
+                self.telegram_service,
+                self.memory_service,
+                self.state_service,
+                self.deduplicator,
+                source="polling"
+            )
+        except Exception as e:
+            # Tidak ada retry dari Telegram di mode polling: catat lalu lanjut ke update berikutnya
+            logger.error(f"Gagal memproses update {update.update_id}: {e}", exc_info=True)
+
+
+# --- Entry Point ---
+async def run_polling():
+    """Menjalankan bot dengan long polling: `python polling_runner.py` (tanpa webhook publik)."""
+    redis_pool = get_redis_pool()
+    if not redis_pool:
+        raise Exception("Redis pool tidak terinisialisasi.")
+    client = redis.Redis(connection_pool=redis_pool)
+    job_queue = create_job_queue()
+    if job_queue is None:
+        raise Exception("Antrian job tidak tersedia (Redis pool tidak terinisialisasi).")
+
+    http_client = create_http_client()
+    # Dispatcher update tidak menunggu pengiriman (antrian kirim per chat); worker menunggu
+    telegram_service = TelegramService(http_client, wait_for_delivery=False)
+    memory_service = create_memory_service()
+
+    if not await ping_redis():
+        logger.error("Redis tidak bisa di-ping saat startup.")
+    try:
+        await asyncio.to_thread(warm_up_models)
+    except Exception as e:
+        logger.error(f"Warm-up model gagal: {e}")
+
+    state_near_cache = get_state_near_cache()
+    if state_near_cache:
+        await state_near_cache.start(client)
+
+    job_worker = None
+    if settings.job_run_in_process:
+        job_worker = JobWorker(
+            job_queue, TelegramService(http_client), None, settings.job_worker_concurrency, create_testcase_cache(),
+            memory_service=memory_service,
+            similarity_index=create_similarity_index()
+        )
+        job_worker.start()
+
+    runner = PollingRunner(
+        telegram_service,
+        RedisOffsetStore(client),
+        job_queue,
+        memory_service,
+        StateService(client, state_near_cache),
+        create_update_deduplicator(),
+        settings.polling_batch_size,
+        settings.polling_timeout,
+        settings.polling_concurrency
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await telegram_service.delete_webhook()
+        await runner.run(stop_event)
+    finally:
+        if job_worker:
+            await job_worker.stop()
+        await drain_outbound_scheduler()
+        await http_client.aclose()
+        shutdown_process_pool()
+        if state_near_cache:
+            await state_near_cache.stop()
+        await close_redis_pool()
+
+
+if __name__ == "__main__":
+    log_handler = logging.StreamHandler()
+    log_handler.addFilter(TraceIdFilter())
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
+        handlers=[log_handler]
+    )
+    asyncio.run(run_polling())
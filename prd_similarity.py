@@ -0,0 +1,204 @@
+# prd_similarity.py
+import re
+import base64
+import hashlib
+import logging
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import redis.asyncio as redis
+from config import settings
+from state_service import get_redis_pool
+from testcase_cache import normalize_prd
+from observability import SIMILAR_PRD_LOOKUPS
+
+# numpy hanya dibutuhkan worker saat menghitung signature: diimpor saat pertama dipakai
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+def make_similarity_namespace(format: str, model: str, prompt_version: str) -> str:
+    """Hasil hanya bisa dipakai ulang untuk format, model, & versi prompt yang sama."""
+    return hashlib.sha256(f"{prompt_version}\x00{model}\x00{format.lower()}".encode("utf-8")).hexdigest()[:12]
+
+def make_doc_id(prd_text: str) -> str:
+    return hashlib.sha256(normalize_prd(prd_text).lower().encode("utf-8")).hexdigest()[:24]
+
+def shingles(prd_text: str, size: int) -> List[int]:
+    """Hash crc32 dari setiap n-gram kata (PRD dinormalisasi & lowercase)."""
+    words = WORD_PATTERN.findall(normalize_prd(prd_text).lower())
+    if len(words) < size:
+        return []
+    return list({zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)})
+
+@lru_cache(maxsize=4)
+def _permutations(num_perm: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Parameter hash universal (a*x + b) mod p; seed tetap agar signature sama di semua proses."""
+    import numpy as np
+    rng = np.random.default_rng(1)
+    a = rng.integers(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+    return a, b
+
+def minhash_signature(shingle_hashes: List[int], num_perm: int) -> "np.ndarray":
+    """Signature MinHash (uint32 x num_perm) dari hash shingle, dihitung vektor dengan numpy."""
+    import numpy as np
+    a, b = _permutations(num_perm)
+    values = np.asarray(shingle_hashes, dtype=np.uint64)[:, None]
+    # a, x < 2^32 sehingga a*x + b tidak overflow uint64
+    hashed = ((values * a + b) % np.uint64(MERSENNE_PRIME)) & np.uint64(MAX_HASH)
+    return hashed.min(axis=0).astype(np.uint32)
+
+
+@dataclass
+class SimilarPrd:
+    doc_id: str
+    cache_key: str # Key hasil test case di TestcaseCache
+    similarity: float # Estimasi Jaccard shingle
+
+
+class PrdSimilarityIndex:
+    """
+    Indeks PRD hampir sama (salah ketik, tambahan satu kalimat) tanpa embedding jaringan:
+    MinHash atas n-gram kata + LSH banding di Redis.
+    - `bot:sim:{ns}:doc:{doc_id}`     : hash signature (base64) & key hasil di TestcaseCache
+    - `bot:sim:{ns}:band:{i}:{hash}`  : set doc_id yang band ke-i signature-nya sama
+    Lookup hanya membaca `bands` bucket lalu memverifikasi kandidat dengan signature penuh,
+    sehingga biayanya tidak tumbuh linear terhadap jumlah PRD yang diindeks.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        threshold: float,
+        num_perm: int,
+        bands: int,
+        shingle_size: int,
+        min_shingles: int,
+        max_candidates: int,
+        ttl_seconds: int
+    ):
+        if num_perm % bands:
+            raise ValueError("similarity_num_perm harus habis dibagi similarity_bands.")
+        self.client = client
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.max_candidates = max_candidates
+        self.ttl_seconds = ttl_seconds
+        self.prefix = "bot:sim:"
+
+    def _doc_key(self, namespace: str, doc_id: str) -> str:
+        return f"{self.prefix}{namespace}:doc:{doc_id}"
+
+    def _band_keys(self, namespace: str, signature: "np.ndarray") -> List[str]:
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            keys.append(f"{self.prefix}{namespace}:band:{band}:{hashlib.blake2b(rows, digest_size=8).hexdigest()}")
+        return keys
+
+    def signature(self, prd_text: str) -> Optional["np.ndarray"]:
+        """Signature PRD; None jika PRD terlalu pendek untuk dibandingkan dengan andal."""
+        hashes = shingles(prd_text, self.shingle_size)
+        if len(hashes) < self.min_shingles:
+            return None
+        return minhash_signature(hashes, self.num_perm)
+
+    @staticmethod
+    def _encode(signature: "np.ndarray") -> str:
+        return base64.b64encode(signature.astype("<u4").tobytes()).decode("ascii")
+
+    @staticmethod
+    def _decode(raw: str) -> "np.ndarray":
+        import numpy as np
+        return np.frombuffer(base64.b64decode(raw), dtype="<u4")
+
+    async def find(self, prd_text: str, namespace: str) -> Optional[SimilarPrd]:
+        """PRD terindeks paling mirip di atas ambang, atau None. Error Redis dianggap miss."""
+        signature = self.signature(prd_text)
+        if signature is None:
+            SIMILAR_PRD_LOOKUPS.inc(result="skipped")
+            return None
+        try:
+            band_keys = self._band_keys(namespace, signature)
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in band_keys:
+                    pipe.smembers(key)
+                buckets = await pipe.execute()
+
+            # Kandidat dengan band sama terbanyak lebih mungkin mirip; batasi yang diverifikasi
+            collisions: Dict[str, int] = {}
+            for members in buckets:
+                for doc_id in members:
+                    collisions[doc_id] = collisions.get(doc_id, 0) + 1
+            if not collisions:
+                SIMILAR_PRD_LOOKUPS.inc(result="miss")
+                return None
+            candidates = sorted(collisions, key=collisions.get, reverse=True)[:self.max_candidates]
+
+            async with self.client.pipeline(transaction=False) as pipe:
+                for doc_id in candidates:
+                    pipe.hgetall(self._doc_key(namespace, doc_id))
+                docs = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Gagal mencari PRD mirip di Redis: {e}")
+            SIMILAR_PRD_LOOKUPS.inc(result="error")
+            return None
+
+        best: Optional[SimilarPrd] = None
+        for doc_id, doc in zip(candidates, docs):
+            if not doc:
+                continue # Entri sudah kedaluwarsa, id usang di bucket dilewati
+            similarity = float((self._decode(doc["sig"]) == signature).mean())
+            if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                best = SimilarPrd(doc_id, doc["key"], similarity)
+        SIMILAR_PRD_LOOKUPS.inc(result="hit" if best else "miss")
+        return best
+
+    async def add(self, prd_text: str, namespace: str, cache_key: str):
+        """Mengindeks PRD yang baru saja dibuatkan test case (hasilnya ada di TestcaseCache)."""
+        signature = self.signature(prd_text)
+        if signature is None:
+            return
+        doc_id = make_doc_id(prd_text)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                doc_key = self._doc_key(namespace, doc_id)
+                pipe.hset(doc_key, mapping={"sig": self._encode(signature), "key": cache_key})
+                pipe.expire(doc_key, self.ttl_seconds)
+                for key in self._band_keys(namespace, signature):
+                    pipe.sadd(key, doc_id)
+                    pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Gagal mengindeks PRD di Redis: {e}")
+
+
+# --- Factory ---
+def create_similarity_index() -> Optional[PrdSimilarityIndex]:
+    """Membuat indeks PRD mirip; None jika dinonaktifkan atau Redis tidak tersedia."""
+    if not settings.similarity_enabled or not settings.testcase_cache_enabled:
+        return None
+    redis_pool = get_redis_pool()
+    if not redis_pool:
+        return None
+    return PrdSimilarityIndex(
+        redis.Redis(connection_pool=redis_pool),
+        settings.similarity_threshold,
+        settings.similarity_num_perm,
+        settings.similarity_bands,
+        settings.similarity_shingle_size,
+        settings.similarity_min_shingles,
+        settings.similarity_max_candidates,
+        settings.testcase_cache_ttl # Sama dengan umur hasil yang dirujuk
+    )
@@ -1,70 +1,337 @@
 # state_service.py
-import redis
-import json
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+import uuid
+import orjson
+import asyncio
 import logging
+from cachetools import TTLCache
 from config import settings # Asumsi Anda punya config.py
-from typing import Optional, Dict, Any
+from observability import STAGE_DURATION, STATE_CACHE_LOOKUPS
+from typing import Optional, Dict, Any, Tuple
 
 logger = logging.getLogger(__name__)
 
+# --- Near Cache State (per proses) ---
+_MISSING = object()
+
+class StateNearCache:
+    """
+    Cache state lokal per proses di depan Redis, termasuk cache negatif ("tidak ada state").
+    Koheren antar worker lewat pub/sub: setiap penulisan mem-publish chat_id ke channel
+    invalidasi, dan listener di proses lain membuang entri lokalnya.
+    Cache hanya dipakai selama listener tersambung; di luar itu semua operasi ke Redis.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        # Nilai: state ter-encode orjson (bytes, immutable) atau None untuk "tidak ada state"
+        self.local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.instance_id = uuid.uuid4().hex
+        self.channel = "bot:state:invalidate"
+        self.active = False
+        # Naik setiap penulisan lokal & invalidasi dari proses lain; hasil operasi Redis hanya
+        # di-cache jika tidak ada penulisan/invalidasi lain selama operasi berjalan
+        # (mencegah nilai lama, misal "tidak ada state", menimpa penulisan yang lebih baru)
+        self.version = 0
+        self._listener: Optional[asyncio.Task] = None
+
+    def lookup(self, chat_id: int) -> Tuple[bool, Optional[bytes]]:
+        """(hit, state ter-encode). hit=True dengan nilai None berarti chat diketahui tanpa state."""
+        # Satu kali get: `in` lalu get bisa melihat entri yang kedaluwarsa di antaranya sebagai None
+        value = self.local.get(chat_id, _MISSING) if self.active else _MISSING
+        if value is _MISSING:
+            STATE_CACHE_LOOKUPS.inc(result="miss")
+            return False, None
+        STATE_CACHE_LOOKUPS.inc(result="hit" if value is not None else "negative_hit")
+        return True, value
+
+    def begin_write(self, chat_id: int) -> int:
+        """Dipanggil sebelum penulisan lokal: entri dibuang & versi dinaikkan. Mengembalikan versi baru."""
+        self.version += 1
+        self.local.pop(chat_id, None)
+        return self.version
+
+    def put(self, chat_id: int, value: Optional[bytes], version: int):
+        """Menyimpan hasil operasi yang dimulai pada `version`; diabaikan jika ada penulisan lain sejak itu."""
+        if self.active and version == self.version:
+            self.local[chat_id] = value
+
+    def invalidate(self, chat_id: int):
+        self.version += 1
+        self.local.pop(chat_id, None)
+
+    def invalidation_message(self, chat_id: int) -> str:
+        return f"{self.instance_id}:{chat_id}"
+
+    async def start(self, client: redis.Redis):
+        """Menjalankan listener invalidasi (dipanggil di lifespan / entry point)."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen(client))
+
+    async def stop(self):
+        self.active = False
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self, client: redis.Redis):
+        while True:
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Pesan yang terlewat saat terputus tidak diketahui: mulai dari cache kosong
+                    self.local.clear()
+                    self.active = True
+                    logger.info("Near cache state aktif (listener invalidasi tersambung).")
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        origin, _, chat_id = message["data"].partition(":")
+                        if origin != self.instance_id:
+                            self.invalidate(int(chat_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.active = False
+                logger.warning(f"Listener invalidasi state terputus, near cache dinonaktifkan sementara: {e}")
+                await asyncio.sleep(1.0)
+
+
 class StateService:
-    def __init__(self, client: redis.Redis):
+    def __init__(self, client: redis.Redis, near_cache: Optional[StateNearCache] = None):
         self.client = client
-        # Atur prefix agar tidak bentrok jika Redis dipakai hal lain
-        self.prefix = "bot:state:"
+        self.near_cache = near_cache
+        # Atur prefix agar tidak bentrok jika Redis dipakai hal lain.
+        # State disimpan sebagai hash (field -> nilai orjson), bukan string JSON seperti versi lama.
+        self.prefix = "bot:chatstate:"
         # Atur expiry time (misal 1 jam) agar state tidak menumpuk
-        self.expire_seconds = 3600 
+        self.expire_seconds = 3600
+        # Batas percobaan ulang compare-and-set jika key berubah di tengah transaksi
+        self.cas_retries = 5
 
     def _get_key(self, chat_id: int) -> str:
         return f"{self.prefix}{chat_id}"
 
-    def save_state(self, chat_id: int, state_data: Dict[str, Any]):
-        """Menyimpan state dictionary sebagai JSON string ke Redis."""
+    # --- Encoding ---
+    @staticmethod
+    def _to_fields(state_data: Dict[str, Any]) -> Dict[str, bytes]:
+        return {field: orjson.dumps(value) for field, value in state_data.items()}
+
+    @staticmethod
+    def _from_fields(fields: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if not fields:
+            return None
+        return {field: orjson.loads(value) for field, value in fields.items()}
+
+    # --- Near Cache ---
+    def _cached(self, chat_id: int) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        if not self.near_cache:
+            return False, None
+        hit, value = self.near_cache.lookup(chat_id)
+        return hit, (orjson.loads(value) if value is not None else None)
+
+    def _remember(self, chat_id: int, state_data: Optional[Dict[str, Any]], version: Optional[int]):
+        """Menyimpan ke near cache hasil operasi yang dimulai pada `version` (lihat StateNearCache.version)."""
+        if self.near_cache and version is not None:
+            self.near_cache.put(chat_id, orjson.dumps(state_data) if state_data is not None else None, version)
+
+    def _read_version(self) -> Optional[int]:
+        return self.near_cache.version if self.near_cache else None
+
+    def _begin_write(self, chat_id: int) -> Optional[int]:
+        return self.near_cache.begin_write(chat_id) if self.near_cache else None
+
+    def _forget(self, chat_id: int):
+        if self.near_cache:
+            self.near_cache.invalidate(chat_id)
+
+    def _publish_invalidation(self, pipe, chat_id: int):
+        """Menambahkan PUBLISH invalidasi ke pipeline penulisan (tetap satu round trip)."""
+        if self.near_cache:
+            pipe.publish(self.near_cache.channel, self.near_cache.invalidation_message(chat_id))
+
+    async def save_state(self, chat_id: int, state_data: Dict[str, Any]):
+        """Menyimpan state dictionary sebagai hash ke Redis (satu round trip ter-pipeline)."""
         try:
             key = self._get_key(chat_id)
-            # Redis menyimpan string, jadi kita ubah dict ke JSON
-            self.client.set(key, json.dumps(state_data), ex=self.expire_seconds)
+            version = self._begin_write(chat_id)
+            with STAGE_DURATION.time(stage="state", op="save"):
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.delete(key) # Field lama yang tidak ada di state baru ikut terhapus
+                    pipe.hset(key, mapping=self._to_fields(state_data))
+                    pipe.expire(key, self.expire_seconds)
+                    self._publish_invalidation(pipe, chat_id)
+                    await pipe.execute()
+            self._remember(chat_id, state_data, version)
             logger.debug(f"State disimpan ke Redis untuk {chat_id}")
         except Exception as e:
+            self._forget(chat_id)
             logger.error(f"Gagal menyimpan state ke Redis: {e}")
 
-    def get_state(self, chat_id: int) -> Optional[Dict[str, Any]]:
-        """Mengambil state dari Redis dan mengubahnya kembali ke dict."""
+    async def get_state(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Mengambil state dari near cache, atau dari Redis jika belum ada di cache."""
         try:
-            key = self._get_key(chat_id)
-            data = self.client.get(key)
-            if data:
-                # Ubah JSON string kembali ke dictionary Python
-                return json.loads(data)
-            return None
+            with STAGE_DURATION.time(stage="state", op="get"):
+                hit, state_data = self._cached(chat_id)
+                if hit:
+                    return state_data
+                version = self._read_version()
+                state_data = self._from_fields(await self.client.hgetall(self._get_key(chat_id)))
+            self._remember(chat_id, state_data, version)
+            return state_data
         except Exception as e:
             logger.error(f"Gagal mengambil state dari Redis: {e}")
             return None
 
-    def clear_state(self, chat_id: int):
-        """Menghapus state dari Redis."""
+    async def clear_state(self, chat_id: int):
+        """Menghapus state dari Redis. Dilewati jika near cache tahu chat ini tanpa state."""
         try:
-            key = self._get_key(chat_id)
-            self.client.delete(key)
+            with STAGE_DURATION.time(stage="state", op="clear"):
+                hit, state_data = self._cached(chat_id)
+                if hit and state_data is None:
+                    return
+                version = self._begin_write(chat_id)
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.delete(self._get_key(chat_id))
+                    self._publish_invalidation(pipe, chat_id)
+                    await pipe.execute()
+            self._remember(chat_id, None, version)
             logger.debug(f"State dihapus dari Redis untuk {chat_id}")
         except Exception as e:
+            self._forget(chat_id)
             logger.error(f"Gagal menghapus state dari Redis: {e}")
 
+    async def pop_state(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Mengambil sekaligus menghapus state secara atomik (HGETALL + DEL dalam MULTI).
+        Jika dua pesan datang bersamaan, hanya satu yang mendapatkan state.
+        Near cache hanya memotong kasus "tidak ada state"; klaim selalu lewat Redis.
+        """
+        try:
+            with STAGE_DURATION.time(stage="state", op="pop"):
+                hit, state_data = self._cached(chat_id)
+                if hit and state_data is None:
+                    return None
+                key = self._get_key(chat_id)
+                version = self._begin_write(chat_id)
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.hgetall(key)
+                    pipe.delete(key)
+                    self._publish_invalidation(pipe, chat_id)
+                    fields = (await pipe.execute())[0]
+            self._remember(chat_id, None, version)
+            state_data = self._from_fields(fields)
+            if state_data:
+                logger.debug(f"State diambil & dihapus dari Redis untuk {chat_id}")
+            return state_data
+        except Exception as e:
+            self._forget(chat_id)
+            logger.error(f"Gagal mengambil & menghapus state dari Redis: {e}")
+            return None
+
+    async def transition_state(
+        self,
+        chat_id: int,
+        from_state: str,
+        to_state: str,
+        data: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Compare-and-set: pindah ke `to_state` hanya jika state saat ini adalah `from_state`.
+        `data` digabung ke data state lama. Mengembalikan state baru, atau None jika
+        state saat ini tidak cocok (misal sudah dipakai oleh pesan lain).
+        """
+        key = self._get_key(chat_id)
+        try:
+            with STAGE_DURATION.time(stage="state", op="transition"):
+                hit, cached = self._cached(chat_id)
+                if hit and (cached is None or cached.get("state") != from_state):
+                    return None
+                async with self.client.pipeline(transaction=True) as pipe:
+                    for _ in range(self.cas_retries):
+                        try:
+                            version = self._begin_write(chat_id)
+                            await pipe.watch(key)
+                            current = self._from_fields(await pipe.hgetall(key))
+                            if not current or current.get("state") != from_state:
+                                await pipe.unwatch()
+                                self._remember(chat_id, current, version)
+                                return None
+
+                            new_state = {
+                                "state": to_state,
+                                "data": {**current.get("data", {}), **(data or {})}
+                            }
+                            pipe.multi()
+                            pipe.delete(key)
+                            pipe.hset(key, mapping=self._to_fields(new_state))
+                            pipe.expire(key, self.expire_seconds)
+                            self._publish_invalidation(pipe, chat_id)
+                            await pipe.execute()
+                            self._remember(chat_id, new_state, version)
+                            logger.debug(f"State {chat_id}: {from_state} -> {to_state}")
+                            return new_state
+                        except WatchError:
+                            # Key berubah di tengah transaksi, ulangi
+                            continue
+            self._forget(chat_id)
+            logger.warning(f"Transisi state {chat_id} gagal setelah {self.cas_retries} percobaan.")
+            return None
+        except Exception as e:
+            self._forget(chat_id)
+            logger.error(f"Gagal melakukan transisi state di Redis: {e}")
+            return None
+
 # --- Dependency untuk FastAPI ---
 
-# Buat satu koneksi pool saat startup (lebih efisien)
+# Satu koneksi pool bersama, dibuat saat pertama dipakai (bukan saat import).
 # Pastikan REDIS_URL ada di settings/environment
-try:
-    redis_pool = redis.ConnectionPool.from_url(settings.redis_url, decode_responses=True)
-    logger.info("Koneksi Redis Pool berhasil dibuat.")
-except Exception as e:
-    logger.error(f"GAGAL KONEK KE REDIS POOL: {e}")
-    redis_pool = None # Aplikasi akan error jika ini gagal
-
-def get_state_service():
+_redis_pool: Optional[redis.ConnectionPool] = None
+
+def get_redis_pool() -> Optional[redis.ConnectionPool]:
+    """Pool Redis bersama; None jika REDIS_URL tidak valid."""
+    global _redis_pool
+    if _redis_pool is None:
+        try:
+            _redis_pool = redis.ConnectionPool.from_url(settings.redis_url, decode_responses=True)
+            logger.info("Koneksi Redis Pool berhasil dibuat.")
+        except Exception as e:
+            logger.error(f"GAGAL KONEK KE REDIS POOL: {e}")
+    return _redis_pool
+
+async def ping_redis(timeout: float = 2.0) -> bool:
+    """Membuka (warm-up) sekaligus mengecek koneksi Redis; dipakai startup & readiness."""
+    pool = get_redis_pool()
+    if not pool:
+        return False
+    try:
+        return bool(await asyncio.wait_for(redis.Redis(connection_pool=pool).ping(), timeout))
+    except Exception as e:
+        logger.warning(f"Ping Redis gagal: {e}")
+        return False
+
+async def close_redis_pool():
+    global _redis_pool
+    if _redis_pool is not None:
+        await _redis_pool.disconnect()
+        _redis_pool = None
+
+# Near cache bersama untuk semua StateService di proses ini
+_state_near_cache: Optional[StateNearCache] = None
+
+def get_state_near_cache() -> Optional[StateNearCache]:
+    """Near cache state proses ini; None jika dinonaktifkan lewat konfigurasi."""
+    global _state_near_cache
+    if _state_near_cache is None and settings.state_cache_enabled:
+        _state_near_cache = StateNearCache(settings.state_cache_size, settings.state_cache_ttl)
+    return _state_near_cache
+
+async def get_state_service():
+    redis_pool = get_redis_pool()
     if not redis_pool:
         raise Exception("Redis pool tidak terinisialisasi.")
 
     client = redis.Redis(connection_pool=redis_pool)
-    yield StateService(client)
-    # client.close() # Tidak perlu close jika pakai pool
\ No newline at end of file
+    yield StateService(client, get_state_near_cache())
+    # client.close() # Tidak perlu close jika pakai pool
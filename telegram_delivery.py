@@ -0,0 +1,259 @@
+# telegram_delivery.py
+import re
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import httpx
+from cachetools import LRUCache
+from config import settings
+from observability import DELIVERY_QUEUED, DELIVERY_WAIT, TELEGRAM_RETRY_AFTER, TYPING_COALESCED
+
+logger = logging.getLogger(__name__)
+
+# Batas panjang teks satu pesan Telegram
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Awal satu test case / skenario di hasil model ('Test Case 3:', '### TC-03', 'Scenario:', ...)
+TESTCASE_BOUNDARY = re.compile(
+    r"^[ \t]*(?:#{1,4}[ \t]*|\*\*)?(?:Test[ \t]?Case\b|TC[-_ ]?\d+|Skenario\b|Scenario(?:[ \t]Outline)?:|Feature:)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+# --- Pemecahan Pesan Panjang ---
+def split_point(text: str, limit: int) -> int:
+    """Posisi potong <= limit: utamakan awal test case, lalu batas paragraf, baris, spasi."""
+    boundaries = [m.start() for m in TESTCASE_BOUNDARY.finditer(text, 1, limit)]
+    if boundaries and boundaries[-1] > limit // 4:
+        return boundaries[-1]
+    for separator in ("\n\n", "\n", " "):
+        index = text.rfind(separator, 0, limit)
+        if index > limit // 2:
+            return index
+    return limit
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    """Memecah teks menjadi pesan <= limit tanpa memotong test case di tengah jika bisa."""
+    parts = []
+    while len(text) > limit:
+        cut = split_point(text, limit)
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text.strip() or not parts:
+        parts.append(text)
+    return parts
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Nilai `parameters.retry_after` dari balasan 429 Bot API (None jika bukan 429)."""
+    if response.status_code != 429:
+        return None
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket dengan reservasi: token boleh negatif sehingga pemanggil bersamaan
+    mendapat giliran berurutan (FIFO) tanpa polling. `pause` menahan bucket (retry_after).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Mengambil satu token; mengembalikan lama tunggu (detik) sebelum token itu boleh dipakai."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def try_take(self) -> bool:
+        """Mengambil token hanya jika tersedia sekarang (untuk kiriman yang boleh dilewati)."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens < 1 or now < self.blocked_until:
+            return False
+        self.tokens -= 1
+        return True
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class OutboundScheduler:
+    """
+    Penjadwal kiriman keluar ke Bot API (per proses):
+    - antrian FIFO per chat yang dikuras satu task pengirim di background: handler update
+      hanya memasukkan kiriman (`submit`) lalu langsung kembali, tidak ikut menunggu kuota
+    - satu entri antrian = satu balasan utuh, sehingga potongannya tidak diselingi balasan lain
+    - token bucket global (~30 pesan/detik per bot) & per chat (~1 pesan/detik, burst kecil)
+    - 429: `retry_after` dihormati (chat & kuota global ditahan) lalu kiriman diulang
+    - typing action digabung: paling sering sekali per `typing_interval` per chat,
+      dan dilewati jika kuota global sedang habis (status typing tidak penting)
+    Batas Telegram berlaku per bot; jika beberapa proses berjalan, bagi `global_rate`.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        global_burst: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_chats: int,
+        max_retries: int,
+        typing_interval: float
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: LRUCache = LRUCache(maxsize=max_chats)
+        self.last_typing: LRUCache = LRUCache(maxsize=max_chats)
+        self.max_retries = max_retries
+        self.typing_interval = typing_interval
+        # chat_id -> antrian (kiriman, future hasil) & task pengirimnya; dihapus saat antrian habis
+        self._queues: Dict[int, Deque[Tuple[Callable[[], Awaitable[Any]], asyncio.Future]]] = {}
+        self._senders: Dict[int, asyncio.Task] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def submit(self, chat_id: int, send: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Memasukkan satu balasan ke antrian chat dan langsung kembali.
+        Future berisi hasil `send` (None jika gagal); boleh diabaikan oleh pemanggil.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append((send, future))
+        DELIVERY_QUEUED.inc()
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._drain_chat(chat_id))
+        return future
+
+    async def _drain_chat(self, chat_id: int):
+        """Task pengirim satu chat: menguras antrian FIFO lalu selesai saat antrian kosong."""
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                send, future = queue.popleft()
+                DELIVERY_QUEUED.dec()
+                try:
+                    result = await send()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    logger.error(f"Kiriman ke chat {chat_id} gagal: {e}")
+                    result = None
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            # Dibatalkan (shutdown): kiriman yang tersisa tidak akan terkirim
+            for _, future in queue:
+                DELIVERY_QUEUED.dec()
+                future.cancel()
+            del self._queues[chat_id]
+            del self._senders[chat_id]
+
+    async def drain(self, timeout: float):
+        """Menunggu antrian semua chat terkirim (dipanggil saat shutdown), sisanya dibatalkan."""
+        senders = list(self._senders.values())
+        if not senders:
+            return
+        _, pending = await asyncio.wait(senders, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logger.warning(f"Shutdown: antrian kirim {len(pending)} chat dibatalkan setelah {timeout}s.")
+
+    async def acquire(self, chat_id: int, kind: str = "message"):
+        """Menunggu kuota chat lalu kuota global (urutan ini agar token global tidak terbuang)."""
+        start = time.perf_counter()
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = self.global_bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        DELIVERY_WAIT.observe(time.perf_counter() - start, kind=kind)
+
+    async def deliver(
+        self,
+        chat_id: int,
+        method: str,
+        send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Mengirim lewat limiter; balasan 429 ditunggu sesuai retry_after lalu diulang.
+        Dipanggil dari task pengirim chat (lihat `submit`), bukan dari handler update.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, method)
+            response = await send()
+            retry_after = retry_after_seconds(response)
+            if retry_after is None or attempt == self.max_retries:
+                return response
+            TELEGRAM_RETRY_AFTER.inc(method=method)
+            logger.warning(f"429 dari Telegram untuk chat {chat_id} ({method}), menunggu {retry_after}s.")
+            # 429 bisa berasal dari batas global bot: kiriman chat lain juga ditahan
+            self._chat_bucket(chat_id).pause(retry_after)
+            self.global_bucket.pause(retry_after)
+        return response
+
+    def should_send_typing(self, chat_id: int) -> bool:
+        """False jika typing untuk chat ini baru saja dikirim atau kuota global sedang habis."""
+        now = time.monotonic()
+        if now - self.last_typing.get(chat_id, float("-inf")) < self.typing_interval:
+            TYPING_COALESCED.inc(reason="recent")
+            return False
+        if not self.global_bucket.try_take():
+            TYPING_COALESCED.inc(reason="throttled")
+            return False
+        self.last_typing[chat_id] = now
+        return True
+
+
+async def drain_outbound_scheduler():
+    """Shutdown: menunggu balasan yang masih di antrian kirim (maksimal DELIVERY_DRAIN_TIMEOUT)."""
+    if _outbound_scheduler is not None:
+        await _outbound_scheduler.drain(settings.delivery_drain_timeout)
+
+
+# --- Instance Bersama ---
+_outbound_scheduler: Optional[OutboundScheduler] = None
+
+def get_outbound_scheduler() -> Optional[OutboundScheduler]:
+    """Penjadwal kiriman proses ini (dipakai bersama semua TelegramService); None jika dinonaktifkan."""
+    global _outbound_scheduler
+    if not settings.delivery_enabled:
+        return None
+    if _outbound_scheduler is None:
+        _outbound_scheduler = OutboundScheduler(
+            settings.delivery_global_rate,
+            settings.delivery_global_burst,
+            settings.delivery_chat_rate,
+            settings.delivery_chat_burst,
+            settings.delivery_max_chats,
+            settings.delivery_max_retries,
+            settings.delivery_typing_interval
+        )
+    return _outbound_scheduler
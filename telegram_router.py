@@ -3,12 +3,14 @@ import logging
 import traceback
 from fastapi import APIRouter, Depends, Response
 from pydantic import BaseModel, Field
-from agent_logic import get_agent_executor 
 from telegram_service import TelegramService, get_telegram_service
 from memory_service import BaseMemoryService, get_memory_service 
-from langchain.agents import AgentExecutor 
+from job_service import BaseJobQueue, GenerateTestcaseJob, JobRejectedError, get_job_queue
+from update_dedup import UpdateDeduplicator, get_update_deduplicator
 from typing import Optional, Dict, Any # <<< Pastikan Dict dan Any di-import
 from state_service import StateService, get_state_service # <<< Service Redis Anda
+from config import settings
+from observability import STAGE_DURATION, WEBHOOK_IN_FLIGHT, trace_id_var
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +18,18 @@ logger = logging.getLogger(__name__)
 class Chat(BaseModel):
     id: int
 
+class Document(BaseModel):
+    file_id: str
+    file_unique_id: str
+    file_name: Optional[str] = None
+    mime_type: Optional[str] = None
+    file_size: Optional[int] = None
+
 class Message(BaseModel):
     message_id: int 
     chat: Chat
     text: str | None = None
+    document: Optional[Document] = None
 
 class CallbackQuery(BaseModel):
     id: str 
@@ -48,12 +58,66 @@ button_text_to_command = {
 @router.post("/telegram")
 async def handle_telegram_webhook(
     update: Update,
-    agent_executor: AgentExecutor = Depends(get_agent_executor), 
+    job_queue: BaseJobQueue = Depends(get_job_queue),
     telegram_service: TelegramService = Depends(get_telegram_service),
     memory_service: BaseMemoryService = Depends(get_memory_service),
-    state_service: StateService = Depends(get_state_service) # <<< Service Redis di-inject
+    state_service: StateService = Depends(get_state_service), # <<< Service Redis di-inject
+    deduplicator: Optional[UpdateDeduplicator] = Depends(get_update_deduplicator)
 ):
     """Endpoint utama yang menerima update dari Telegram."""
+    return await dispatch_update(update, job_queue, telegram_service, memory_service, state_service, deduplicator)
+
+async def dispatch_update(
+    update: Update,
+    job_queue: BaseJobQueue,
+    telegram_service: TelegramService,
+    memory_service: BaseMemoryService,
+    state_service: StateService,
+    deduplicator: Optional[UpdateDeduplicator],
+    source: str = "webhook"
+) -> Response:
+    """
+    De-duplikasi, trace id, dan metrik di sekitar process_update.
+    Dipakai webhook maupun runner long polling (source='polling').
+    """
+    # Kiriman ulang update yang sama dibalas 200 tanpa menyentuh state/LLM
+    if deduplicator and await deduplicator.is_duplicate(update.update_id):
+        logger.info(f"Update {update.update_id} duplikat, diabaikan.")
+        return Response(status_code=200)
+
+    # Trace id per update agar semua log (termasuk di worker job) bisa dikorelasikan
+    trace_token = trace_id_var.set(f"upd-{update.update_id}") if settings.log_trace_id else None
+    try:
+        with WEBHOOK_IN_FLIGHT.track_inprogress(), STAGE_DURATION.time(stage=source, op=get_update_kind(update)):
+            return await process_update(update, job_queue, telegram_service, memory_service, state_service)
+    except Exception:
+        # Gagal diproses: izinkan Telegram mengirim ulang update ini
+        if deduplicator:
+            await deduplicator.release(update.update_id)
+        raise
+    finally:
+        if trace_token:
+            trace_id_var.reset(trace_token)
+
+def get_update_kind(update: Update) -> str:
+    """Jenis update untuk label metrik."""
+    if update.callback_query:
+        return "callback"
+    if update.message and update.message.document:
+        return "document"
+    if update.message and update.message.text:
+        text = update.message.text.strip()
+        return "command" if text.startswith("/") or text in button_text_to_command else "text"
+    return "other"
+
+async def process_update(
+    update: Update,
+    job_queue: BaseJobQueue,
+    telegram_service: TelegramService,
+    memory_service: BaseMemoryService,
+    state_service: StateService
+) -> Response:
+    """Logika pemrosesan satu update Telegram."""
 
     # --- 1: Menangani Klik Tombol Inline (CallbackQuery) ---
     if update.callback_query:
@@ -67,14 +131,19 @@ async def handle_telegram_webhook(
         if data and data.startswith("format:"):
             chosen_format = data.split(":", 1)[1]
             
-            # --- REFACTOR: Simpan state ke Redis ---
-            new_state = {
-                "state": "WAITING_FOR_PRD",
-                "data": {"format": chosen_format}
-            }
-            state_service.save_state(chat_id, new_state)
+            # --- Transisi atomik WAITING_FOR_FORMAT -> WAITING_FOR_PRD ---
+            # Klik ganda / tombol lama tidak akan menimpa state yang sudah berjalan.
+            new_state = await state_service.transition_state(
+                chat_id, "WAITING_FOR_FORMAT", "WAITING_FOR_PRD", {"format": chosen_format}
+            )
+            if not new_state:
+                logger.info(f"Callback format diabaikan, chat {chat_id} tidak sedang memilih format.")
+                await telegram_service.edit_message_text(
+                    chat_id, message_id,
+                    "Sesi pemilihan format sudah tidak aktif. Silakan mulai lagi dengan /create-testcase."
+                )
+                return Response(status_code=200)
             logger.info(f"State disimpan ke Redis untuk chat {chat_id}: {new_state}")
-            # --- SELESAI REFACTOR ---
 
             new_text = (f"👍 Format `{chosen_format}` dipilih.\n\n")
             next_text = ("Sekarang, silakan kirimkan **deskripsi PRD** Anda.")
@@ -82,21 +151,22 @@ async def handle_telegram_webhook(
             await telegram_service.send_reply(chat_id, next_text)
         
         elif data == "action:cancel":
-            # --- REFACTOR: Hapus state dari Redis ---
-            state_service.clear_state(chat_id)
-            # --- SELESAI REFACTOR ---
+            await state_service.clear_state(chat_id)
             await telegram_service.edit_message_text(chat_id, message_id, "Tindakan dibatalkan.")
 
         return Response(status_code=200)
 
-    # --- 2: Menangani Pesan Teks (Message) ---
+    # --- 2: Menangani Upload Dokumen (PDF PRD) ---
+    if update.message and update.message.document:
+        return await handle_document(update.message, job_queue, telegram_service, state_service)
+
+    # --- 3: Menangani Pesan Teks (Message) ---
     if not update.message or not update.message.text or not update.message.chat:
         logger.debug("Menerima update non-teks atau non-callback, diabaikan.")
         return Response(status_code=200)
 
     chat_id = update.message.chat.id
     user_input = update.message.text.strip()
-    session_id = str(chat_id) 
 
     logger.info(f"Pesan teks dari [Chat ID: {chat_id}]: {user_input}")
 
@@ -107,7 +177,8 @@ async def handle_telegram_webhook(
     # Karena 'state_service' sudah di-inject di sini.
 
     if command_to_run == "/start":
-        state_service.clear_state(chat_id) 
+        await state_service.clear_state(chat_id)
+        await memory_service.clear(chat_id) # Percakapan baru: follow-up tidak merujuk PRD lama
         welcome_message = "Halo! 👋 Saya adalah QA Agent Anda. Silakan pilih tindakan dari menu di bawah."
         reply_keyboard = [
             [ {"text": "🚀 Buat Test Case"} ], 
@@ -118,26 +189,32 @@ async def handle_telegram_webhook(
         return Response(status_code=200)
 
     if command_to_run == "/help":
-        state_service.clear_state(chat_id)
+        await state_service.clear_state(chat_id)
         help_text = """
 Berikut perintah yang tersedia:
 /start - Memulai bot.
 /help - Menampilkan bantuan ini.
 /create-testcase - Memulai proses pembuatan test case.
+/regenerate - Membuat test case baru tanpa memakai hasil sebelumnya.
 /cancel - Membatalkan tindakan saat ini.
+
+Setelah test case dibuat, kirim pesan biasa (misal "tambahkan negative case") untuk melanjutkannya.
 """
         await telegram_service.send_reply(chat_id, help_text)
         return Response(status_code=200)
 
     if command_to_run == "/cancel":
-        state_service.clear_state(chat_id)
+        await state_service.clear_state(chat_id)
         await telegram_service.send_reply(chat_id, "Tindakan dibatalkan.")
         return Response(status_code=200)
 
-    if command_to_run == "/create-testcase":
-        # Atur state ke "WAITING_FOR_FORMAT" di Redis
+    if command_to_run in ("/create-testcase", "/regenerate"):
+        # Atur state ke "WAITING_FOR_FORMAT" di Redis.
+        # /regenerate menandai job berikutnya agar melewati cache hasil test case.
         new_state = {"state": "WAITING_FOR_FORMAT", "data": {}}
-        state_service.save_state(chat_id, new_state)
+        if command_to_run == "/regenerate":
+            new_state["data"]["force_regenerate"] = True
+        await state_service.save_state(chat_id, new_state)
         logger.info(f"State /create-testcase disimpan ke Redis untuk chat {chat_id}")
         
         message = (
@@ -156,13 +233,31 @@ Berikut perintah yang tersedia:
 
     # --- SELESAI REFACTOR HANDLER ---
 
-    # 3. Jika bukan command, cek status dari Redis
-    # --- REFACTOR: Ambil state dari Redis ---
-    current_state_data = state_service.get_state(chat_id)
+    # 3. Jika bukan command, ambil & hapus state dari Redis secara atomik.
+    # Semua cabang di bawah mengonsumsi state, jadi pesan yang datang bersamaan
+    # tidak bisa memproses state yang sama dua kali.
+    current_state_data = await state_service.pop_state(chat_id)
     logger.info(f"Mencari state di Redis untuk {chat_id}, ditemukan: {current_state_data is not None}")
-    # --- SELESAI REFACTOR ---
 
     if not current_state_data:
+        # Tanpa state aktif, pesan bebas adalah follow-up jika chat punya riwayat percakapan
+        follow_up_format = await memory_service.get_follow_up_format(chat_id)
+        if follow_up_format:
+            job = GenerateTestcaseJob(
+                chat_id=chat_id,
+                format=follow_up_format,
+                prd_text=user_input,
+                follow_up=True,
+                trace_id=trace_id_var.get()
+            )
+            try:
+                if await submit_job(job, job_queue, telegram_service, state_service, None):
+                    logger.info(f"Job follow-up {job.job_id} diantrikan untuk chat {chat_id}")
+            except Exception as e:
+                logger.error(f"Gagal mengantrikan follow-up untuk chat {chat_id}: {e}", exc_info=True)
+                await telegram_service.send_reply(chat_id, f"Maaf, terjadi error saat memproses pesan: {e}")
+            return Response(status_code=200)
+
         logger.warn(f"Menerima chat biasa (non-command) dari {chat_id}, diabaikan.")
         unknown_message = (
             "Maaf, saya tidak mengerti. 😕\n"
@@ -176,35 +271,24 @@ Berikut perintah yang tersedia:
 
     # --- STATE : Menunggu Input PRD ---
     if state_name == "WAITING_FOR_PRD":
-        logger.debug(f"Memproses PRD dari {chat_id} dengan agent.")
-        await telegram_service.send_typing_action(chat_id)
-        
-        saved_format = current_state_data.get("data", {}).get("format", "steps")
-        prd_text = user_input
-        
-        # --- REFACTOR: Hapus state dari Redis ---
-        state_service.clear_state(chat_id)
-        # --- SELESAI REFACTOR ---
-
-        prompt_input = f"""
-        Buatkan saya test case dengan format '{saved_format}' berdasarkan PRD berikut.
-
-        PRD:
-        {prd_text}
-        """
-
+        saved_data = current_state_data.get("data", {})
+        saved_format = saved_data.get("format", "steps")
+
+        # Generasi bisa memakan puluhan detik: serahkan ke worker agar
+        # webhook langsung mengembalikan 200 ke Telegram.
+        job = GenerateTestcaseJob(
+            chat_id=chat_id,
+            format=saved_format,
+            prd_text=user_input,
+            force_regenerate=saved_data.get("force_regenerate", False),
+            trace_id=trace_id_var.get()
+        )
         try:
-            response = await agent_executor.ainvoke({
-                "input": prompt_input,
-                "chat_history": []
-            })
-            output = response["output"]
-
+            if await submit_job(job, job_queue, telegram_service, state_service, current_state_data):
+                logger.info(f"Job {job.job_id} (format {saved_format}) diantrikan untuk chat {chat_id}")
         except Exception as e:
-            logger.error(f"Error dari Agent untuk session {session_id}: {e}", exc_info=True)
-            output = f"Maaf, terjadi error saat memproses PRD: {e}"
-
-        await telegram_service.send_reply(chat_id, output)
+            logger.error(f"Gagal mengantrikan job untuk chat {chat_id}: {e}", exc_info=True)
+            await telegram_service.send_reply(chat_id, f"Maaf, terjadi error saat memproses PRD: {e}")
         return Response(status_code=200)
     
     # ... (Tambahkan penanganan untuk state 'WAITING_FOR_FORMAT' jika diperlukan,
@@ -212,8 +296,92 @@ Berikut perintah yang tersedia:
 
     # Fallback jika ada state yang tidak dikenal
     logger.error(f"State tidak dikenal: {state_name} untuk chat_id {chat_id}")
-    # --- REFACTOR: Hapus state dari Redis ---
-    state_service.clear_state(chat_id)
-    # --- SELESAI REFACTOR ---
     await telegram_service.send_reply(chat_id, "Terjadi kesalahan state. Silakan coba lagi.")
-    return Response(status_code=200)
\ No newline at end of file
+    return Response(status_code=200)
+
+
+async def handle_document(
+    message: Message,
+    job_queue: BaseJobQueue,
+    telegram_service: TelegramService,
+    state_service: StateService
+):
+    """PDF dikirim saat menunggu PRD: validasi ringan lalu serahkan ke worker."""
+    chat_id = message.chat.id
+    document = message.document
+
+    current_state_data = await state_service.get_state(chat_id)
+    if not current_state_data or current_state_data.get("state") != "WAITING_FOR_PRD":
+        await telegram_service.send_reply(
+            chat_id, "Untuk memakai PDF sebagai PRD, mulai dulu dengan /create-testcase lalu pilih format."
+        )
+        return Response(status_code=200)
+
+    # --- Admission control: tolak sebelum mengunduh apa pun ---
+    is_pdf = document.mime_type == "application/pdf" or (document.file_name or "").lower().endswith(".pdf")
+    if not is_pdf:
+        await telegram_service.send_reply(chat_id, "Maaf, saat ini hanya file PDF yang didukung.")
+        return Response(status_code=200)
+    if document.file_size and document.file_size > settings.pdf_max_bytes:
+        max_mb = settings.pdf_max_bytes // (1024 * 1024)
+        await telegram_service.send_reply(chat_id, f"Maaf, ukuran PDF maksimal {max_mb} MB.")
+        return Response(status_code=200)
+
+    # Konsumsi state secara atomik; jika sudah dipakai pesan lain, abaikan
+    current_state_data = await state_service.pop_state(chat_id)
+    if not current_state_data or current_state_data.get("state") != "WAITING_FOR_PRD":
+        return Response(status_code=200)
+
+    saved_data = current_state_data.get("data", {})
+    job = GenerateTestcaseJob(
+        chat_id=chat_id,
+        format=saved_data.get("format", "steps"),
+        file_id=document.file_id,
+        file_unique_id=document.file_unique_id,
+        force_regenerate=saved_data.get("force_regenerate", False),
+        trace_id=trace_id_var.get()
+    )
+    try:
+        if await submit_job(job, job_queue, telegram_service, state_service, current_state_data):
+            logger.info(f"Job PDF {job.job_id} ({document.file_name}) diantrikan untuk chat {chat_id}")
+            await telegram_service.send_reply(chat_id, "📄 PDF diterima, sedang diproses...")
+    except Exception as e:
+        logger.error(f"Gagal mengantrikan job PDF untuk chat {chat_id}: {e}", exc_info=True)
+        await telegram_service.send_reply(chat_id, f"Maaf, terjadi error saat memproses PDF: {e}")
+    return Response(status_code=200)
+
+
+async def submit_job(
+    job: GenerateTestcaseJob,
+    job_queue: BaseJobQueue,
+    telegram_service: TelegramService,
+    state_service: StateService,
+    state_data: Optional[Dict[str, Any]]
+) -> bool:
+    """
+    Mengantrikan job dengan admission control. Jika ditolak, pengguna langsung
+    diberi tahu dan state (jika ada) dikembalikan agar PRD cukup dikirim ulang.
+    """
+    try:
+        position = await job_queue.enqueue(job)
+    except JobRejectedError as e:
+        logger.warning(f"Job untuk chat {job.chat_id} ditolak: {e}")
+        if state_data:
+            await state_service.save_state(job.chat_id, state_data)
+        subject = "pesan" if job.follow_up else "PRD"
+        if e.reason == "chat_quota":
+            text = (f"⏳ Anda masih punya {e.pending} PRD dalam antrian. "
+                    f"Tunggu hasilnya, lalu kirim {subject} ini lagi.")
+        else:
+            text = (f"⏳ Server sedang sibuk, antrian penuh ({e.pending} PRD). "
+                    f"Silakan kirim {subject} ini lagi beberapa saat lagi.")
+        await telegram_service.send_reply(job.chat_id, text)
+        return False
+
+    # Posisi = job yang diproses + job siap di depannya + antrian chat ini sendiri (lihat BaseJobQueue._position).
+    # Di atas jumlah worker berarti harus menunggu: beri tahu agar pengguna tidak menunggu tanpa kabar
+    if position > settings.job_worker_concurrency:
+        await telegram_service.send_reply(
+            job.chat_id, f"⏳ Server sedang ramai, PRD Anda di antrian #{position}. Hasil akan dikirim otomatis."
+        )
+    return True
@@ -1,50 +1,141 @@
 # telegram_service.py
 import httpx
+import time
 import logging
+import importlib.util
+from fastapi import Request
 from config import settings
-from typing import Dict, Any, Optional # <<< BARU: Untuk type hinting
+from observability import DELIVERY_SENT, STAGE_DURATION
+from telegram_delivery import (
+    TELEGRAM_MAX_MESSAGE_LENGTH, OutboundScheduler, get_outbound_scheduler, split_message, split_point
+)
+from typing import Awaitable, Callable, Dict, Any, List, Optional # <<< BARU: Untuk type hinting
 
 logger = logging.getLogger(__name__)
 
 class TelegramService:
-    def __init__(self, http_client: httpx.AsyncClient):
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        api_url: Optional[str] = None,
+        scheduler: Optional[OutboundScheduler] = None,
+        wait_for_delivery: bool = True
+    ):
         self.http_client = http_client
-        self.api_url = settings.telegram_api_url
+        self.api_url = api_url or settings.telegram_api_url
+        # File diunduh dari https://api.telegram.org/file/bot<token>/<file_path>
+        self.file_url = self.api_url.replace("/bot", "/file/bot", 1)
+        # Satu penjadwal per proses: batas kirim Telegram berlaku per bot, bukan per service.
+        # None jika DELIVERY_ENABLED=false: kiriman langsung tanpa limiter.
+        self.scheduler = scheduler or get_outbound_scheduler()
+        # False untuk handler update (webhook/polling): balasan hanya dimasukkan ke antrian kirim
+        # dan handler langsung kembali; True untuk worker yang butuh message_id (streaming)
+        self.wait_for_delivery = wait_for_delivery
 
-    async def send_reply(
-        self, 
-        chat_id: int, 
-        text: str, 
-        reply_markup: Optional[Dict[str, Any]] = None # <<< BARU: Tambah parameter
-    ):
-        """Mengirim balasan teks ke pengguna, bisa dengan keyboard."""
-        
-        # --- LOGIKA BARU ---
+    async def _post(
+        self,
+        method: str,
+        json_payload: Dict[str, Any],
+        timeout: Optional[float] = None,
+        files: Optional[Dict[str, Any]] = None
+    ) -> httpx.Response:
+        """Memanggil method Bot API dan mencatat durasinya (metrik tahap 'telegram')."""
+        # timeout=None berarti memakai timeout default client (bukan tanpa batas)
+        extra = {"timeout": timeout} if timeout is not None else {}
+        # Upload file memakai multipart: field lain dikirim sebagai form data
+        body = {"data": json_payload, "files": files} if files else {"json": json_payload}
+        with STAGE_DURATION.time(stage="telegram", op=method):
+            return await self.http_client.post(f"{self.api_url}/{method}", **body, **extra)
+
+    async def _deliver(self, chat_id: int, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Satu balasan utuh (semua potongannya) ke antrian kirim chat jika penjadwal aktif.
+        Mengembalikan hasil `send`, atau None tanpa menunggu jika `wait_for_delivery` False.
+        """
+        if not self.scheduler:
+            return await send()
+        future = self.scheduler.submit(chat_id, send)
+        return await future if self.wait_for_delivery else None
+
+    async def _send(
+        self, chat_id: int, method: str, json_payload: Dict[str, Any], files: Optional[Dict[str, Any]] = None
+    ) -> httpx.Response:
+        """Satu panggilan ke chat: lewat rate limiter & penanganan 429 jika penjadwal aktif."""
+        if not self.scheduler:
+            return await self._post(method, json_payload, files=files)
+        return await self.scheduler.deliver(chat_id, method, lambda: self._post(method, json_payload, files=files))
+
+    async def _send_message(
+        self, chat_id: int, text: str, reply_markup: Optional[Dict[str, Any]] = None
+    ) -> Optional[int]:
         json_payload = {"chat_id": chat_id, "text": text}
         if reply_markup:
             json_payload["reply_markup"] = reply_markup
-        # --- AKHIR LOGIKA BARU ---
-
         try:
-            response = await self.http_client.post(
-                f"{self.api_url}/sendMessage",
-                json=json_payload # <<< BARU: Gunakan payload yang sudah disusun
-            )
+            response = await self._send(chat_id, "sendMessage", json_payload)
             response.raise_for_status()
             logger.info(f"Balasan terkirim ke Chat ID: {chat_id}")
+            return response.json().get("result", {}).get("message_id")
         except httpx.HTTPStatusError as e:
             logger.error(f"Error HTTP saat mengirim balasan ke {chat_id}: {e.response.status_code} - {e.response.text}")
         except Exception as e:
             logger.error(f"Error tak terduga saat mengirim balasan ke {chat_id}: {e}")
+        return None
+
+    async def send_reply(
+        self, 
+        chat_id: int, 
+        text: str, 
+        reply_markup: Optional[Dict[str, Any]] = None # <<< BARU: Tambah parameter
+    ) -> Optional[int]:
+        """
+        Mengirim balasan teks ke pengguna, bisa dengan keyboard. Mengembalikan message_id (pesan terakhir).
+        Teks di atas 4096 karakter dipecah per test case; keyboard dipasang di potongan terakhir.
+        """
+        return await self._deliver(chat_id, lambda: self._send_parts(chat_id, text, reply_markup))
+
+    async def _send_parts(
+        self, chat_id: int, text: str, reply_markup: Optional[Dict[str, Any]] = None
+    ) -> Optional[int]:
+        parts = split_message(text)
+        DELIVERY_SENT.inc(kind="message" if len(parts) == 1 else "split")
+        message_id = None
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            message_id = await self._send_message(chat_id, part, reply_markup if last else None)
+        return message_id
+
+    async def send_testcases(self, chat_id: int, text: str, format: str) -> Optional[int]:
+        """
+        Mengirim hasil test case: dipecah per test case jika panjang, atau satu file
+        (.feature / .md) lewat sendDocument jika akan menjadi `delivery_document_min_parts` pesan atau lebih.
+        """
+        return await self._deliver(chat_id, lambda: self._send_testcases(chat_id, text, format))
+
+    async def _send_testcases(self, chat_id: int, text: str, format: str) -> Optional[int]:
+        parts = split_message(text)
+        if len(parts) < settings.delivery_document_min_parts:
+            return await self._send_parts(chat_id, text)
+
+        is_bdd = format.lower() == "bdd"
+        filename = "testcase.feature" if is_bdd else "testcase.md"
+        caption = f"📎 Hasil test case terlalu panjang untuk {len(parts)} pesan, dikirim sebagai file {filename}."
+        files = {"document": (filename, text.encode("utf-8"), "text/plain" if is_bdd else "text/markdown")}
+        try:
+            response = await self._send(chat_id, "sendDocument", {"chat_id": str(chat_id), "caption": caption}, files)
+            response.raise_for_status()
+            DELIVERY_SENT.inc(kind="document")
+            logger.info(f"Hasil test case terkirim sebagai file ke Chat ID: {chat_id}")
+            return response.json().get("result", {}).get("message_id")
+        except Exception as e:
+            logger.error(f"Gagal mengirim file ke {chat_id}, dikirim sebagai pesan: {e}")
+        return await self._send_parts(chat_id, text)
 
     # <<< FUNGSI BARU UNTUK JAWAB CALLBACK (MENGHILANGKAN LOADING) >>>
     async def answer_callback_query(self, callback_query_id: str):
         """Memberi tahu Telegram bahwa callback telah diterima."""
         try:
-            await self.http_client.post(
-                f"{self.api_url}/answerCallbackQuery",
-                json={"callback_query_id": callback_query_id}
-            )
+            await self._post("answerCallbackQuery", {"callback_query_id": callback_query_id})
         except Exception as e:
             logger.warning(f"Gagal menjawab callback query {callback_query_id}: {e}")
 
@@ -65,26 +156,170 @@ class TelegramService:
         if reply_markup:
             json_payload["reply_markup"] = reply_markup
 
-        try:
-            response = await self.http_client.post(
-                f"{self.api_url}/editMessageText",
-                json=json_payload
-            )
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f"Gagal mengedit pesan {message_id} di chat {chat_id}: {e}")
+        async def edit():
+            try:
+                response = await self._send(chat_id, "editMessageText", json_payload)
+                response.raise_for_status()
+            except Exception as e:
+                logger.error(f"Gagal mengedit pesan {message_id} di chat {chat_id}: {e}")
+
+        await self._deliver(chat_id, edit)
 
     async def send_typing_action(self, chat_id: int):
-        """Mengirim aksi 'sedang mengetik'."""
+        """Mengirim aksi 'sedang mengetik' (digabung & best-effort jika penjadwal aktif)."""
+        if self.scheduler and not self.scheduler.should_send_typing(chat_id):
+            return
         try:
-            await self.http_client.post(
-                f"{self.api_url}/sendChatAction",
-                json={"chat_id": chat_id, "action": "typing"}
-            )
+            await self._post("sendChatAction", {"chat_id": chat_id, "action": "typing"})
         except Exception as e:
             logger.warning(f"Gagal mengirim typing action ke {chat_id}: {e}")
 
-# Dependency function (Tidak berubah)
-async def get_telegram_service():
-    async with httpx.AsyncClient() as client:
-        yield TelegramService(client)
\ No newline at end of file
+    async def download_file(self, file_id: str, max_bytes: int) -> Optional[bytes]:
+        """Mengunduh file (getFile lalu stream download). None jika gagal atau melebihi max_bytes."""
+        try:
+            response = await self._post("getFile", {"file_id": file_id})
+            response.raise_for_status()
+            file_info = response.json().get("result", {})
+            if file_info.get("file_size", 0) > max_bytes:
+                logger.warning(f"File {file_id} terlalu besar: {file_info.get('file_size')} bytes")
+                return None
+
+            buffer = bytearray()
+            async with self.http_client.stream("GET", f"{self.file_url}/{file_info['file_path']}") as stream:
+                stream.raise_for_status()
+                async for chunk in stream.aiter_bytes():
+                    buffer.extend(chunk)
+                    if len(buffer) > max_bytes:
+                        logger.warning(f"Unduhan file {file_id} melebihi {max_bytes} bytes, dihentikan.")
+                        return None
+            return bytes(buffer)
+        except Exception as e:
+            logger.error(f"Gagal mengunduh file {file_id}: {e}")
+            return None
+
+    # --- Long Polling ---
+    async def get_updates(self, offset: Optional[int], limit: int, timeout: int) -> List[Dict[str, Any]]:
+        """
+        getUpdates dengan long polling: menunggu hingga `timeout` detik jika belum ada update.
+        Update dengan update_id < offset dianggap sudah dikonfirmasi oleh Telegram.
+        Error dilempar agar runner bisa backoff.
+        """
+        json_payload: Dict[str, Any] = {
+            "limit": limit,
+            "timeout": timeout,
+            "allowed_updates": ["message", "callback_query"]
+        }
+        if offset is not None:
+            json_payload["offset"] = offset
+        # Read timeout harus lebih panjang dari waktu long poll di sisi Telegram
+        response = await self._post("getUpdates", json_payload, timeout=timeout + settings.telegram_read_timeout)
+        response.raise_for_status()
+        body = response.json()
+        if not body.get("ok"):
+            raise Exception(f"getUpdates gagal: {body.get('description')}")
+        return body.get("result", [])
+
+    async def delete_webhook(self):
+        """Menonaktifkan webhook; selama webhook aktif Telegram menolak getUpdates (409)."""
+        response = await self._post("deleteWebhook", {"drop_pending_updates": False})
+        response.raise_for_status()
+
+# --- Balasan Bertahap (Streaming) ---
+class ProgressiveMessage:
+    """
+    Menampilkan teks yang sedang di-stream sebagai satu pesan yang diedit di tempat.
+    Edit digabung & dibatasi minimal `min_interval` detik (batas edit per chat Telegram),
+    dan pindah ke pesan baru saat teks melewati batas 4096 karakter.
+    """
+
+    def __init__(
+        self,
+        telegram_service: TelegramService,
+        chat_id: int,
+        min_interval: float,
+        max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH
+    ):
+        self.telegram_service = telegram_service
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.max_length = max_length
+        self.buffer = "" # Teks untuk pesan yang sedang aktif
+        self.message_id: Optional[int] = None
+        self.sent_text = ""
+        self.last_push = 0.0
+        self.started_at = time.monotonic()
+        self.first_content_at: Optional[float] = None
+
+    @property
+    def time_to_first_content(self) -> Optional[float]:
+        if self.first_content_at is None:
+            return None
+        return self.first_content_at - self.started_at
+
+    async def append(self, text: str):
+        """Menambah potongan teks; pesan diperbarui jika jeda minimal sudah lewat."""
+        self.buffer += text
+        while len(self.buffer) > self.max_length:
+            cut = split_point(self.buffer, self.max_length)
+            await self._push(self.buffer[:cut]) # Finalkan pesan saat ini
+            self.buffer = self.buffer[cut:].lstrip()
+            self.message_id = None
+            self.sent_text = ""
+
+        if time.monotonic() - self.last_push >= self.min_interval:
+            await self._push(self.buffer)
+
+    async def finish(self):
+        """Mengirim sisa teks yang belum tampil."""
+        await self._push(self.buffer)
+
+    async def _push(self, text: str):
+        if not text.strip() or text == self.sent_text:
+            return
+        if self.message_id is None:
+            message_id = await self.telegram_service.send_reply(self.chat_id, text)
+            if message_id is None:
+                # Gagal terkirim: belum ada yang tampil di chat jika ini pesan pertama,
+                # jadi job boleh di-retry; setelahnya pesan baru dicoba lagi di push berikutnya
+                if self.first_content_at is None:
+                    raise Exception(f"Gagal mengirim pesan streaming pertama ke chat {self.chat_id}.")
+                return
+            self.message_id = message_id
+            if self.first_content_at is None:
+                self.first_content_at = time.monotonic()
+        else:
+            await self.telegram_service.edit_message_text(self.chat_id, self.message_id, text)
+        self.sent_text = text
+        self.last_push = time.monotonic()
+
+# --- HTTP Client Bersama ---
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Membuat AsyncClient ber-pool untuk Bot API.
+    Dibuat sekali oleh lifespan di main.py sehingga koneksi TCP/TLS
+    ke api.telegram.org dipakai ulang antar update.
+    """
+    limits = httpx.Limits(
+        max_connections=settings.telegram_max_connections,
+        max_keepalive_connections=settings.telegram_max_keepalive_connections,
+        keepalive_expiry=settings.telegram_keepalive_expiry
+    )
+    timeout = httpx.Timeout(
+        connect=settings.telegram_connect_timeout,
+        read=settings.telegram_read_timeout,
+        write=settings.telegram_write_timeout,
+        pool=settings.telegram_pool_timeout
+    )
+
+    http2 = settings.telegram_http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("TELEGRAM_HTTP2 aktif tapi paket 'h2' tidak terpasang, memakai HTTP/1.1.")
+        http2 = False
+
+    logger.info(f"Membuat HTTP client Telegram (http2={http2}, max_connections={settings.telegram_max_connections})")
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+# Dependency function: pakai client milik aplikasi (lihat lifespan di main.py)
+# Handler webhook tidak menunggu pengiriman: balasan diantrikan, respons 200 langsung dikirim
+def get_telegram_service(request: Request) -> TelegramService:
+    return TelegramService(request.app.state.telegram_http_client, wait_for_delivery=False)
\ No newline at end of file
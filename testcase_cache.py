@@ -0,0 +1,117 @@
+# testcase_cache.py
+import time
+import hashlib
+import logging
+import unicodedata
+from typing import Dict, Optional
+from cachetools import TTLCache
+import redis.asyncio as redis
+from config import settings
+from state_service import get_redis_pool
+from observability import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+def normalize_prd(prd_text: str) -> str:
+    """Normalisasi PRD agar perbedaan spasi/baris kosong tidak menghasilkan key berbeda."""
+    text = unicodedata.normalize("NFKC", prd_text)
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def make_cache_key(prd_text: str, format: str, model: str, prompt_version: str) -> str:
+    """Key content-addressed: hash dari PRD ternormalisasi + format + model + versi prompt."""
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, format.lower(), normalize_prd(prd_text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class TestcaseCache:
+    """
+    Cache hasil test case dua tingkat:
+    - lokal : LRU + TTL di memori proses (tanpa round trip)
+    - Redis : dibagi antar worker, dengan TTL dan batas jumlah entri (evict yang tertua)
+    """
+
+    def __init__(
+        self,
+        client: Optional[redis.Redis],
+        local_size: int,
+        ttl_seconds: int,
+        max_entries: int
+    ):
+        self.client = client
+        self.local = TTLCache(maxsize=local_size, ttl=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.prefix = "bot:tc:cache:"
+        self.index_key = f"{self.prefix}index" # sorted set: key -> waktu simpan
+        self.stats: Dict[str, int] = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _get_key(self, cache_key: str) -> str:
+        return f"{self.prefix}{cache_key}"
+
+    async def get(self, cache_key: str) -> Optional[str]:
+        """Mengambil hasil dari cache lokal lalu Redis. None jika miss."""
+        value = self.local.get(cache_key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            CACHE_LOOKUPS.inc(result="local_hit")
+            return value
+
+        if self.client:
+            try:
+                value = await self.client.get(self._get_key(cache_key))
+            except Exception as e:
+                logger.error(f"Gagal membaca cache test case dari Redis: {e}")
+                value = None
+            if value is not None:
+                self.stats["redis_hits"] += 1
+                CACHE_LOOKUPS.inc(result="redis_hit")
+                self.local[cache_key] = value
+                return value
+
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    async def set(self, cache_key: str, value: str):
+        """Menyimpan hasil ke kedua tingkat cache."""
+        self.local[cache_key] = value
+        if not self.client:
+            return
+
+        now = time.time()
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.set(self._get_key(cache_key), value, ex=self.ttl_seconds)
+                pipe.zadd(self.index_key, {cache_key: now})
+                # Buang entri index yang key-nya sudah kedaluwarsa
+                pipe.zremrangebyscore(self.index_key, "-inf", now - self.ttl_seconds)
+                pipe.zcard(self.index_key)
+                size = (await pipe.execute())[-1]
+
+            overflow = size - self.max_entries
+            if overflow > 0:
+                evicted = [key for key, _ in await self.client.zpopmin(self.index_key, overflow)]
+                if evicted:
+                    await self.client.delete(*(self._get_key(key) for key in evicted))
+                    logger.debug(f"{len(evicted)} entri cache test case di-evict.")
+        except Exception as e:
+            logger.error(f"Gagal menyimpan cache test case ke Redis: {e}")
+
+
+# --- Factory ---
+def create_testcase_cache() -> Optional[TestcaseCache]:
+    """Membuat cache sesuai konfigurasi; None jika dinonaktifkan."""
+    if not settings.testcase_cache_enabled:
+        return None
+    redis_pool = get_redis_pool()
+    client = redis.Redis(connection_pool=redis_pool) if redis_pool else None
+    return TestcaseCache(
+        client,
+        settings.testcase_cache_local_size,
+        settings.testcase_cache_ttl,
+        settings.testcase_cache_max_entries
+    )
\ No newline at end of file
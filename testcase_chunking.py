@@ -0,0 +1,111 @@
+# testcase_chunking.py
+import re
+import logging
+from dataclasses import dataclass
+from typing import List, Tuple
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from config import settings
+from token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Heading markdown yang dipakai sebagai batas bagian PRD
+HEADERS_TO_SPLIT_ON = [("#", "h1"), ("##", "h2"), ("###", "h3")]
+
+# Awal satu test case / skenario pada output model
+CASE_START_PATTERN = re.compile(
+    r"^\s*(?:#{1,6}\s*|\*\*|\d+[.)]\s*)?(?:Scenario(?: Outline)?:|Skenario\b|Test ?Case\b|TC[-_ ]?\d+)",
+    re.IGNORECASE | re.MULTILINE
+)
+HEADING_PATTERN = re.compile(r"^#{1,3}\s+\S", re.MULTILINE)
+CASE_NUMBER_PATTERN = re.compile(r"(test ?case|tc)[-_ ]?\d+[:.)]?|^\d+[.)]|[*#:]", re.IGNORECASE)
+# Akhiran judul potongan token dari satu bagian, mis. "Login (2/3)"
+PIECE_SUFFIX_PATTERN = re.compile(r" \(\d+/\d+\)$")
+
+
+@dataclass
+class PrdSection:
+    title: str
+    text: str
+
+
+def should_chunk(prd_text: str) -> bool:
+    """PRD dianggap besar jika melewati ambang token untuk mode chunked."""
+    return count_tokens(prd_text) > settings.chunk_threshold_tokens
+
+def has_sections(prd_text: str) -> bool:
+    """PRD punya beberapa bagian (minimal dua heading markdown) atau cukup besar untuk dipecah."""
+    return len(HEADING_PATTERN.findall(prd_text)) >= 2 or should_chunk(prd_text)
+
+def split_prd(prd_text: str) -> List[PrdSection]:
+    """
+    Memecah PRD per heading markdown, lalu memecah lagi bagian yang
+    melebihi `chunk_max_tokens` berdasarkan anggaran token.
+    """
+    header_splitter = MarkdownHeaderTextSplitter(HEADERS_TO_SPLIT_ON, strip_headers=False)
+    token_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.chunk_max_tokens,
+        chunk_overlap=settings.chunk_overlap_tokens,
+        length_function=count_tokens
+    )
+
+    sections = []
+    for doc in header_splitter.split_text(prd_text):
+        title = " > ".join(doc.metadata[key] for _, key in HEADERS_TO_SPLIT_ON if key in doc.metadata) or "Umum"
+        pieces = token_splitter.split_text(doc.page_content)
+        for index, piece in enumerate(pieces, start=1):
+            piece_title = title if len(pieces) == 1 else f"{title} ({index}/{len(pieces)})"
+            sections.append(PrdSection(piece_title, piece))
+
+    logger.info(f"PRD dipecah menjadi {len(sections)} bagian.")
+    return sections
+
+def section_heading(title: str) -> str:
+    """Judul bagian asal dari judul potongan (tanpa akhiran "(i/n)")."""
+    return PIECE_SUFFIX_PATTERN.sub("", title)
+
+def _split_cases(output: str) -> Tuple[str, List[str]]:
+    """Memisahkan output model menjadi pembuka dan daftar blok test case."""
+    starts = [match.start() for match in CASE_START_PATTERN.finditer(output)]
+    if not starts:
+        return output.strip(), []
+    preamble = output[:starts[0]].strip()
+    blocks = [output[start:end].strip() for start, end in zip(starts, starts[1:] + [len(output)])]
+    return preamble, blocks
+
+def _case_key(block: str) -> str:
+    """Key de-duplikasi: judul test case tanpa penomoran, huruf kecil, spasi dirapikan."""
+    title = block.splitlines()[0]
+    return " ".join(CASE_NUMBER_PATTERN.sub(" ", title).lower().split())
+
+def merge_section_results(results: List[Tuple[PrdSection, str]]) -> str:
+    """
+    Menggabungkan hasil per bagian menjadi satu suite dan membuang test case duplikat.
+    Dedup hanya antar potongan token dari bagian yang sama (overlap potongan menghasilkan
+    test case kembar); judul sama di bagian berbeda tetap dipertahankan.
+    """
+    seen = set()
+    heading = None
+    merged = []
+    duplicates = 0
+    for section, output in results:
+        if section_heading(section.title) != heading:
+            heading = section_heading(section.title)
+            seen = set()
+        preamble, blocks = _split_cases(output)
+        kept = []
+        for block in blocks:
+            key = _case_key(block)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            kept.append(block)
+
+        if not blocks and preamble:
+            kept = [preamble] # Output tanpa struktur yang dikenali: simpan apa adanya
+        if kept:
+            merged.append(f"## {section.title}\n\n" + "\n\n".join(kept))
+
+    logger.info(f"Hasil {len(results)} bagian digabung, {duplicates} test case duplikat dibuang.")
+    return "\n\n".join(merged)
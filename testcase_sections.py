@@ -0,0 +1,175 @@
+# testcase_sections.py
+import hashlib
+import logging
+from typing import Dict, List, Optional, Type
+from cachetools import TTLCache
+from pydantic import BaseModel, Field
+import redis.asyncio as redis
+from config import settings
+from state_service import get_redis_pool
+from testcase_cache import normalize_prd
+from testcase_chunking import PrdSection, section_heading
+from observability import SECTION_RESULTS
+
+logger = logging.getLogger(__name__)
+
+# --- Skema Output Terstruktur ---
+# Dipakai sebagai schema `with_structured_output`: deskripsi field ikut dikirim ke model.
+class TestCase(BaseModel):
+    """Satu test case format langkah."""
+    title: str = Field(description="Nama singkat test case")
+    description: str = Field("", description="Tujuan test case")
+    preconditions: List[str] = Field(default_factory=list, description="Kondisi awal yang harus terpenuhi")
+    steps: List[str] = Field(description="Langkah pengujian berurutan")
+    expected_result: str = Field(description="Hasil yang diharapkan")
+
+class SectionTestCases(BaseModel):
+    """Test case untuk satu bagian PRD."""
+    test_cases: List[TestCase]
+
+class GherkinScenario(BaseModel):
+    """Satu skenario Gherkin."""
+    name: str = Field(description="Nama skenario")
+    given: List[str] = Field(description="Langkah Given (kondisi awal)")
+    when: List[str] = Field(description="Langkah When (aksi)")
+    then: List[str] = Field(description="Langkah Then (hasil)")
+
+class SectionScenarios(BaseModel):
+    """Skenario BDD untuk satu bagian PRD."""
+    scenarios: List[GherkinScenario]
+
+def get_section_schema(format: str) -> Type[BaseModel]:
+    return SectionScenarios if format.lower() == "bdd" else SectionTestCases
+
+
+class SectionResult(BaseModel):
+    """Hasil satu bagian PRD, tertaut ke bagian asal lewat judul & hash isinya."""
+    section: str
+    section_hash: str
+    test_cases: List[TestCase] = Field(default_factory=list)
+    scenarios: List[GherkinScenario] = Field(default_factory=list)
+
+    @classmethod
+    def from_output(cls, section: PrdSection, section_hash: str, output: BaseModel) -> "SectionResult":
+        return cls(section=section.title, section_hash=section_hash, **output.model_dump())
+
+
+def make_section_hash(section: PrdSection, format: str, model: str, prompt_version: str) -> str:
+    """Hash isi bagian (judul + teks ternormalisasi) + format + model + versi prompt."""
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, format.lower(), normalize_prd(section.title), normalize_prd(section.text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+# --- Render & Gabung ---
+def _title_key(title: str) -> str:
+    return " ".join(title.lower().split())
+
+def render_section_results(results: List[SectionResult], format: str) -> str:
+    """
+    Menggabungkan hasil per bagian menjadi satu suite teks (urutan bagian PRD).
+    Penomoran dibuat saat render sehingga hasil bagian yang dipakai ulang tetap berurutan;
+    judul kembar hanya di-dedup di dalam satu bagian (termasuk potongan tokennya): judul
+    generik ("Input kosong") yang sama di bagian berbeda menguji hal berbeda sehingga tetap ditampilkan.
+    """
+    is_bdd = format.lower() == "bdd"
+    blocks = ["Feature: Test case dari PRD"] if is_bdd else []
+    number = 0
+    seen = set()
+    heading = None
+    for result in results:
+        items = []
+        if section_heading(result.section) != heading:
+            heading = section_heading(result.section)
+            seen = set()
+        for case in (result.scenarios if is_bdd else result.test_cases):
+            key = _title_key(case.name if is_bdd else case.title)
+            if key in seen:
+                continue
+            seen.add(key)
+            number += 1
+            if is_bdd:
+                lines = [f"  Scenario: {case.name}"]
+                for keyword, steps in (("Given", case.given), ("When", case.when), ("Then", case.then)):
+                    lines.extend(f"    {keyword if i == 0 else 'And'} {step}" for i, step in enumerate(steps))
+            else:
+                lines = [f"Test Case {number}: {case.title}"]
+                if case.description:
+                    lines.append(f"Deskripsi: {case.description}")
+                if case.preconditions:
+                    lines.append("Prekondisi: " + "; ".join(case.preconditions))
+                lines.append("Langkah:")
+                lines.extend(f"{i}. {step}" for i, step in enumerate(case.steps, start=1))
+                lines.append(f"Hasil yang diharapkan: {case.expected_result}")
+            items.append("\n".join(lines))
+        if items:
+            blocks.append(f"## {result.section}\n\n" + "\n\n".join(items))
+    return "\n\n".join(blocks)
+
+
+# --- Penyimpanan Hasil per Bagian ---
+class SectionResultStore:
+    """
+    Hasil terstruktur per hash bagian PRD, dua tingkat seperti cache hasil test case:
+    - lokal : TTL cache di memori proses
+    - Redis : `bot:tc:section:{hash}`, dibaca sekaligus (MGET) untuk semua bagian PRD
+    PRD yang diperbarui hanya mengirim bagian yang hash-nya belum ada ke model.
+    """
+
+    def __init__(self, client: Optional[redis.Redis], local_size: int, ttl_seconds: int):
+        self.client = client
+        self.local = TTLCache(maxsize=local_size, ttl=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = "bot:tc:section:"
+
+    def _get_key(self, section_hash: str) -> str:
+        return f"{self.prefix}{section_hash}"
+
+    async def get_many(self, section_hashes: List[str]) -> Dict[str, SectionResult]:
+        """Hasil yang tersimpan untuk hash-hash bagian; yang tidak ada tidak dikembalikan."""
+        found = {h: self.local[h] for h in section_hashes if h in self.local}
+        missing = [h for h in dict.fromkeys(section_hashes) if h not in found]
+        if self.client and missing:
+            try:
+                values = await self.client.mget([self._get_key(h) for h in missing])
+            except Exception as e:
+                logger.error(f"Gagal membaca hasil bagian PRD dari Redis: {e}")
+                values = [None] * len(missing)
+            for section_hash, value in zip(missing, values):
+                if value is not None:
+                    found[section_hash] = self.local[section_hash] = SectionResult.model_validate_json(value)
+        return found
+
+    async def set_many(self, results: List[SectionResult]):
+        for result in results:
+            self.local[result.section_hash] = result
+        if not self.client or not results:
+            return
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for result in results:
+                    pipe.set(self._get_key(result.section_hash), result.model_dump_json(), ex=self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Gagal menyimpan hasil bagian PRD ke Redis: {e}")
+
+
+def record_section_usage(reused: int, generated: int):
+    SECTION_RESULTS.inc(reused, result="reused")
+    SECTION_RESULTS.inc(generated, result="generated")
+    logger.info(f"Bagian PRD: {reused} dipakai ulang, {generated} dibuat ulang.")
+
+
+# --- Instance Bersama ---
+_section_store: Optional[SectionResultStore] = None
+
+def get_section_store() -> SectionResultStore:
+    """Store hasil per bagian proses ini (Redis jika tersedia, selain itu hanya lokal)."""
+    global _section_store
+    if _section_store is None:
+        redis_pool = get_redis_pool()
+        client = redis.Redis(connection_pool=redis_pool) if redis_pool else None
+        _section_store = SectionResultStore(client, settings.section_cache_local_size, settings.testcase_cache_ttl)
+    return _section_store
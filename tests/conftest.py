@@ -0,0 +1,26 @@
+# tests/conftest.py
+import os
+import sys
+import pytest
+
+# Modul aplikasi ada di root repo (flat), bukan package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_redis():
+    """Factory client fakeredis; tiap test mendapat server sendiri (dibuat di dalam event loop test)."""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def redis_backend(request):
+    """
+    Parametrisasi backend untuk service dengan implementasi InMemory & Redis:
+    None untuk InMemory, factory client fakeredis untuk Redis.
+    """
+    if request.param == "memory":
+        return None
+    return request.getfixturevalue("fake_redis")
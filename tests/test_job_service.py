@@ -0,0 +1,99 @@
+# tests/test_job_service.py
+import asyncio
+from job_service import GenerateTestcaseJob, InMemoryJobQueue, RedisJobQueue
+
+VISIBILITY_TIMEOUT = 0.1
+
+
+def make_queue(redis_backend, max_attempts: int = 3):
+    """Antrian untuk backend test (dipanggil di dalam event loop test)."""
+    if redis_backend is None:
+        return InMemoryJobQueue(VISIBILITY_TIMEOUT, max_attempts)
+    return RedisJobQueue(redis_backend(), VISIBILITY_TIMEOUT, max_attempts)
+
+
+def make_job(chat_id: int, prd_text: str) -> GenerateTestcaseJob:
+    return GenerateTestcaseJob(chat_id=chat_id, prd_text=prd_text)
+
+
+def test_per_chat_fifo(redis_backend):
+    async def scenario():
+        queue = make_queue(redis_backend)
+        a1, a2, b1 = make_job(1, "a1"), make_job(1, "a2"), make_job(2, "b1")
+        # Posisi memperhitungkan antrian chat sendiri: a2 menunggu a1
+        assert [await queue.enqueue(job) for job in (a1, a2, b1)] == [1, 2, 2]
+
+        first = [await queue.reserve(0.05), await queue.reserve(0.05)]
+        assert {job.prd_text for job in first} == {"a1", "b1"}
+        assert await queue.reserve(0.05) is None # a2 tertahan sampai a1 selesai
+
+        await queue.ack(next(job for job in first if job.chat_id == 1))
+        following = await queue.reserve(0.05)
+        assert following is not None and following.prd_text == "a2"
+
+    asyncio.run(scenario())
+
+
+def test_visibility_timeout_requeues(redis_backend):
+    async def scenario():
+        queue = make_queue(redis_backend)
+        job = make_job(1, "a1")
+        await queue.enqueue(job)
+        reserved = await queue.reserve(0.05)
+        assert reserved.attempts == 1
+
+        assert await queue.requeue_expired() == 0 # Belum lewat visibility timeout
+        await asyncio.sleep(VISIBILITY_TIMEOUT * 1.5)
+        assert await queue.requeue_expired() == 1
+
+        again = await queue.reserve(0.05)
+        assert again.job_id == job.job_id
+        assert again.attempts == 2
+
+    asyncio.run(scenario())
+
+
+def test_late_ack_after_requeue_is_ignored(redis_backend):
+    async def scenario():
+        queue = make_queue(redis_backend)
+        a1, a2 = make_job(1, "a1"), make_job(1, "a2")
+        await queue.enqueue(a1)
+        await queue.enqueue(a2)
+        stale = await queue.reserve(0.05)
+        await asyncio.sleep(VISIBILITY_TIMEOUT * 1.5)
+        await queue.requeue_expired()
+        current = await queue.reserve(0.05)
+        assert current.job_id == stale.job_id
+
+        # Worker lama selesai terlambat: ack/retry-nya tidak boleh melepas reservasi worker baru
+        await queue.ack(stale)
+        assert await queue.retry(stale)
+        assert await queue.size() == 2
+        assert await queue.reserve(0.05) is None # a2 masih menunggu a1
+
+        await queue.ack(current)
+        assert await queue.size() == 1
+        following = await queue.reserve(0.05)
+        assert following is not None and following.prd_text == "a2"
+
+    asyncio.run(scenario())
+
+
+def test_dead_letter_after_max_attempts(redis_backend):
+    async def scenario():
+        queue = make_queue(redis_backend, max_attempts=2)
+        a1, a2 = make_job(1, "a1"), make_job(1, "a2")
+        await queue.enqueue(a1)
+        await queue.enqueue(a2)
+
+        assert await queue.retry(await queue.reserve(0.05)) # Percobaan 1: kembali ke antrian
+        last = await queue.reserve(0.05)
+        assert last.job_id == a1.job_id and last.attempts == 2
+        assert not await queue.retry(last) # Percobaan 2: dead-letter
+
+        assert [job.job_id for job in await queue.dead_letters()] == [a1.job_id]
+        assert await queue.size() == 1
+        following = await queue.reserve(0.05) # Chat tidak terkunci oleh job yang gagal
+        assert following is not None and following.prd_text == "a2"
+
+    asyncio.run(scenario())
@@ -0,0 +1,111 @@
+# tests/test_memory_service.py
+import asyncio
+from memory_service import InMemoryMemoryService, RedisMemoryService
+
+
+def make_memory(redis_backend, summarizer):
+    """Memory service untuk backend test (dipanggil di dalam event loop test)."""
+    options = dict(max_tokens=60, turn_max_tokens=40, summary_max_tokens=20, summarizer=summarizer)
+    if redis_backend is None:
+        return InMemoryMemoryService(100, 60, **options)
+    return RedisMemoryService(redis_backend(), 60, **options)
+
+
+def test_compaction_runs_in_background(redis_backend):
+    """add_exchange tidak menunggu peringkasan (panggilan LLM); ringkasan tersedia setelah task selesai."""
+    async def scenario():
+        release, completed = asyncio.Event(), asyncio.Event()
+
+        async def blocking_summarizer(previous: str, transcript: str) -> str:
+            await release.wait()
+            completed.set()
+            return "ringkasan"
+
+        memory = make_memory(redis_backend, blocking_summarizer)
+        for i in range(4):
+            # Akan macet (timeout) jika add_exchange menunggu peringkasan
+            await asyncio.wait_for(
+                memory.add_exchange(1, f"permintaan {i} " + "kata " * 20, f"jawaban {i} " + "kata " * 20, "steps"), 5
+            )
+        assert memory._compactions and not completed.is_set()
+
+        release.set()
+        await memory.drain(5)
+        loaded = await memory.load(1)
+        assert completed.is_set() and loaded.summary == "ringkasan"
+        assert loaded.total_tokens <= memory.max_tokens
+        assert loaded.format == "steps"
+
+    asyncio.run(scenario())
+
+
+def test_no_compaction_within_budget(redis_backend):
+    async def scenario():
+        calls = []
+
+        async def summarizer(previous: str, transcript: str) -> str:
+            calls.append(transcript)
+            return "ringkasan"
+
+        memory = make_memory(redis_backend, summarizer)
+        await memory.add_exchange(1, "halo", "hai", "bdd")
+        await memory.drain(5)
+        assert calls == []
+        assert len((await memory.load(1)).turns) == 2
+
+    asyncio.run(scenario())
+
+
+def test_clear_during_compaction_drops_fold(redis_backend):
+    """Peringkasan yang selesai setelah /start (clear) tidak boleh melipat percakapan baru."""
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def blocking_summarizer(previous: str, transcript: str) -> str:
+            started.set()
+            await release.wait()
+            return "ringkasan lama"
+
+        memory = make_memory(redis_backend, blocking_summarizer)
+        # Giliran ditulis langsung tanpa menjadwalkan peringkasan; compact() di bawah mewakili
+        # peringkasan dari proses lain yang tidak ikut dibatalkan clear
+        for i in range(4):
+            turns = [memory._make_turn("human", f"permintaan {i} " + "kata " * 20), memory._make_turn("ai", "jawaban " * 20)]
+            await memory._append(1, turns, "steps")
+        compaction = asyncio.create_task(memory.compact(1))
+        await asyncio.wait_for(started.wait(), 5)
+
+        await memory.clear(1)
+        await memory.add_exchange(1, "permintaan baru", "jawaban baru", "bdd")
+        release.set()
+        await compaction
+
+        loaded = await memory.load(1)
+        assert loaded.summary == ""
+        assert [turn.content for turn in loaded.turns] == ["permintaan baru", "jawaban baru"]
+        assert loaded.total_tokens == sum(turn.tokens for turn in loaded.turns)
+
+    asyncio.run(scenario())
+
+
+def test_clear_cancels_scheduled_compaction(redis_backend):
+    async def scenario():
+        started = asyncio.Event()
+
+        async def blocking_summarizer(previous: str, transcript: str) -> str:
+            started.set()
+            await asyncio.Event().wait()
+
+        memory = make_memory(redis_backend, blocking_summarizer)
+        for i in range(4):
+            await memory.add_exchange(1, f"permintaan {i} " + "kata " * 20, f"jawaban {i} " + "kata " * 20, "steps")
+        await asyncio.wait_for(started.wait(), 5)
+        task = memory._compactions[1]
+
+        await memory.clear(1)
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+        assert 1 not in memory._compactions
+        assert (await memory.load(1)).is_empty
+
+    asyncio.run(scenario())
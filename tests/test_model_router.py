@@ -0,0 +1,182 @@
+# tests/test_model_router.py
+import asyncio
+import pytest
+from model_router import ModelRouter, track_served_models
+
+
+def make_router(hedge_enabled: bool = False, breaker_threshold: int = 2) -> ModelRouter:
+    return ModelRouter(
+        "primary", None, {}, ["fallback"],
+        max_attempts=1,
+        timeout=5,
+        hedge_enabled=hedge_enabled,
+        hedge_percentile=50,
+        hedge_min_samples=3,
+        breaker_threshold=breaker_threshold,
+        breaker_cooldown=30,
+        stats_window=20
+    )
+
+def warm_up(router: ModelRouter, model: str, latency: float):
+    """Mengisi statistik latensi agar hedge aktif dengan delay = `latency`."""
+    for _ in range(router.hedge_min_samples):
+        router.stats_for(model).record_success(latency)
+
+async def wait_cancelled(cancelled: list, count: int):
+    """Task yang dibatalkan butuh beberapa putaran event loop untuk menjalankan handler-nya."""
+    async def until_done():
+        while len(cancelled) < count:
+            await asyncio.sleep(0)
+    await asyncio.wait_for(until_done(), 1)
+
+
+def test_failover_on_provider_error():
+    async def scenario():
+        router = make_router()
+        calls = []
+
+        async def fn(model: str) -> str:
+            calls.append(model)
+            if model == "primary":
+                raise ConnectionError("koneksi terputus")
+            return f"hasil {model}"
+
+        with track_served_models() as served:
+            result = await router.run(fn, 100, "steps")
+        assert result == "hasil fallback"
+        assert calls == ["primary", "fallback"]
+        assert served.models == ["fallback"] and served.degraded
+
+    asyncio.run(scenario())
+
+
+def test_non_provider_error_is_not_failed_over():
+    async def scenario():
+        router = make_router()
+        calls = []
+
+        async def fn(model: str) -> str:
+            calls.append(model)
+            raise ValueError("output tidak bisa di-parse")
+
+        with pytest.raises(ValueError):
+            await router.run(fn, 100, "steps")
+        assert calls == ["primary"]
+        assert router.stats_for("primary").consecutive_failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_breaker_opens_then_half_open_trial_closes_it():
+    async def scenario():
+        router = make_router(breaker_threshold=2)
+        warm_up(router, "primary", 0.01) # Riwayat sukses: error rate tetap < 50% sampai circuit terbuka
+        failing = {"primary"}
+        calls = []
+
+        async def fn(model: str) -> str:
+            calls.append(model)
+            if model in failing:
+                raise ConnectionError("koneksi terputus")
+            return model
+
+        for _ in range(2):
+            assert await router.run(fn, 100, "steps") == "fallback"
+        stats = router.stats_for("primary")
+        assert stats.is_open
+        assert router.choose(100, "steps") == ["fallback", "primary"]
+
+        # Circuit terbuka: model utama tidak dicoba lebih dulu
+        calls.clear()
+        assert await router.run(fn, 100, "steps") == "fallback"
+        assert calls == ["fallback"]
+
+        # Cooldown lewat: half-open; percobaan sukses menutup circuit
+        stats.opened_at -= router.breaker_cooldown
+        assert not stats.is_open
+        failing = {"fallback"}
+        assert await router.run(fn, 100, "steps") == "primary"
+        assert stats.opened_at is None and stats.consecutive_failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_half_open_trial_reopens_breaker():
+    router = make_router(breaker_threshold=2)
+    stats = router.stats_for("primary")
+    stats.record_failure()
+    stats.record_failure()
+    stats.opened_at -= router.breaker_cooldown
+    assert not stats.is_open
+    stats.record_failure()
+    assert stats.is_open
+
+
+def test_hedge_winner_is_used_and_loser_cancelled():
+    async def scenario():
+        router = make_router(hedge_enabled=True)
+        warm_up(router, "primary", 0.01)
+        cancelled = []
+
+        async def fn(model: str) -> str:
+            try:
+                await asyncio.sleep(1 if model == "primary" else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            return model
+
+        with track_served_models() as served:
+            assert await router.run(fn, 100, "steps") == "fallback"
+        await wait_cancelled(cancelled, 1)
+        assert cancelled == ["primary"]
+        assert served.models == ["fallback"] and served.degraded
+
+    asyncio.run(scenario())
+
+
+def test_hedge_primary_wins_and_hedge_cancelled():
+    async def scenario():
+        router = make_router(hedge_enabled=True)
+        warm_up(router, "primary", 0.01)
+        started, cancelled = [], []
+
+        async def fn(model: str) -> str:
+            started.append(model)
+            try:
+                await asyncio.sleep(0.05 if model == "primary" else 1)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            return model
+
+        with track_served_models() as served:
+            assert await router.run(fn, 100, "steps") == "primary"
+        await wait_cancelled(cancelled, 1)
+        assert started == ["primary", "fallback"]
+        assert cancelled == ["fallback"]
+        assert served.models == ["primary"] and not served.degraded
+
+    asyncio.run(scenario())
+
+
+def test_hedged_tasks_cancelled_when_caller_cancelled():
+    async def scenario():
+        router = make_router(hedge_enabled=True)
+        warm_up(router, "primary", 0.01)
+        cancelled = []
+
+        async def fn(model: str) -> str:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            return model
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(router.run(fn, 100, "steps"), 0.1)
+        await wait_cancelled(cancelled, 2)
+        assert sorted(cancelled) == ["fallback", "primary"]
+
+    asyncio.run(scenario())
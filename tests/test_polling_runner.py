@@ -0,0 +1,86 @@
+# tests/test_polling_runner.py
+import asyncio
+import httpx
+from benchmarks.fake_telegram import FAKE_TOKEN, create_fake_telegram_app, push_update, wait_confirmed
+from job_service import InMemoryJobQueue
+from memory_service import InMemoryMemoryService
+from polling_runner import PollingRunner, RedisOffsetStore
+from state_service import StateService
+from telegram_delivery import OutboundScheduler
+from telegram_service import TelegramService
+from update_dedup import UpdateDeduplicator
+
+API_URL = f"http://telegram.test/bot{FAKE_TOKEN}"
+
+
+def start_update(chat_id: int) -> dict:
+    return {"message": {"message_id": chat_id, "chat": {"id": chat_id}, "text": "/start"}}
+
+
+def create_runner(fake_app, client) -> PollingRunner:
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app))
+    scheduler = OutboundScheduler(1000, 1000, 1000, 1000, 100, 1, 0)
+    return PollingRunner(
+        TelegramService(http_client, API_URL, scheduler),
+        RedisOffsetStore(client),
+        InMemoryJobQueue(60, 3),
+        InMemoryMemoryService(100, 60, max_tokens=1000, turn_max_tokens=500, summary_max_tokens=200),
+        StateService(client),
+        UpdateDeduplicator(client, 100, 60),
+        batch_size=10,
+        poll_timeout=1,
+        concurrency=4
+    )
+
+
+def sent_messages(fake_app) -> list:
+    return [payload["chat_id"] for _, method, payload in fake_app.state.calls if method == "sendMessage"]
+
+
+def test_offset_advances_after_batch(fake_redis):
+    async def scenario():
+        client = fake_redis()
+        fake_app = create_fake_telegram_app()
+        runner = create_runner(fake_app, client)
+        ids = [await push_update(fake_app, start_update(chat_id)) for chat_id in (1, 2, 3)]
+
+        stop_event = asyncio.Event()
+        task = asyncio.create_task(runner.run(stop_event))
+        await asyncio.wait_for(wait_confirmed(fake_app, ids[-1]), 5)
+        stop_event.set()
+        await asyncio.wait_for(task, 5)
+
+        assert await runner.offset_store.get() == ids[-1] + 1
+        assert sorted(sent_messages(fake_app)) == [1, 2, 3]
+
+        # Runner baru (restart) melanjutkan dari offset tersimpan: update lama tidak diambil lagi
+        restarted = create_runner(fake_app, client)
+        calls_before = len(fake_app.state.calls)
+        next_id = await push_update(fake_app, start_update(4))
+        stop_event = asyncio.Event()
+        task = asyncio.create_task(restarted.run(stop_event))
+        await asyncio.wait_for(wait_confirmed(fake_app, next_id), 5)
+        stop_event.set()
+        await asyncio.wait_for(task, 5)
+
+        polls = [payload for _, method, payload in fake_app.state.calls[calls_before:] if method == "getUpdates"]
+        assert polls[0]["offset"] == ids[-1] + 1
+        assert sorted(sent_messages(fake_app)) == [1, 2, 3, 4]
+
+    asyncio.run(scenario())
+
+
+def test_redelivered_updates_are_processed_once(fake_redis):
+    """Runner mati sebelum offset tersimpan: batch yang sama diterima lagi dan tersaring de-duplikasi."""
+    async def scenario():
+        client = fake_redis()
+        fake_app = create_fake_telegram_app()
+        batch = [{"update_id": 10 + chat_id, **start_update(chat_id)} for chat_id in (1, 2)]
+
+        await create_runner(fake_app, client).process_batch(batch)
+        # Proses lain (cache lokal deduplicator kosong) menerima batch yang sama
+        await create_runner(fake_app, client).process_batch(batch + batch)
+
+        assert sorted(sent_messages(fake_app)) == [1, 2]
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+# tests/test_state_service.py
+import asyncio
+from state_service import StateService
+
+
+def test_transition_state_single_winner(fake_redis):
+    """Dua klik bersamaan pada tombol format: hanya satu transisi yang berhasil."""
+    async def scenario():
+        service = StateService(fake_redis())
+        await service.save_state(1, {"state": "WAITING_FOR_FORMAT", "data": {"source": "menu"}})
+        results = await asyncio.gather(*(
+            service.transition_state(1, "WAITING_FOR_FORMAT", "WAITING_FOR_PRD", {"format": fmt})
+            for fmt in ("steps", "bdd")
+        ))
+        winners = [result for result in results if result is not None]
+        assert len(winners) == 1
+        current = await service.get_state(1)
+        assert current == winners[0]
+        assert current["state"] == "WAITING_FOR_PRD"
+        assert current["data"]["source"] == "menu" # Data lama digabung, bukan ditimpa
+
+    asyncio.run(scenario())
+
+
+def test_transition_state_rejects_wrong_from_state(fake_redis):
+    async def scenario():
+        service = StateService(fake_redis())
+        assert await service.transition_state(1, "WAITING_FOR_FORMAT", "WAITING_FOR_PRD") is None
+        await service.save_state(1, {"state": "WAITING_FOR_PRD", "data": {"format": "steps"}})
+        assert await service.transition_state(1, "WAITING_FOR_FORMAT", "WAITING_FOR_PRD") is None
+        assert await service.get_state(1) == {"state": "WAITING_FOR_PRD", "data": {"format": "steps"}}
+
+    asyncio.run(scenario())
+
+
+def test_pop_state_single_winner(fake_redis):
+    """PRD yang terkirim beberapa kali bersamaan hanya mengklaim state sekali."""
+    async def scenario():
+        service = StateService(fake_redis())
+        state = {"state": "WAITING_FOR_PRD", "data": {"format": "bdd"}}
+        await service.save_state(1, state)
+        results = await asyncio.gather(*(service.pop_state(1) for _ in range(5)))
+        assert [result for result in results if result is not None] == [state]
+        assert await service.get_state(1) is None
+
+    asyncio.run(scenario())
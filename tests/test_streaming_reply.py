@@ -0,0 +1,63 @@
+# tests/test_streaming_reply.py
+import asyncio
+import pytest
+import job_worker
+from job_service import GenerateTestcaseJob
+
+
+class FakeTelegramService:
+    """Mencatat kiriman; `send_results` menentukan message_id yang dikembalikan (None = gagal)."""
+
+    def __init__(self, send_results):
+        self.send_results = list(send_results)
+        self.sent = []
+        self.edits = []
+
+    async def send_reply(self, chat_id, text, reply_markup=None):
+        self.sent.append(text)
+        return self.send_results.pop(0) if self.send_results else len(self.sent)
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None):
+        self.edits.append((message_id, text))
+
+
+def fake_stream(pieces, error=None):
+    async def stream(prd_text, format):
+        for piece in pieces:
+            yield piece
+            await asyncio.sleep(0)
+        if error:
+            raise error
+    return stream
+
+
+@pytest.fixture
+def job(monkeypatch):
+    monkeypatch.setattr(job_worker.settings, "stream_edit_interval", 0)
+    return GenerateTestcaseJob(chat_id=1, prd_text="PRD", format="steps")
+
+
+def test_failed_first_send_raises_for_retry(job, monkeypatch):
+    """send_reply gagal (None): belum ada yang terkirim, jadi error naik dan job di-retry."""
+    monkeypatch.setattr(job_worker, "stream_testcase", fake_stream(["Test Case 1: login\n"], ConnectionError("putus")))
+    telegram = FakeTelegramService([None])
+    with pytest.raises(Exception):
+        asyncio.run(job_worker.stream_testcase_reply(job, telegram))
+    assert not any("terhenti" in text for text in telegram.sent) # Tidak ada pemberitahuan parsial
+
+
+def test_failure_after_delivery_is_not_retried(job, monkeypatch):
+    monkeypatch.setattr(job_worker, "stream_testcase", fake_stream(["Test Case 1: login\n"], ConnectionError("putus")))
+    telegram = FakeTelegramService([42])
+    assert asyncio.run(job_worker.stream_testcase_reply(job, telegram)) is None
+    assert telegram.sent[0] == "Test Case 1: login\n"
+    assert "terhenti" in telegram.sent[-1]
+
+
+def test_pushes_edit_one_message(job, monkeypatch):
+    monkeypatch.setattr(job_worker, "stream_testcase", fake_stream(["Test Case 1", ": login", "\nLangkah"]))
+    telegram = FakeTelegramService([42])
+    output = asyncio.run(job_worker.stream_testcase_reply(job, telegram))
+    assert output == "Test Case 1: login\nLangkah"
+    assert telegram.sent == ["Test Case 1"]
+    assert telegram.edits[-1] == (42, output)
@@ -0,0 +1,84 @@
+# tests/test_telegram_delivery.py
+import time
+import asyncio
+import httpx
+from telegram_delivery import OutboundScheduler, TokenBucket, split_message, split_point
+
+
+def make_scheduler() -> OutboundScheduler:
+    return OutboundScheduler(
+        global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000,
+        max_chats=10, max_retries=2, typing_interval=5
+    )
+
+
+# --- Pemecahan Pesan ---
+def test_split_point_prefers_testcase_boundary():
+    text = "Pembuka singkat.\n\n" + "Test Case 1: Login\nLangkah panjang " * 3 + "\nTest Case 2: Logout\nLangkah"
+    cut = split_point(text, text.index("Test Case 2") + 10)
+    assert text[cut:].startswith("Test Case 2")
+
+def test_split_point_falls_back_to_paragraph_then_hard_limit():
+    text = "a" * 60 + "\n\n" + "b" * 60
+    assert split_point(text, 100) == 60
+    assert split_point("x" * 200, 100) == 100
+
+def test_split_message_respects_limit_and_keeps_content():
+    cases = [f"Test Case {i}: Judul {i}\n" + "langkah " * 20 for i in range(1, 30)]
+    text = "\n\n".join(cases)
+    parts = split_message(text, 500)
+    assert len(parts) > 1
+    assert all(len(part) <= 500 for part in parts)
+    assert all(part.startswith("Test Case") for part in parts)
+    assert "".join(parts).replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+
+def test_split_message_short_text_is_single_part():
+    assert split_message("halo", 500) == ["halo"]
+    assert split_message("", 500) == [""]
+
+
+# --- Token Bucket ---
+def test_token_bucket_reserve_queues_callers_in_order():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    first, second = bucket.reserve(), bucket.reserve()
+    assert 0 < first < second
+    assert abs(second - first - 0.1) < 0.01
+
+def test_token_bucket_try_take_does_not_go_negative():
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.try_take()
+    assert not bucket.try_take()
+    assert bucket.tokens >= 0
+
+def test_token_bucket_pause_blocks_until_retry_after():
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.pause(3)
+    assert not bucket.try_take()
+    assert 2.9 < bucket.reserve() <= 3
+    bucket.pause(1) # Pause yang lebih pendek tidak memperpendek pause berjalan
+    assert bucket.reserve() > 2.9
+
+
+# --- 429 ---
+def test_retry_after_pauses_chat_and_global_bucket():
+    async def scenario():
+        scheduler = make_scheduler()
+        other_chat = scheduler._chat_bucket(2)
+        responses = [
+            httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 0.05}}),
+            httpx.Response(200, json={"ok": True})
+        ]
+
+        async def send() -> httpx.Response:
+            return responses.pop(0)
+
+        before = time.monotonic()
+        response = await scheduler.deliver(1, "sendMessage", send)
+        assert response.status_code == 200 and not responses
+        # Kuota global ditahan (berlaku untuk semua chat), bucket chat lain tidak disentuh
+        assert scheduler.global_bucket.blocked_until >= before + 0.05
+        assert scheduler.chat_buckets[1].blocked_until >= before + 0.05
+        assert other_chat.blocked_until == 0
+
+    asyncio.run(scenario())
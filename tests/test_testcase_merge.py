@@ -0,0 +1,39 @@
+# tests/test_testcase_merge.py
+from testcase_chunking import PrdSection, merge_section_results
+from testcase_sections import SectionResult, render_section_results
+from testcase_sections import TestCase as CaseModel # Nama "Test*" akan dikoleksi pytest
+
+
+def _free_text(*titles: str) -> str:
+    return "\n\n".join(f"Test Case {i}: {title}\nLangkah: ..." for i, title in enumerate(titles, start=1))
+
+def _structured(section: str, *titles: str) -> SectionResult:
+    return SectionResult(
+        section=section,
+        section_hash=section,
+        test_cases=[CaseModel(title=title, steps=["buka halaman"], expected_result="berhasil") for title in titles]
+    )
+
+
+def test_merge_dedups_only_within_section():
+    """Mode teks bebas: judul generik di bagian berbeda dipertahankan, kembar dari overlap potongan dibuang."""
+    merged = merge_section_results([
+        (PrdSection("Login (1/2)", ""), _free_text("Input kosong", "Password salah")),
+        (PrdSection("Login (2/2)", ""), _free_text("Password salah", "Akun terkunci")),
+        (PrdSection("Registrasi", ""), _free_text("Input kosong")),
+    ])
+    assert merged.count("Password salah") == 1
+    assert merged.count("Input kosong") == 2
+    assert "Akun terkunci" in merged
+
+
+def test_render_dedups_only_within_section():
+    """Mode terstruktur memakai aturan dedup yang sama dengan mode teks bebas."""
+    rendered = render_section_results([
+        _structured("Login (1/2)", "Input kosong", "Password salah"),
+        _structured("Login (2/2)", "Password salah", "Akun terkunci"),
+        _structured("Registrasi", "Input kosong"),
+    ], "steps")
+    assert rendered.count("Password salah") == 1
+    assert rendered.count("Input kosong") == 2
+    assert "Test Case 4: Input kosong" in rendered
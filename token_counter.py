@@ -0,0 +1,38 @@
+# token_counter.py
+import logging
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
+def get_encoding() -> Optional[tiktoken.Encoding]:
+    """
+    Encoding tiktoken untuk menghitung token (perkiraan untuk Gemini).
+    File encoding diunduh sekali saat pertama dipakai; jika gagal (misal tanpa internet),
+    penghitungan jatuh ke perkiraan berbasis jumlah karakter.
+    """
+    try:
+        return tiktoken.get_encoding(settings.tiktoken_encoding)
+    except Exception as e:
+        logger.warning(f"Encoding tiktoken '{settings.tiktoken_encoding}' tidak tersedia, memakai perkiraan: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Jumlah token teks (tiktoken, atau ~4 karakter per token sebagai cadangan)."""
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Memotong teks ke maksimal `max_tokens` token (bagian awal dipertahankan)."""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
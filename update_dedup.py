@@ -0,0 +1,72 @@
+# update_dedup.py
+import logging
+from typing import Optional
+from cachetools import TTLCache
+from fastapi import Request
+import redis.asyncio as redis
+from config import settings
+from state_service import get_redis_pool
+from observability import UPDATES_DUPLICATE
+
+logger = logging.getLogger(__name__)
+
+class UpdateDeduplicator:
+    """
+    Menandai `update_id` yang sudah diterima agar kiriman ulang Telegram
+    (saat webhook lambat/error) tidak diproses dua kali.
+    - lokal : TTL cache di memori proses, jalur cepat tanpa round trip
+    - Redis : marker `SET NX EX`, berlaku lintas worker gunicorn
+    """
+
+    def __init__(self, client: Optional[redis.Redis], local_size: int, ttl_seconds: int):
+        self.client = client
+        self.local = TTLCache(maxsize=local_size, ttl=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = "bot:update:"
+
+    def _get_key(self, update_id: int) -> str:
+        return f"{self.prefix}{update_id}"
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """Menandai update sebagai diterima. True jika sudah pernah diterima sebelumnya."""
+        if update_id in self.local:
+            UPDATES_DUPLICATE.inc(tier="local")
+            return True
+        self.local[update_id] = True
+
+        if not self.client:
+            return False
+        try:
+            claimed = await self.client.set(self._get_key(update_id), 1, nx=True, ex=self.ttl_seconds)
+        except Exception as e:
+            # Fail-open: lebih baik sesekali memproses ganda daripada menolak update
+            logger.error(f"Gagal memeriksa duplikasi update {update_id} di Redis: {e}")
+            return False
+        if not claimed:
+            UPDATES_DUPLICATE.inc(tier="redis")
+            return True
+        return False
+
+    async def release(self, update_id: int):
+        """Melepas marker agar kiriman ulang Telegram diproses lagi (dipakai jika pemrosesan gagal)."""
+        self.local.pop(update_id, None)
+        if not self.client:
+            return
+        try:
+            await self.client.delete(self._get_key(update_id))
+        except Exception as e:
+            logger.error(f"Gagal melepas marker update {update_id} di Redis: {e}")
+
+
+# --- Factory & Dependency ---
+def create_update_deduplicator() -> Optional[UpdateDeduplicator]:
+    """Membuat deduplicator sesuai konfigurasi; None jika dinonaktifkan."""
+    if not settings.update_dedup_enabled:
+        return None
+    redis_pool = get_redis_pool()
+    client = redis.Redis(connection_pool=redis_pool) if redis_pool else None
+    return UpdateDeduplicator(client, settings.update_dedup_local_size, settings.update_dedup_ttl)
+
+def get_update_deduplicator(request: Request) -> Optional[UpdateDeduplicator]:
+    """Dependency: deduplicator milik aplikasi (dibuat di lifespan main.py)."""
+    return getattr(request.app.state, "update_deduplicator", None)